@@ -0,0 +1,37 @@
+"""message links
+
+Revision ID: 002_message_links
+Revises: 001_initial_schema
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '002_message_links'
+down_revision: Union[str, None] = '001_initial_schema'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'message_links',
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('message_id', sa.BigInteger(), nullable=False),
+        sa.Column('conversation_id', sa.UUID(), nullable=False),
+        sa.Column('peer_chat_id', sa.BigInteger(), nullable=True),
+        sa.Column('peer_message_id', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chat_id', 'message_id')
+    )
+    op.create_index('ix_message_links_conversation_id', 'message_links', ['conversation_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_message_links_conversation_id', table_name='message_links')
+    op.drop_table('message_links')
@@ -0,0 +1,25 @@
+"""lock lease
+
+Revision ID: 003_lock_lease
+Revises: 002_message_links
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '003_lock_lease'
+down_revision: Union[str, None] = '002_message_links'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('locked_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'locked_until')
@@ -0,0 +1,29 @@
+"""idle sweeper index
+
+Revision ID: 004_idle_sweeper_index
+Revises: 003_lock_lease
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '004_idle_sweeper_index'
+down_revision: Union[str, None] = '003_lock_lease'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Conversations that never got a message would otherwise never look idle
+    op.execute("UPDATE conversations SET last_message_at = created_at WHERE last_message_at IS NULL")
+    op.alter_column('conversations', 'last_message_at', server_default=sa.text('now()'))
+    op.create_index('ix_conversations_status_last_message_at', 'conversations', ['status', 'last_message_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_status_last_message_at', table_name='conversations')
+    op.alter_column('conversations', 'last_message_at', server_default=None)
@@ -0,0 +1,48 @@
+"""outbox
+
+Revision ID: 005_outbox
+Revises: 004_idle_sweeper_index
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '005_outbox'
+down_revision: Union[str, None] = '004_idle_sweeper_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('idempotency_key', sa.String(length=64), nullable=False),
+        sa.Column('conversation_id', sa.UUID(), nullable=False),
+        sa.Column('kind', sa.String(length=30), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('status', sa.String(length=10), server_default='pending', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column('claimed_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.CheckConstraint("status IN ('pending', 'sending', 'sent', 'failed')", name='outbox_status_check'),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index('ix_outbox_undelivered', 'outbox', ['conversation_id', 'id'], unique=False, postgresql_where=sa.text("status IN ('pending', 'sending')"))
+    op.create_index('ix_outbox_sent_at', 'outbox', ['sent_at'], unique=False, postgresql_where=sa.text("status = 'sent'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_sent_at', table_name='outbox')
+    op.drop_index('ix_outbox_undelivered', table_name='outbox')
+    op.drop_table('outbox')
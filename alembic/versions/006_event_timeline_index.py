@@ -0,0 +1,25 @@
+"""event timeline index
+
+Revision ID: 006_event_timeline_index
+Revises: 005_outbox
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '006_event_timeline_index'
+down_revision: Union[str, None] = '005_outbox'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_conversation_events_conversation_id_created_at', 'conversation_events', ['conversation_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversation_events_conversation_id_created_at', table_name='conversation_events')
@@ -0,0 +1,57 @@
+"""conversation stats rollup
+
+Revision ID: 007_conversation_stats
+Revises: 006_event_timeline_index
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '007_conversation_stats'
+down_revision: Union[str, None] = '006_event_timeline_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('conversation_stats',
+    sa.Column('conversation_id', sa.UUID(), nullable=False),
+    sa.Column('first_customer_message_at', sa.DateTime(timezone=False), nullable=True),
+    sa.Column('first_agent_reply_at', sa.DateTime(timezone=False), nullable=True),
+    sa.Column('closed_at', sa.DateTime(timezone=False), nullable=True),
+    sa.Column('customer_messages', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('agent_messages', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('conversation_id')
+    )
+    op.create_index('ix_conversation_stats_first_customer_message_at', 'conversation_stats', ['first_customer_message_at'], unique=False)
+    op.create_index(
+        'ix_conversation_stats_waiting', 'conversation_stats', ['first_customer_message_at'], unique=False,
+        postgresql_where=sa.text("first_agent_reply_at IS NULL AND closed_at IS NULL"),
+    )
+
+    # One pass over messages for existing conversations. The close time was never stored:
+    # closed conversations get their last message time, which is what idle closes use too.
+    op.execute("""
+        INSERT INTO conversation_stats
+            (conversation_id, first_customer_message_at, first_agent_reply_at, closed_at, customer_messages, agent_messages)
+        SELECT c.id,
+               min(m.created_at) FILTER (WHERE m.sender_type = 'customer'),
+               min(m.created_at) FILTER (WHERE m.sender_type = 'agent'),
+               CASE WHEN c.status = 'closed' THEN c.last_message_at END,
+               count(m.id) FILTER (WHERE m.sender_type = 'customer'),
+               count(m.id) FILTER (WHERE m.sender_type = 'agent')
+        FROM conversations c
+        LEFT JOIN messages m ON m.conversation_id = c.id
+        GROUP BY c.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversation_stats_waiting', table_name='conversation_stats', postgresql_where=sa.text("first_agent_reply_at IS NULL AND closed_at IS NULL"))
+    op.drop_index('ix_conversation_stats_first_customer_message_at', table_name='conversation_stats')
+    op.drop_table('conversation_stats')
@@ -0,0 +1,28 @@
+"""event timeline keyset index
+
+Revision ID: 008_event_timeline_keyset
+Revises: 007_conversation_stats
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '008_event_timeline_keyset'
+down_revision: Union[str, None] = '007_conversation_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Timeline pages on (created_at, id) so events with equal timestamps aren't skipped
+    op.create_index('ix_conversation_events_timeline', 'conversation_events', ['conversation_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_conversation_events_conversation_id_created_at', table_name='conversation_events')
+
+
+def downgrade() -> None:
+    op.create_index('ix_conversation_events_conversation_id_created_at', 'conversation_events', ['conversation_id', 'created_at'], unique=False)
+    op.drop_index('ix_conversation_events_timeline', table_name='conversation_events')
@@ -0,0 +1,30 @@
+"""durable topic close backlog
+
+Revision ID: 009_topic_close_pending
+Revises: 008_event_timeline_keyset
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '009_topic_close_pending'
+down_revision: Union[str, None] = '008_event_timeline_keyset'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('topic_close_pending', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.create_index(
+        'ix_conversations_topic_close_pending', 'conversations', ['last_message_at'], unique=False,
+        postgresql_where=sa.text("topic_close_pending"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_topic_close_pending', table_name='conversations', postgresql_where=sa.text("topic_close_pending"))
+    op.drop_column('conversations', 'topic_close_pending')
@@ -0,0 +1,36 @@
+"""topic close claims
+
+Revision ID: 010_topic_close_claims
+Revises: 009_topic_close_pending
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '010_topic_close_claims'
+down_revision: Union[str, None] = '009_topic_close_pending'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('topic_close_claimed_until', sa.DateTime(timezone=False), nullable=True))
+    # Oldest first with a tiebreak on id
+    op.drop_index('ix_conversations_topic_close_pending', table_name='conversations', postgresql_where=sa.text("topic_close_pending"))
+    op.create_index(
+        'ix_conversations_topic_close_pending', 'conversations', ['last_message_at', 'id'], unique=False,
+        postgresql_where=sa.text("topic_close_pending"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_topic_close_pending', table_name='conversations', postgresql_where=sa.text("topic_close_pending"))
+    op.create_index(
+        'ix_conversations_topic_close_pending', 'conversations', ['last_message_at'], unique=False,
+        postgresql_where=sa.text("topic_close_pending"),
+    )
+    op.drop_column('conversations', 'topic_close_claimed_until')
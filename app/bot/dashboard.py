@@ -0,0 +1,125 @@
+import asyncio
+import html
+import logging
+import time
+from datetime import datetime
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.bot.ratelimit import Priority, send_priority
+from app.bot.topics import is_not_modified_error
+from app.core.config import settings
+from app.services.conversation_service import ConversationService, OpenQueueIndex, open_queue
+
+logger = logging.getLogger(__name__)
+
+TITLE = "📋 Support queue"
+
+def render_dashboard(snapshot: dict) -> str:
+    text = (
+        f"<b>{TITLE}</b>\n\n"
+        f"🟢 Waiting: <b>{snapshot['waiting']}</b>\n"
+        f"🔒 Locked: <b>{snapshot['locked']}</b>\n"
+        f"📂 Open: <b>{snapshot['open']}</b>\n"
+    )
+    if snapshot["by_agent"]:
+        text += "\n" + "\n".join(
+            f"• {html.escape(name)}: {count}" for name, count in list(snapshot["by_agent"].items())[:20]
+        ) + "\n"
+    text += f"\n<i>Updated {datetime.utcnow():%H:%M} UTC</i>"
+    return text
+
+class QueueDashboard:
+    """
+    Pinned message in the agent group showing the open/waiting/locked counts from the
+    in-memory OpenQueueIndex. Index changes only mark it dirty; a background task edits
+    the message at most once per `min_interval`, so any burst of events collapses into
+    a single edit.
+    """
+
+    def __init__(self, index: OpenQueueIndex, chat_id: int, min_interval: float = 20.0):
+        self.index = index
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.message_id: int | None = None
+        self._bot: Bot | None = None
+        self._dirty = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._last_text: str | None = None
+        self._last_publish = 0.0
+
+        self.events = 0
+        self.edits = 0
+        index.subscribe(self.mark_dirty)
+
+    def mark_dirty(self):
+        self.events += 1
+        self._dirty.set()
+
+    async def start(self, bot: Bot, session_factory: async_sessionmaker[AsyncSession]):
+        self._bot = bot
+        # One scan at startup; from here on the index is maintained incrementally
+        async with session_factory() as session:
+            self.index.load(await ConversationService(session).list_open_locks())
+
+        # Reuse our pinned dashboard across restarts instead of posting a new one
+        chat = await bot.get_chat(self.chat_id)
+        pinned = chat.pinned_message
+        if pinned and pinned.from_user and pinned.from_user.id == bot.id and (pinned.text or "").startswith(TITLE):
+            self.message_id = pinned.message_id
+
+        self._task = asyncio.create_task(self._run(), name="queue-dashboard")
+        logger.info(f"Queue dashboard started ({self.index.snapshot()['open']} open conversations)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            delay = self._last_publish + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay) # Events arriving meanwhile are folded into this edit
+            self._dirty.clear()
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.warning(f"Failed to update queue dashboard: {e}")
+            self._last_publish = time.monotonic()
+
+    async def publish(self):
+        text = render_dashboard(self.index.snapshot())
+        if text == self._last_text:
+            return
+
+        with send_priority(Priority.LOW):
+            if self.message_id:
+                try:
+                    await self._bot.edit_message_text(text=text, chat_id=self.chat_id, message_id=self.message_id, parse_mode="HTML")
+                except TelegramBadRequest as e:
+                    if "message to edit not found" in str(e).lower():
+                        self.message_id = None # Deleted by someone; post a fresh one
+                    elif not is_not_modified_error(e):
+                        raise
+
+            if not self.message_id:
+                message = await self._bot.send_message(chat_id=self.chat_id, text=text, parse_mode="HTML", disable_notification=True)
+                self.message_id = message.message_id
+                try:
+                    await self._bot.pin_chat_message(chat_id=self.chat_id, message_id=message.message_id, disable_notification=True)
+                except TelegramBadRequest as e:
+                    logger.warning(f"Could not pin queue dashboard (bot needs pin rights): {e}")
+
+        self.edits += 1
+        self._last_text = text
+
+    def stats(self) -> dict:
+        return {**self.index.snapshot(), "events": self.events, "edits": self.edits}
+
+queue_dashboard = QueueDashboard(open_queue, settings.AGENT_GROUP_ID, min_interval=settings.DASHBOARD_MIN_INTERVAL)
@@ -3,14 +3,32 @@ from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from app.core.config import settings
 from app.bot.handlers import customer, agent, commands
-from app.bot.middlewares import DbSessionMiddleware
+from app.bot.middlewares import DbSessionMiddleware, HandlerMetricsMiddleware, ApiMetricsMiddleware, TracingMiddleware
+from app.bot.ratelimit import outbound_limiter
+from app.bot.recorder import update_recorder
+
+db_session_middleware = DbSessionMiddleware()
 
 async def get_bot_dispatcher():
     bot = Bot(token=settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     dp = Dispatcher()
 
+    # Outbound rate limiting / RetryAfter handling for every Bot API call
+    bot.session.middleware(outbound_limiter)
+    # Registered after the limiter so it times the HTTP request, not the throttling
+    bot.session.middleware(ApiMetricsMiddleware())
+
     # Middleware
-    dp.update.middleware(DbSessionMiddleware())
+    dp.update.middleware(TracingMiddleware())
+    if update_recorder:
+        dp.update.outer_middleware(update_recorder.update_middleware)
+        bot.session.middleware(update_recorder.request_middleware)
+    dp.update.middleware(db_session_middleware)
+    # Inner middlewares on the root router also wrap handlers of included routers
+    handler_metrics = HandlerMetricsMiddleware()
+    dp.message.middleware(handler_metrics)
+    dp.edited_message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
 
     # Routers
     dp.include_router(commands.router) # Commands first!
@@ -0,0 +1,43 @@
+import logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+from app.bot.topics import is_not_modified_error
+from app.services.message_link_service import MessageLinkService
+
+logger = logging.getLogger(__name__)
+
+async def sync_edit(message: Message, bot: Bot, link_service: MessageLinkService) -> bool:
+    """
+    Mirror an edit of a relayed message onto its copy on the other side. Text and
+    captions are synced; replaced media is not. Returns whether the copy was updated.
+    """
+    link = await link_service.resolve(message.chat.id, message.message_id)
+    if link is None or link.peer_chat_id is None:
+        return False
+
+    try:
+        if message.text is not None:
+            await bot.edit_message_text(
+                chat_id=link.peer_chat_id,
+                message_id=link.peer_message_id,
+                text=message.text,
+                entities=message.entities,
+                parse_mode=None,
+            )
+        elif message.caption is not None:
+            await bot.edit_message_caption(
+                chat_id=link.peer_chat_id,
+                message_id=link.peer_message_id,
+                caption=message.caption,
+                caption_entities=message.caption_entities,
+                parse_mode=None,
+            )
+        else:
+            return False
+    except TelegramBadRequest as e:
+        if is_not_modified_error(e):
+            return True
+        logger.warning(f"Failed to sync edit of {message.chat.id}/{message.message_id}: {e}")
+        return False
+    return True
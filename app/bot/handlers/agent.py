@@ -3,9 +3,12 @@ from aiogram import Router, F, Bot
 from aiogram.types import Message
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.user_service import UserService
-from app.services.conversation_service import ConversationService
+from app.services.conversation_service import ConversationService, lock_is_live
+from app.services.message_link_service import MessageLinkService
 from app.core.config import settings
 from app.models.user import UserType
+from app.bot.edits import sync_edit
+from app.bot.ratelimit import Priority, send_priority
 import logging
 import re
 
@@ -15,35 +18,27 @@ logger = logging.getLogger(__name__)
 ID_PATTERN = re.compile(r"Conversation ID: ([a-f0-9\-]+)")
 
 @router.message(F.chat.id == settings.AGENT_GROUP_ID, F.reply_to_message)
-async def handle_agent_reply(message: Message, session: AsyncSession, bot: Bot):
+async def handle_agent_reply(message: Message, session: AsyncSession, bot: Bot, album: list[Message] | None = None):
     logger.info(f"Agent reply received: {message.message_id}")
-    # Agents reply to the "Info Block" OR the "Media Message" (which is a reply to info block)
-    # So we need to check both the replied message and its parent if possible (but API doesn't give parent of reply).
-    # Strategy:
-    # 1. Check if direct reply has ID (Info Block case).
-    # 2. If not, check if it's a media message we forwarded? Hard to track without DB lookup of message_id.
-    #    Actually, in `customer.py`, we reply to the info block with the media.
-    #    So if Agent replies to Media, they are replying to a message from Bot.
-    #    But that Media message doesn't contain the Text ID.
-    #    WORKAROUND: Agents MUST reply to the TEXT Info Block to ensure we get the ID.
-    #    OR we parse the caption of the media if we added one? No.
-    #    BETTER: We CAN lookup the `messages` table for the `telegram_message_id` of the *replied message*.
-    #    If the agent replies to a Photo we sent, that Photo's ID in Agent Group is NOT in our DB (we stored user's ID).
-    #    
-    #    Let's stick to: "Agent, please reply to the INFO BLOCK". 
-    #    But that's annoying.
-    #    
-    #    Let's try to extract ID from text. If fails, assume it's a detailed log or ignore?
-    
+    # Resolve the conversation from, in order: the message_links row of the replied message
+    # (any relayed message, in any topic), the topic it was sent in, or the
+    # "Conversation ID" in an info block (messages relayed before links existed).
+
     # Check if replying inside a Topic
     topic_id = message.message_thread_id
     conversation_id = None
     
     conv_service = ConversationService(session)
     user_service = UserService(session)
+    link_service = MessageLinkService(session)
 
-    # Strategy 1: Topic ID Lookup (Preferred)
-    if topic_id:
+    # Strategy 0: The replied message is one we relayed (works in any topic, incl. General)
+    link = await link_service.resolve(message.chat.id, message.reply_to_message.message_id)
+    if link:
+        conversation_id = link.conversation_id
+
+    # Strategy 1: Topic ID Lookup
+    if not conversation_id and topic_id:
         conv = await conv_service.get_by_topic_id(topic_id)
         if conv:
             conversation_id = conv.id
@@ -86,26 +81,73 @@ async def handle_agent_reply(message: Message, session: AsyncSession, bot: Bot):
     if not conv:
         await message.reply("❌ Conversation not found.")
         return
+    # Links and info blocks also resolve conversations that have since been closed
+    if conv.status != "open":
+        await message.reply("❌ Conversation is closed.")
+        return
     
-    # Check Lock
-    if conv.locked_by_agent:
-        if conv.locked_by_agent != agent.id:
+    # Lock (or renew our lease) in one conditional UPDATE; only a live lock held by
+    # another agent stops the reply
+    was_ours = conv.locked_by_agent == agent.id and lock_is_live(conv.locked_by_agent, conv.locked_until)
+    if not await conv_service.lock_conversation(conv.id, agent, event_type=None if was_ours else "auto_locked"):
+        # The UPDATE also refuses a conversation closed since we read it
+        current = await conv_service.get_by_id(conv.id)
+        if current is None or current.status != "open":
+            await message.reply("❌ Conversation is closed.")
+        else:
             await message.reply(f"🔒 Locked by another agent.")
-            return
-    else:
-        # Auto-lock on first reply
-        await conv_service.lock_conversation(conv.id, agent)
-        await message.reply(f"🔒 Conversation auto-locked to you.")
+        return
+    if not was_ours:
+        with send_priority(Priority.LOW):
+            await message.reply(f"🔒 Conversation auto-locked to you.")
 
     # 3. Send to Customer (Copy Message to support Media)
     try:
-        await message.copy_to(chat_id=conv.customer.telegram_user_id)
+        with send_priority(Priority.HIGH):
+            if album:
+                # Whole album in one call instead of one per part
+                copies = await bot.copy_messages(
+                    chat_id=conv.customer.telegram_user_id,
+                    from_chat_id=message.chat.id,
+                    message_ids=[part.message_id for part in album],
+                )
+            else:
+                copies = [await message.copy_to(chat_id=conv.customer.telegram_user_id)]
     except Exception as e:
         logger.error(f"Failed to send to user {conv.customer.telegram_user_id}: {e}")
         await message.reply("❌ Failed to send message to user (blocked?).")
         return
 
+    source_ids = [part.message_id for part in album] if album else [message.message_id]
+    await link_service.link_copies(
+        conv.id, message.chat.id, source_ids, conv.customer.telegram_user_id, [copy.message_id for copy in copies]
+    )
+
     # 4. Save Agent Message
+    if album:
+        parts = []
+        for part in album:
+            part_type, part_content = extract_content(part)
+            parts.append({"telegram_message_id": part.message_id, "message_type": part_type, "content": part_content})
+        await conv_service.add_messages(conv.id, "agent", parts, sender_id=agent.id)
+        return
+
+    message_type, content = extract_content(message)
+    await conv_service.add_message(
+        conversation_id=conv.id,
+        sender_type="agent",
+        content=content,
+        sender_id=agent.id,
+        telegram_message_id=message.message_id,
+        message_type=message_type
+    )
+
+@router.edited_message(F.chat.id == settings.AGENT_GROUP_ID)
+async def handle_agent_edit(message: Message, session: AsyncSession, bot: Bot):
+    with send_priority(Priority.HIGH):
+        await sync_edit(message, bot, MessageLinkService(session))
+
+def extract_content(message: Message) -> tuple[str, str]:
     message_type = "text"
     content = message.text or ""
     if message.photo:
@@ -118,12 +160,4 @@ async def handle_agent_reply(message: Message, session: AsyncSession, bot: Bot):
         message_type = "sticker"
         content = message.sticker.file_id
     # etc...
-    
-    await conv_service.add_message(
-        conversation_id=conv.id,
-        sender_type="agent",
-        content=content,
-        sender_id=agent.id,
-        telegram_message_id=message.message_id,
-        message_type=message_type
-    )
+    return message_type, content
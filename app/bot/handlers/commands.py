@@ -1,15 +1,23 @@
+import html
 import uuid
+from datetime import datetime, timedelta
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandObject
-from aiogram.types import Message
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.user_service import UserService
-from app.services.conversation_service import ConversationService
+from app.services.conversation_service import ConversationService, OpenConversationPage, agent_display_name, lock_is_live
 from app.core.config import settings
 from app.models.user import UserType
+from app.bot.ratelimit import Priority, send_priority
+from app.bot.topics import is_not_modified_error
 
 router = Router()
 
+EPOCH = datetime(1970, 1, 1)
+
 @router.message(Command("start"), F.chat.type == "private")
 async def cmd_start(message: Message):
     welcome_text = (
@@ -18,29 +26,75 @@ async def cmd_start(message: Message):
         "Please send your message directly here, and an agent will respond shortly.\n\n"
         "<i>You can send text, photos, documents, or voice messages.</i>"
     )
-    await message.answer(welcome_text, parse_mode="HTML")
+    with send_priority(Priority.HIGH):
+        await message.answer(welcome_text, parse_mode="HTML")
+
+class ListPage(CallbackData, prefix="list"):
+    """Keyset cursor for /list navigation: a row of the current page and the direction to go."""
+    direction: str # "next" pages after the row, "prev" before it
+    created_at: int # Microseconds since the epoch, keeps callback data under 64 bytes
+    id: uuid.UUID
+
+def _cursor_time(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def render_open_conversations(page: OpenConversationPage) -> tuple[str, InlineKeyboardMarkup | None]:
+    text = "<b>Open Conversations:</b>\n"
+    for c in page.rows:
+        locker_name = agent_display_name(c.locker_username, c.locker_first_name)
+        locked_status = f"🔒 {html.escape(locker_name)}" if lock_is_live(c.locked_by_agent, c.locked_until) else "🟢 Open"
+        customer_name = c.customer_username or c.customer_first_name or str(c.customer_telegram_id)
+
+        text += f"- {html.escape(customer_name)} (<code>{c.id}</code>) [{locked_status}]\n"
+
+    buttons = []
+    if page.has_prev:
+        first = page.rows[0]
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Prev",
+            callback_data=ListPage(direction="prev", created_at=_cursor_time(first.created_at), id=first.id).pack(),
+        ))
+    if page.has_next:
+        last = page.rows[-1]
+        buttons.append(InlineKeyboardButton(
+            text="Next ➡️",
+            callback_data=ListPage(direction="next", created_at=_cursor_time(last.created_at), id=last.id).pack(),
+        ))
+    return text, InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
 @router.message(Command("list"), F.chat.id == settings.AGENT_GROUP_ID)
 async def cmd_list(message: Message, session: AsyncSession):
     conv_service = ConversationService(session)
-    conversations = await conv_service.list_open_conversations()
-    
-    if not conversations:
+    page = await conv_service.list_open_page(limit=settings.LIST_PAGE_SIZE)
+
+    if not page.rows:
         await message.reply("No open conversations.")
         return
-        
-    text = "<b>Open Conversations:</b>\n"
-    for c in conversations:
-        locker_name = "Agent"
-        if c.locker:
-            locker_name = c.locker.username or c.locker.first_name or "Agent"
-            
-        locked_status = f"🔒 {locker_name}" if c.locked_by_agent else "🟢 Open"
-        customer_name = c.customer.username or c.customer.first_name or str(c.customer.telegram_user_id)
-        
-        text += f"- {customer_name} (<code>{c.id}</code>) [{locked_status}]\n"
-        
-    await message.reply(text, parse_mode="HTML")
+
+    text, keyboard = render_open_conversations(page)
+    await message.reply(text, parse_mode="HTML", reply_markup=keyboard)
+
+@router.callback_query(ListPage.filter(), F.message.chat.id == settings.AGENT_GROUP_ID)
+async def cb_list_page(callback: CallbackQuery, callback_data: ListPage, session: AsyncSession):
+    conv_service = ConversationService(session)
+    cursor = (EPOCH + timedelta(microseconds=callback_data.created_at), callback_data.id)
+    if callback_data.direction == "prev":
+        page = await conv_service.list_open_page(before=cursor, limit=settings.LIST_PAGE_SIZE)
+    else:
+        page = await conv_service.list_open_page(after=cursor, limit=settings.LIST_PAGE_SIZE)
+
+    if not page.rows:
+        # Conversations closed since the list was sent
+        await callback.answer("No more open conversations.")
+        return
+
+    text, keyboard = render_open_conversations(page)
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if not is_not_modified_error(e):
+            raise
+    await callback.answer()
 
 @router.message(Command("lock"), F.chat.id == settings.AGENT_GROUP_ID)
 async def cmd_lock(message: Message, command: CommandObject, session: AsyncSession):
@@ -135,8 +189,17 @@ async def cmd_close(message: Message, command: CommandObject, session: AsyncSess
         await message.reply("Usage: /close <conversation_id> (or use inside a topic)")
         return
         
-    success = await conv_service.close_conversation(conv_id)
+    user_service = UserService(session)
+    agent = await user_service.get_or_create(
+        message.from_user.id,
+        message.from_user.username,
+        message.from_user.first_name,
+        message.from_user.last_name,
+        UserType.AGENT
+    )
+
+    success = await conv_service.close_conversation(conv_id, closed_by=agent.id)
     if success:
         await message.reply("✅ Conversation closed.")
     else:
-        await message.reply("❌ Could not close (invalid ID).")
+        await message.reply("❌ Could not close (invalid ID or already closed).")
@@ -1,36 +1,25 @@
+import uuid
 from aiogram import Router, F, Bot
 from aiogram.types import Message, ContentType
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.user_service import UserService
 from app.services.conversation_service import ConversationService
+from app.services.event_journal import event_journal
+from app.services.message_link_service import MessageLinkService
 from app.core.config import settings
 from app.models.user import UserType
+from app.bot.edits import sync_edit
+from app.bot.outbox import outbox_sender
+from app.bot.ratelimit import Priority, send_priority
+from app.bot.topics import topic_cache, topic_creation, topic_readiness, is_dead_topic_error, is_not_modified_error
 import logging
-import asyncio
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-# Accept any content type
-@router.message(F.chat.type == "private")
-async def handle_customer_message(message: Message, session: AsyncSession, bot: Bot):
-    user_service = UserService(session)
-    conv_service = ConversationService(session)
-
-    # 1. Get or Create User
-    user = await user_service.get_or_create(
-        telegram_id=message.from_user.id,
-        username=message.from_user.username,
-        first_name=message.from_user.first_name,
-        last_name=message.from_user.last_name,
-        user_type=UserType.CUSTOMER
-    )
-
-    # 2. Get or Create Conversation
-    conversation = await conv_service.create_conversation(user.id)
-    
-    # 3. Determine Format & Content
+def extract_content(message: Message) -> tuple[str, str]:
+    """Message type and the content we store for it (file_id for media)."""
     message_type = "text"
     content = message.text or ""
     
@@ -61,24 +50,151 @@ async def handle_customer_message(message: Message, session: AsyncSession, bot:
     if not content and not message.text:
         content = "[Unknown Media]"
 
-    # 4. Save to DB
-    await conv_service.add_message(
-        conversation_id=conversation.id,
-        sender_type="customer",
-        content=content,
-        sender_id=user.id,
-        telegram_message_id=message.message_id,
-        message_type=message_type
+    return message_type, content
+
+# Accept any content type
+@router.message(F.chat.type == "private")
+async def handle_customer_message(message: Message, session: AsyncSession, bot: Bot, album: list[Message] | None = None):
+    # An album (media group) arrives as a single call carrying all its parts, see ChatScheduler
+    user_service = UserService(session)
+    conv_service = ConversationService(session)
+
+    # 1. Get or Create User
+    user = await user_service.get_or_create(
+        telegram_id=message.from_user.id,
+        username=message.from_user.username,
+        first_name=message.from_user.first_name,
+        last_name=message.from_user.last_name,
+        user_type=UserType.CUSTOMER
     )
 
+    # 2. Get or Create Conversation
+    conversation = await conv_service.create_conversation(user.id)
+    
+    # 3. Determine Format & Content
+    message_type, content = extract_content(message)
+
+    if settings.OUTBOX_ENABLED:
+        # 4+5. Store the message(s) and their delivery in one transaction; the outbox sender relays them
+        parts = [
+            {"telegram_message_id": part.message_id, "message_type": part_type, "content": part_content}
+            for part in album or [message]
+            for part_type, part_content in [extract_content(part)]
+        ]
+        outbox = {
+            "idempotency_key": f"{message.chat.id}:{message.message_id}",
+            "conversation_id": conversation.id,
+            "kind": "customer_message",
+            "payload": {
+                "messages": [part.model_dump(mode="json", exclude_none=True, by_alias=True) for part in album or [message]],
+                "album": bool(album),
+                "message_type": message_type,
+                "content": content,
+            },
+        }
+        if await conv_service.add_messages(conversation.id, "customer", parts, sender_id=user.id, outbox=outbox):
+            outbox_sender.wake()
+        return
+
+    # 4. Save to DB
+    if album:
+        parts = []
+        for part in album:
+            part_type, part_content = extract_content(part)
+            parts.append({"telegram_message_id": part.message_id, "message_type": part_type, "content": part_content})
+        await conv_service.add_messages(conversation.id, "customer", parts, sender_id=user.id)
+    else:
+        await conv_service.add_message(
+            conversation_id=conversation.id,
+            sender_type="customer",
+            content=content,
+            sender_id=user.id,
+            telegram_message_id=message.message_id,
+            message_type=message_type
+        )
+
     # 5. Handle Forum Topic & Forwarding structure
     # Robust retry mechanism for topic creation and messaging
-    await process_conversation_message(message, conversation, user, conv_service, bot, message_type, content)
+    copy_ids = await process_conversation_message(message, conversation, user, conv_service, bot, message_type, content, album)
+
+    # 6. Remember where each part landed, for reply routing and edit sync
+    if copy_ids:
+        source_ids = [part.message_id for part in album] if album else [message.message_id]
+        await MessageLinkService(session).link_copies(conversation.id, message.chat.id, source_ids, settings.AGENT_GROUP_ID, copy_ids)
+
+@outbox_sender.handler("customer_message")
+async def deliver_customer_message(payload: dict, conversation_id: uuid.UUID, session: AsyncSession, bot: Bot):
+    """Outbox delivery of a stored customer message: steps 5 and 6 of handle_customer_message."""
+    messages = [Message.model_validate(data, context={"bot": bot}) for data in payload["messages"]]
+    message, album = messages[0], messages if payload["album"] else None
+
+    conv_service = ConversationService(session)
+    conversation = await conv_service.get_by_id(conversation_id)
+    if conversation is None:
+        return # Deleted meanwhile: nothing to deliver to
+    await session.commit() # Don't hold a connection across the Bot API calls
+
+    copy_ids = await process_conversation_message(
+        message, conversation, conversation.customer, conv_service, bot, payload["message_type"], payload["content"], album
+    )
+    if not copy_ids:
+        raise RuntimeError("Message could not be delivered to the agent group")
+    await MessageLinkService(session).link_copies(conversation.id, message.chat.id, [m.message_id for m in messages], settings.AGENT_GROUP_ID, copy_ids)
+
+@router.edited_message(F.chat.type == "private")
+async def handle_customer_edit(message: Message, session: AsyncSession, bot: Bot):
+    await sync_edit(message, bot, MessageLinkService(session))
 
-async def process_conversation_message(message: Message, conversation, user, conv_service: ConversationService, bot: Bot, message_type: str, content: str):
+async def copy_to_agent_group(message: Message, bot: Bot, album: list[Message] | None, message_thread_id: int | None = None, reply_to_message_id: int | None = None) -> list[int]:
+    """Copy the message (or every album part) into the agent group; returns the copies' message ids."""
+    # Albums go out in one copyMessages call (which can't reply, the info block precedes it instead)
+    if album:
+        copies = await bot.copy_messages(
+            chat_id=settings.AGENT_GROUP_ID,
+            from_chat_id=message.chat.id,
+            message_ids=[part.message_id for part in album],
+            message_thread_id=message_thread_id,
+        )
+        return [copy.message_id for copy in copies]
+    copy = await message.copy_to(
+        chat_id=settings.AGENT_GROUP_ID,
+        message_thread_id=message_thread_id,
+        reply_to_message_id=reply_to_message_id,
+    )
+    return [copy.message_id]
+
+async def create_conversation_topic(conversation, user, conv_service: ConversationService, bot: Bot) -> int:
+    name = f"{user.first_name} {user.last_name or ''}".strip() or f"User {user.telegram_user_id}"
+    logger.info(f"Creating new topic for user {user.id} with name: {name}")
+
+    topic = await bot.create_forum_topic(chat_id=settings.AGENT_GROUP_ID, name=name)
+    topic_id = topic.message_thread_id
+
+    # Update DB
+    await conv_service.set_topic_id(conversation.id, topic_id)
+    topic_cache.mark_synced(topic_id, name)
+    logger.info(f"Topic created successfully. ID: {topic_id}")
+
+    # Send System Message. It also serves as the readiness check: it is retried with
+    # short backoff until Telegram accepts messages in the new topic.
+    try:
+        with send_priority(Priority.LOW):
+            await topic_readiness.send(lambda: bot.send_message(
+                chat_id=settings.AGENT_GROUP_ID,
+                message_thread_id=topic_id,
+                text=f"🆕 <b>New Conversation Started</b>\nUser: {user.full_name}\nID: <code>{conversation.id}</code>",
+                parse_mode="HTML"
+            ))
+    except Exception as sys_msg_error:
+        logger.warning(f"Failed to send system message: {sys_msg_error}")
+
+    return topic_id
+
+async def process_conversation_message(message: Message, conversation, user, conv_service: ConversationService, bot: Bot, message_type: str, content: str, album: list[Message] | None = None) -> list[int] | None:
     """
     Helper function to handle the complex logic of topic validation, creation, and message sending.
     Separated to keep the handler clean and allow recursion/retries if needed (though we use a loop).
+    Returns the message ids of the copies in the agent group, or None if nothing was delivered.
     """
     max_retries = 2
     
@@ -87,32 +203,14 @@ async def process_conversation_message(message: Message, conversation, user, con
         logger.info(f"Processing message id={message.message_id} (Attempt {attempt+1}/{max_retries}). Topic ID: {current_topic_id}")
         
         # A. Create Topic if Missing
+        # Concurrent messages for the same conversation share one in-flight creation.
         if not current_topic_id:
             try:
-                name = f"{user.first_name} {user.last_name or ''}".strip() or f"User {user.telegram_user_id}"
-                logger.info(f"Creating new topic for user {user.id} with name: {name}")
-                
-                topic = await bot.create_forum_topic(chat_id=settings.AGENT_GROUP_ID, name=name)
-                current_topic_id = topic.message_thread_id
-                
-                # Update DB and Local Object
-                await conv_service.set_topic_id(conversation.id, current_topic_id)
+                current_topic_id = await topic_creation.run(
+                    conversation.id,
+                    lambda: create_conversation_topic(conversation, user, conv_service, bot),
+                )
                 conversation.topic_id = current_topic_id
-                
-                logger.info(f"Topic created successfully. ID: {current_topic_id}")
-                
-                # Send System Message
-                try:
-                    await bot.send_message(
-                        chat_id=settings.AGENT_GROUP_ID,
-                        message_thread_id=current_topic_id,
-                        text=f"🆕 <b>New Conversation Started</b>\nUser: {user.full_name}\nID: <code>{conversation.id}</code>",
-                        parse_mode="HTML"
-                    )
-                    # Helper delay to ensure Telegram registers the topic
-                    await asyncio.sleep(1) 
-                except Exception as sys_msg_error:
-                    logger.warning(f"Failed to send system message: {sys_msg_error}")
 
             except Exception as create_error:
                 logger.error(f"Failed to create topic: {create_error}")
@@ -122,58 +220,48 @@ async def process_conversation_message(message: Message, conversation, user, con
         # B. Attempt to Send/Copy Message
         if current_topic_id:
             try:
-                # 1. Validate topic by attempting to EDIT it (Sync input).
-                # This serves two purposes:
-                # a) Strong validation: fails if topic is deleted.
-                # b) Feature: Syncs topic name if user updated their profile.
+                # 1. Sync topic name only if the customer's name changed since we last set it.
+                # Topic liveness is not probed here: a dead topic shows up as a copy_to failure.
                 user_name = f"{user.first_name} {user.last_name or ''}".strip() or f"User {user.telegram_user_id}"
-                
-                try:
-                    await bot.edit_forum_topic(chat_id=settings.AGENT_GROUP_ID, message_thread_id=current_topic_id, name=user_name)
-                except Exception as val_error:
-                    val_err_str = str(val_error).lower()
-                    
-                    # "message is not modified" means topic exists and name is same -> SUCCESS
-                    # "topic_not_modified" (underscore) is also common
-                    if "not modified" in val_err_str or "not_modified" in val_err_str:
-                         pass 
-                    
-                    # "thread not found" -> DEAD
-                    elif any(x in val_err_str for x in ["thread", "topic", "not found", "deleted", "deactivated", "bad request"]):
-                        logger.warning(f"Topic {current_topic_id} is dead (edit failed). Triggering recreation.")
-                        raise val_error # Re-raise to trigger outer loop
-                    
-                    else:
-                        logger.warning(f"Topic edit failed with non-critical error: {val_err_str}. Proceeding.")
+
+                if topic_cache.needs_rename(current_topic_id, user_name):
+                    try:
+                        await bot.edit_forum_topic(chat_id=settings.AGENT_GROUP_ID, message_thread_id=current_topic_id, name=user_name)
+                        topic_cache.mark_synced(current_topic_id, user_name)
+                    except Exception as val_error:
+                        # "topic_not_modified" means topic exists and name is same -> SUCCESS
+                        if is_not_modified_error(val_error):
+                            topic_cache.mark_synced(current_topic_id, user_name)
+                        elif is_dead_topic_error(val_error):
+                            logger.warning(f"Topic {current_topic_id} is dead (edit failed). Triggering recreation.")
+                            raise val_error # Re-raise to trigger outer loop
+                        else:
+                            logger.warning(f"Topic edit failed with non-critical error: {val_error}. Proceeding.")
 
                 # 2. Try Copying
-                await message.copy_to(
-                    chat_id=settings.AGENT_GROUP_ID,
-                    message_thread_id=current_topic_id
-                )
-                
+                copy_ids = await copy_to_agent_group(message, bot, album, message_thread_id=current_topic_id)
+                topic_cache.mark_verified(current_topic_id)
+
                 logger.info("Message copied successfully.")
-                return # Success! Exit function.
+                return copy_ids # Success! Exit function.
 
             except Exception as e:
                 error_str = str(e).lower()
                 logger.warning(f"Failed to send to topic {current_topic_id} (Attempt {attempt+1}): {error_str}")
-                
-                # Aggressive Retry Logic:
-                # If this is the first attempt, we assume ANY error (except verified content errors) 
-                # might be due to a broken topic state. We should force a recreation.
-                
+
                 is_content_error = any(x in error_str for x in ["message is too long", "file is too big", "wrong file identifier", "file part exceeded"])
-                
-                # If it's NOT a content error, and we have retries left, assume the topic is botched.
-                if not is_content_error and attempt < max_retries - 1:
-                    logger.warning(f"Error does not look like content error. Assuming topic {current_topic_id} is dead/invalid. Clearing and retrying...")
-                    
+
+                # Telegram told us the topic is gone: recreate it and retry.
+                if is_dead_topic_error(e) and attempt < max_retries - 1:
+                    logger.warning(f"Topic {current_topic_id} is dead/invalid. Clearing and retrying...")
+
+                    event_journal.record(conversation.id, "topic_recreated", details=f"topic {current_topic_id}: {error_str[:200]}")
                     # Clear topic in DB
+                    topic_cache.forget(current_topic_id)
                     await conv_service.set_topic_id(conversation.id, None)
                     conversation.topic_id = None
                     continue # Loop will try to create new topic
-                
+
                 elif is_content_error:
                     logger.error("Message content error (too big/invalid). Cannot fix by recreating topic.")
                     # We might want to send a warning to user here? 
@@ -187,6 +275,7 @@ async def process_conversation_message(message: Message, conversation, user, con
         if attempt == max_retries - 1 or not current_topic_id:
              try:
                  logger.info("Falling back to General topic.")
+                 event_journal.record(conversation.id, "fallback_general", details="no topic" if not current_topic_id else f"topic {current_topic_id} failed")
                  fallback_text = (
                     f"📩 <b>New Message</b> (Type: {message_type})\n"
                     f"User: {message.from_user.full_name}\n"
@@ -195,8 +284,7 @@ async def process_conversation_message(message: Message, conversation, user, con
                     f"<i>(Topic creation failed or topic lost)</i>"
                  )
                  info = await bot.send_message(settings.AGENT_GROUP_ID, text=fallback_text, parse_mode="HTML")
-                 await message.copy_to(settings.AGENT_GROUP_ID, reply_to_message_id=info.message_id)
-                 return
+                 return await copy_to_agent_group(message, bot, album, reply_to_message_id=info.message_id)
              except Exception as fallback_error:
                  logger.error(f"Critical: Failed to send fallback message: {fallback_error}")
-                 return
+                 return None
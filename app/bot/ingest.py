@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from app.bot.scheduler import ChatScheduler
+
+logger = logging.getLogger(__name__)
+
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+
+class UpdateQueue:
+    """
+    Bounded in-process buffer between update ingestion (webhook or polling) and the Dispatcher.
+    Producers only enqueue; a ChatScheduler feeds the dispatcher, keeping each chat's
+    updates in order while different chats run in parallel, so accepting an update
+    never waits on handler latency.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        maxsize: int = 1000,
+        shards: int = 4,
+        shard_concurrency: int = 4,
+        album_window: float = 0.3,
+    ):
+        self.bot = bot
+        self.dp = dp
+        self.maxsize = maxsize
+        self.scheduler = ChatScheduler(
+            self._process,
+            shards=shards,
+            shard_concurrency=shard_concurrency,
+            max_pending_per_shard=max(1, maxsize // shards),
+            album_window=album_window,
+        )
+
+        # Backpressure metrics
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.high_watermark = 0
+
+    def start(self):
+        self.scheduler.start()
+        logger.info(
+            f"Update queue started with {len(self.scheduler.shards)} shards "
+            f"x {self.scheduler.shards[0].concurrency} workers (maxsize={self.maxsize})"
+        )
+
+    def put_nowait(self, update: Update) -> bool:
+        """Enqueue without waiting. Returns False when the chat's shard is full so the caller can shed load."""
+        if not self.scheduler.submit_nowait(update):
+            self.rejected += 1
+            logger.warning(f"Update queue full, rejecting update id={update.update_id}")
+            return False
+        self._record_enqueue()
+        return True
+
+    async def put(self, update: Update):
+        """Enqueue, waiting for a free slot (used by producers that can slow down, e.g. polling)."""
+        await self.scheduler.submit(update)
+        self._record_enqueue()
+
+    def depth(self) -> int:
+        return self.scheduler.depth()
+
+    def _record_enqueue(self):
+        self.enqueued += 1
+        depth = self.scheduler.depth()
+        if depth > self.high_watermark:
+            self.high_watermark = depth
+
+    async def stop(self, timeout: float = 10.0):
+        # Updates were already acknowledged to Telegram, so drain before dropping them
+        try:
+            await self.scheduler.drain(timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue drain timed out, dropping {self.scheduler.depth()} updates")
+
+        await self.scheduler.stop()
+        logger.info("Update queue stopped")
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.scheduler.depth(),
+            "maxsize": self.maxsize,
+            "high_watermark": self.high_watermark,
+            "in_flight": self.scheduler.in_flight(),
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "shards": self.scheduler.stats(),
+        }
+
+    async def _process(self, update: Update, **kwargs):
+        try:
+            await self.dp.feed_update(self.bot, update, **kwargs)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception(f"Failed to process update id={update.update_id}: {e}")
+
+async def poll_updates(bot: Bot, queue: UpdateQueue, allowed_updates: list[str] | None = None, timeout: int = 30):
+    """
+    Long-polling producer for the UpdateQueue. Offsets are confirmed once an update is
+    enqueued, and a full queue pauses getUpdates instead of piling up tasks.
+    """
+    backoff = Backoff(config=POLLING_BACKOFF)
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=timeout,
+                allowed_updates=allowed_updates,
+                request_timeout=int(bot.session.timeout + timeout),
+            )
+        except Exception as e:
+            logger.error(f"Failed to fetch updates: {e}. Retrying in {backoff.next_delay:.1f}s")
+            await backoff.asleep()
+            continue
+        backoff.reset()
+
+        for update in updates:
+            await queue.put(update)
+            offset = update.update_id + 1
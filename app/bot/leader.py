@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Server-side keepalives of the lock session: probe after 5s idle, every 2s, give up after 3 misses
+LOCK_KEEPALIVES = {"tcp_keepalives_idle": "5", "tcp_keepalives_interval": "2", "tcp_keepalives_count": "3"}
+
+class PollingLeader:
+    """
+    Leader election over a Postgres session-level advisory lock, so only one replica
+    runs `getUpdates` (Telegram answers a second poller with 409 Conflict). Every
+    replica tries `pg_try_advisory_lock` every `retry_interval`; the winner runs `lead`
+    and pings its lock connection every `heartbeat_interval`. If a ping fails, `lead`
+    is cancelled at once. The lock goes with the connection: a replica that stops or
+    crashes releases it, and a standby takes over on its next try. A vanished host is
+    only noticed through TCP keepalive, so the lock connection sets tight per-session
+    keepalives (LOCK_KEEPALIVES): Postgres drops it about 11s after the host goes silent.
+
+    The lock lives on a dedicated, unpooled connection so it never occupies a slot
+    in the request pool.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        key: int,
+        heartbeat_interval: float = 2.0,
+        retry_interval: float = 2.0,
+    ):
+        self._engine = engine
+        self.key = key
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_interval = retry_interval
+        self._conn: AsyncConnection | None = None
+        self._task: asyncio.Task | None = None
+
+        self.is_leader = False
+        self.elections = 0
+        self.lost = 0
+
+    def start(self, lead: Callable[[], Awaitable[None]]):
+        self._task = asyncio.create_task(self._run(lead), name="polling-leader")
+        logger.info(f"Polling leader election started (advisory lock {self.key})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Unlock explicitly so a standby takes over on its next try instead of waiting on a timeout
+        await self._release()
+        await self._engine.dispose()
+
+    async def _run(self, lead: Callable[[], Awaitable[None]]):
+        while True:
+            try:
+                if await self._try_acquire():
+                    await self._lead(lead)
+                    await self._release()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Polling leader election: {e}")
+                await self._release()
+            await asyncio.sleep(self.retry_interval)
+
+    async def _try_acquire(self) -> bool:
+        if self._conn is None:
+            conn = await self._engine.connect()
+            # No transaction left open between heartbeats; the lock is session-level anyway
+            self._conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        result = await self._conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+        return bool(result.scalar())
+
+    async def _lead(self, lead: Callable[[], Awaitable[None]]):
+        self.is_leader = True
+        self.elections += 1
+        logger.info("Elected polling leader")
+        task = asyncio.create_task(lead(), name="polling-lead")
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.heartbeat_interval)
+                if done:
+                    if task.exception():
+                        logger.error(f"Polling stopped with an error: {task.exception()}")
+                    return
+                try:
+                    await asyncio.wait_for(self._conn.execute(text("SELECT 1")), timeout=self.heartbeat_interval)
+                except Exception as e:
+                    # Can't tell whether we still hold the lock; assume a standby has it
+                    self.lost += 1
+                    logger.error(f"Lost polling leadership (heartbeat failed: {e!r})")
+                    return
+        finally:
+            self.is_leader = False
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _release(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            await conn.execute(text("SELECT pg_advisory_unlock_all()"))
+            await conn.close()
+        except Exception:
+            # Broken connection: Postgres drops the lock with the session
+            try:
+                await conn.invalidate()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {"is_leader": self.is_leader, "elections": self.elections, "lost": self.lost}
+
+polling_leader = PollingLeader(
+    create_async_engine(settings.DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": LOCK_KEEPALIVES}),
+    key=settings.POLLING_LOCK_KEY,
+    heartbeat_interval=settings.POLLING_HEARTBEAT_INTERVAL,
+    retry_interval=settings.POLLING_RETRY_INTERVAL,
+)
@@ -1,15 +1,126 @@
+import time
 from typing import Callable, Awaitable, Dict, Any
-from aiogram import BaseMiddleware
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
 from aiogram.types import TelegramObject
+from app.core.metrics import handler_duration, handler_errors, telegram_request_duration, telegram_request_errors
+from app.core.tracing import annotate, span, trace_update
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.db.session import SessionLocal
 
+class TracingMiddleware(BaseMiddleware):
+    """Outermost update middleware: opens the per-update trace that services and API calls add spans to."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        album = data.get("album")
+        with trace_update(event.update_id, event_type=event.event_type, album_size=len(album) if album else None):
+            return await handler(event, data)
+
+class LazySession:
+    """
+    Stands in for an AsyncSession and only creates the real one on first use, so
+    updates whose handlers never touch it (/start, unhandled updates, cache hits)
+    skip session construction and teardown. `hit_database` tells whether the update
+    actually checked out a connection, which a created session alone doesn't mean.
+    """
+
+    def __init__(self, factory: async_sessionmaker[AsyncSession]):
+        self._factory = factory
+        self._session: AsyncSession | None = None
+        self.hit_database = False
+
+    @property
+    def used(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._factory()
+            event.listen(self._session.sync_session, "after_begin", self._began)
+        return getattr(self._session, name)
+
+    def _began(self, session, transaction, connection):
+        self.hit_database = True
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
 class DbSessionMiddleware(BaseMiddleware):
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession] = SessionLocal):
+        self.session_factory = session_factory
+        self.updates = 0
+        self.updates_with_session = 0
+        self.updates_with_db = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        session = LazySession(self.session_factory)
+        data["session"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            self.updates += 1
+            if session.used:
+                self.updates_with_session += 1
+            if session.hit_database:
+                self.updates_with_db += 1
+            await session.close()
+
+    def stats(self) -> dict:
+        return {
+            "updates": self.updates,
+            "updates_with_session": self.updates_with_session,
+            "updates_with_db": self.updates_with_db,
+            "db_ratio": round(self.updates_with_db / self.updates, 4) if self.updates else 0.0,
+        }
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware (runs once a handler matched) recording latency per handler
+    function, e.g. handle_customer_message, handle_agent_reply, cmd_list.
+    """
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        async with SessionLocal() as session:
-            data["session"] = session
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        annotate(handler=name)
+        started = time.perf_counter()
+        try:
             return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, name)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Bot API request middleware recording latency and errors per API method, plus a trace span."""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            with span(name, "api"):
+                return await make_request(bot, method)
+        except Exception as e:
+            telegram_request_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            telegram_request_duration.observe(time.perf_counter() - started, name)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.outbox_service import OutboxService
+
+logger = logging.getLogger(__name__)
+
+# (payload, conversation id, session, bot); raising schedules a retry
+OutboxHandler = Callable[[dict, uuid.UUID, AsyncSession, Bot], Awaitable[Any]]
+
+class OutboxSender:
+    """
+    Delivers `outbox` rows to Telegram off the handler path. Each round claims a batch
+    of due rows (one per conversation, see OutboxService.claim), delivers them
+    concurrently with up to `concurrency` in flight, then records every outcome in
+    one batched UPDATE. Failures retry with exponential backoff up to `max_attempts`.
+    A round can outlast `lease` (deliveries wait on the agent group's rate budget), so
+    leases of rows still in flight are renewed every `lease / 3` seconds, and an
+    outcome is only written while its claim is still held. Delivery is at-least-once:
+    a crash between the send and the outcome write resends that row after its lease
+    expires.
+
+    Handlers are registered per row kind with `@outbox_sender.handler("kind")`.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        batch_size: int = 100,
+        concurrency: int = 16,
+        lease: float = 60.0,
+        poll_interval: float = 0.5,
+        max_attempts: int = 8,
+        max_backoff: float = 300.0,
+        retention: timedelta = timedelta(hours=24),
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self._handlers: dict[str, OutboxHandler] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self._pruned_at = 0.0
+
+        self.rounds = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def handler(self, kind: str):
+        def register(func: OutboxHandler) -> OutboxHandler:
+            self._handlers[kind] = func
+            return func
+        return register
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._task = asyncio.create_task(self._run(), name="outbox-sender")
+        logger.info(f"Outbox sender started ({self.batch_size} rows per round)")
+
+    async def stop(self):
+        # Rows still pending are delivered by the next process to start (or another replica)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """New rows were committed in this process: don't wait for the next poll."""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.drain_once()
+                await self._maybe_prune()
+            except Exception as e:
+                logger.error(f"Outbox round failed: {e}")
+                claimed = 0
+            if claimed:
+                continue # A delivered row may unblock the next one of its conversation
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        async with self.session_factory() as session:
+            rows = await OutboxService(session).claim(self.batch_size, self.lease)
+        if not rows:
+            return 0
+
+        in_flight = {row.id: row.attempts for row in rows}
+        renewer = asyncio.create_task(self._renew(in_flight))
+        try:
+            results = await asyncio.gather(*(self._deliver(row, in_flight) for row in rows))
+        finally:
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+        async with self.session_factory() as session:
+            await OutboxService(session).complete(results)
+        self.rounds += 1
+        return len(rows)
+
+    async def _renew(self, in_flight: dict[int, int]):
+        """Keep the leases of rows in `in_flight` (id -> claim attempts) alive until their delivery ends."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                async with self.session_factory() as session:
+                    await OutboxService(session).renew(list(in_flight.items()), self.lease)
+            except Exception as e:
+                logger.warning(f"Outbox lease renewal failed: {e}")
+
+    async def _deliver(self, row, in_flight: dict[int, int]) -> dict:
+        async with self._slots:
+            try:
+                return await self._attempt(row)
+            finally:
+                in_flight.pop(row.id, None)
+
+    async def _attempt(self, row) -> dict:
+        claim = {"id": row.id, "attempts": row.attempts}
+        try:
+            handler = self._handlers[row.kind]
+            async with self.session_factory() as session:
+                await handler(row.payload, row.conversation_id, session, self._bot)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:1000]
+            if row.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error(f"Outbox row {row.id} failed after {row.attempts} attempts: {error}")
+                return {**claim, "status": "failed", "next_attempt_at": datetime.utcnow(), "last_error": error, "sent_at": None}
+            self.retried += 1
+            delay = min(self.max_backoff, 2 ** row.attempts)
+            logger.warning(f"Outbox row {row.id} attempt {row.attempts} failed, retrying in {delay}s: {error}")
+            return {**claim, "status": "pending", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay), "last_error": error, "sent_at": None}
+
+        self.sent += 1
+        now = datetime.utcnow()
+        return {**claim, "status": "sent", "next_attempt_at": now, "last_error": None, "sent_at": now}
+
+    async def _maybe_prune(self):
+        if time.monotonic() - self._pruned_at < 3600:
+            return
+        self._pruned_at = time.monotonic()
+        async with self.session_factory() as session:
+            pruned = await OutboxService(session).prune(datetime.utcnow() - self.retention)
+        if pruned:
+            logger.info(f"Pruned {pruned} delivered outbox rows")
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "rounds": self.rounds,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+outbox_sender = OutboxSender(
+    SessionLocal,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    concurrency=settings.OUTBOX_CONCURRENCY,
+    lease=settings.OUTBOX_LEASE_SECONDS,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    retention=timedelta(hours=settings.OUTBOX_RETENTION_HOURS),
+)
@@ -0,0 +1,180 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class Priority(enum.IntEnum):
+    HIGH = 0 # Customer-facing replies
+    NORMAL = 1 # Forwarding to agents, command replies
+    LOW = 2 # System notices
+
+outbound_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.NORMAL)
+
+@contextmanager
+def send_priority(priority: Priority):
+    """Run the Bot API calls inside the block in the given priority lane."""
+    token = outbound_priority.set(priority)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+class TokenBucket:
+    """
+    Token bucket (`rate` tokens per second, bursts up to `capacity`) that hands tokens
+    to waiters by priority lane, FIFO within a lane.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        """Hold all tokens for `seconds`, e.g. after Telegram answered with RetryAfter."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: Priority = Priority.NORMAL) -> float:
+        """Take one token, waiting if needed. Returns the time waited."""
+        started = time.monotonic()
+        if not self._waiters and started >= self.paused_until:
+            self._refill(started)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+        return time.monotonic() - started
+
+    async def _dispatch(self):
+        while self._waiters:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done(): # Waiter was cancelled
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Bot API request middleware enforcing Telegram's broadcast limits before a request
+    is sent: a global per-second budget plus per-chat budgets, per-minute for groups
+    and per-second for private chats. Waiters are served by priority lane (see
+    `send_priority`) at every level. RetryAfter responses pause the affected chat
+    and the request is retried transparently.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        group_per_minute: float = 20,
+        private_rate: float = 1,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self.group_per_minute = group_per_minute
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        # Idle buckets expire; a re-created bucket starts full, which an idle one would be anyway
+        self._chat_buckets = TTLCache(maxsize=100000, ttl=120)
+
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.retry_after = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                # Groups/supergroups: burst up to a few messages, then N per minute
+                bucket = TokenBucket(rate=self.group_per_minute / 60, capacity=max(1.0, self.group_per_minute / 4))
+            else:
+                bucket = TokenBucket(rate=self.private_rate, capacity=1)
+        self._keep(chat_id, bucket)
+        return bucket
+
+    def _keep(self, chat_id: int, bucket: TokenBucket):
+        # A paused bucket must outlive its pause: a fresh one would trip the 429 again
+        remaining = max(0.0, bucket.paused_until - time.monotonic())
+        self._chat_buckets.set(chat_id, bucket, ttl=self._chat_buckets.ttl + remaining)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int):
+            # getUpdates, getMe, webhooks, @channel usernames: not rate limited here
+            return await make_request(bot, method)
+
+        priority = outbound_priority.get()
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            waited = await bucket.acquire(priority)
+            waited += await self.global_bucket.acquire(priority)
+            self.requests += 1
+            if waited > 0.001:
+                self.throttled += 1
+                self.throttled_seconds += waited
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"RetryAfter {e.retry_after}s on {type(method).__name__} in chat {chat_id}, retrying")
+                bucket.pause(e.retry_after)
+                self._keep(chat_id, bucket)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "retry_after": self.retry_after,
+            "global_waiters": self.global_bucket.waiting(),
+            "chats": len(self._chat_buckets),
+        }
+
+outbound_limiter = OutboundRateLimiter(
+    global_rate=settings.TELEGRAM_GLOBAL_RATE,
+    group_per_minute=settings.TELEGRAM_GROUP_PER_MINUTE,
+    private_rate=settings.TELEGRAM_PRIVATE_RATE,
+    max_retries=settings.TELEGRAM_RETRY_AFTER_RETRIES,
+)
@@ -0,0 +1,201 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import NextRequestMiddlewareType
+from aiogram.methods import CreateForumTopic, TelegramMethod
+from aiogram.types import TelegramObject, Update
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+
+# Personal data replaced by placeholders; names keep their presence, not their value
+MASKED_STRINGS = {
+    "first_name": "User",
+    "last_name": "Anon",
+    "title": "Chat",
+    "name": "Topic", # Forum topics are named after the customer
+    "phone_number": "+000",
+    "email": "anon@example.com",
+    "vcard": "BEGIN:VCARD\nVERSION:3.0\nEND:VCARD", # Shared contacts carry full vCards
+    "address": "Address", # Venues
+    "sender_user_name": "User", # Forwards from users hiding their account
+    "author_signature": "Anon",
+}
+HASHED_STRINGS = {"username", "file_id", "file_unique_id", "url", "foursquare_id", "google_place_id"}
+MASKED_TEXT = {"text", "caption", "question", "explanation"} # Polls have question/explanation
+ZEROED_NUMBERS = {"latitude", "longitude"}
+PSEUDONYMISED_IDS = {"id", "user_id"} # user_id: shared contacts; plus any *chat_id
+
+# The config default is public: with it, the ~10-digit id space could be brute-forced back from the pseudonyms
+INSECURE_KEYS = {"", "unsafe_secret"}
+
+# Anonymised chat id of the customer whose update is being handled, for topic creation records
+_recording_chat: ContextVar[int | None] = ContextVar("recording_chat", default=None)
+
+class Anonymiser:
+    """
+    Keyed, deterministic pseudonymisation of an update. The same user/chat always maps to
+    the same id (so conversations stay conversations in a replay), but ids can't be
+    reversed without the key. Text keeps its length and leading command so entity
+    offsets and command routing still work.
+    """
+
+    def __init__(self, key: str):
+        if key in INSECURE_KEYS:
+            raise ValueError("Recording updates needs a private SECRET_KEY, not the default")
+        self._key = key.encode()
+
+    def _digest(self, value: Any) -> bytes:
+        return hmac.new(self._key, str(value).encode(), hashlib.blake2s).digest()
+
+    def id(self, value: int) -> int:
+        # Same sign so private chats (>0) and groups (<0) stay distinguishable
+        anon = int.from_bytes(self._digest(value)[:5], "big") + 1
+        return -anon if value < 0 else anon
+
+    def string(self, value: str) -> str:
+        return self._digest(value).hex()[:16]
+
+    @staticmethod
+    def text(value: str) -> str:
+        command, sep, rest = value.partition(" ") if value.startswith("/") else ("", "", value)
+        return command + sep + "".join(c if c.isspace() else "x" for c in rest)
+
+    def update(self, data: Any) -> Any:
+        if isinstance(data, list):
+            return [self.update(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for key, value in data.items():
+            if key in PSEUDONYMISED_IDS and isinstance(value, int) and not isinstance(value, bool):
+                result[key] = self.id(value)
+            elif key.endswith("chat_id") and isinstance(value, int):
+                result[key] = self.id(value)
+            elif key in MASKED_STRINGS and isinstance(value, str):
+                result[key] = MASKED_STRINGS[key]
+            elif key in HASHED_STRINGS and isinstance(value, str):
+                result[key] = self.string(value)
+            elif key in MASKED_TEXT and isinstance(value, str):
+                result[key] = self.text(value)
+            elif key in ZEROED_NUMBERS:
+                result[key] = 0.0
+            else:
+                result[key] = self.update(value)
+        return result
+
+class UpdateRecorder:
+    """
+    Records the updates the dispatcher handles, anonymised, to gzip-compressed JSONL for
+    `benchmarks.replay`. Each line is either a header (per process start), an update
+    with its wall-clock time, or a topic created while handling an update so a replay
+    can give agent replies the topic ids they were recorded with. Lines are buffered
+    and written from a background task.
+    """
+
+    def __init__(self, path: str, key: str, flush_interval: float = 1.0, max_buffer: int = 10000):
+        self.path = path
+        self.anonymiser = Anonymiser(key)
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: list[str] = []
+        self._task: asyncio.Task | None = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self):
+        self._write({
+            "header": {
+                "version": RECORDING_VERSION,
+                "agent_group_id": self.anonymiser.id(settings.AGENT_GROUP_ID),
+                "started_at": time.time(),
+            }
+        })
+        self._task = asyncio.create_task(self._run(), name="update-recorder")
+        logger.info(f"Recording updates to {self.path}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def _write(self, record: dict):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(json.dumps(record, separators=(",", ":")))
+
+    def record(self, update: Update, album: list | None = None):
+        now = time.time()
+        if album:
+            # Only the first part of an album reaches the dispatcher; record every part
+            updates = [{"message": part.model_dump(mode="json", exclude_none=True, by_alias=True)} for part in album]
+        else:
+            updates = [update.model_dump(mode="json", exclude_none=True, by_alias=True, exclude={"update_id"})]
+        for data in updates:
+            self._write({"ts": now, "update": self.anonymiser.update(data)})
+        self.recorded += 1
+
+    async def update_middleware(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        self.record(event, data.get("album"))
+        chat = data.get("event_chat")
+        token = _recording_chat.set(self.anonymiser.id(chat.id) if chat else None)
+        try:
+            return await handler(event, data)
+        finally:
+            _recording_chat.reset(token)
+
+    async def request_middleware(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        result = await make_request(bot, method)
+        if isinstance(method, CreateForumTopic):
+            self._write({"ts": time.time(), "topic": {"chat": _recording_chat.get(), "message_thread_id": result.message_thread_id}})
+        return result
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._append, lines)
+        except Exception as e:
+            self.dropped += len(lines)
+            logger.error(f"Update recorder dropped {len(lines)} lines: {e}")
+
+    def _append(self, lines: list[str]):
+        # Each flush is its own gzip member; readers see one continuous stream
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+def read_recording(path: str):
+    """Yield the records of a recording, in order."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+update_recorder = UpdateRecorder(settings.UPDATE_RECORD_PATH, settings.SECRET_KEY) if settings.UPDATE_RECORD_PATH else None
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+from aiogram.types import Message, Update
+
+logger = logging.getLogger(__name__)
+
+def ordering_key(update: Update) -> Hashable:
+    """
+    Key whose updates must be handled in order: the chat, plus the forum topic for
+    topic messages so agents working in different topics don't block each other.
+    """
+    try:
+        event = update.event
+    except Exception:
+        return (0, 0)
+
+    message = event if isinstance(event, Message) else getattr(event, "message", None)
+    chat = getattr(event, "chat", None) or getattr(message, "chat", None)
+    if chat is None:
+        user = getattr(event, "from_user", None)
+        return (user.id if user else 0, 0)
+
+    thread_id = 0
+    if isinstance(message, Message) and message.is_topic_message:
+        thread_id = message.message_thread_id
+    return (chat.id, thread_id)
+
+class AlbumBatch:
+    """Updates of one media group (album), dispatched together once no new part arrived for the window."""
+
+    def __init__(self, media_group_id: str, update: Update):
+        self.media_group_id = media_group_id
+        self.updates = [update]
+        self.updated_at = time.monotonic()
+
+    def add(self, update: Update):
+        self.updates.append(update)
+        self.updated_at = time.monotonic()
+
+    async def settle(self, window: float):
+        while (remaining := self.updated_at + window - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+
+class _Shard:
+    def __init__(
+        self,
+        index: int,
+        handler: Callable[..., Awaitable],
+        concurrency: int,
+        max_pending: int,
+        album_window: float,
+    ):
+        self.index = index
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.album_window = album_window
+
+        # key -> updates waiting for that key, in arrival order
+        self.pending: dict[Hashable, deque[Update | AlbumBatch]] = {}
+        # key -> album still collecting parts (queued or settling in a worker)
+        self.albums: dict[Hashable, AlbumBatch] = {}
+        # keys with pending updates and nothing in flight (each key appears at most once)
+        self.ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self.active: set[Hashable] = set()
+        self.space = asyncio.Condition()
+        self.workers: list[asyncio.Task] = []
+
+        self.size = 0
+        self.in_flight = 0
+        self.high_watermark = 0
+        self.processed = 0
+
+    def start(self):
+        for i in range(self.concurrency):
+            self.workers.append(asyncio.create_task(self._worker(), name=f"shard-{self.index}-worker-{i}"))
+
+    def is_full(self) -> bool:
+        return self.size >= self.max_pending
+
+    def enqueue(self, key: Hashable, update: Update):
+        media_group_id = update.message.media_group_id if update.message else None
+        if media_group_id:
+            album = self.albums.get(key)
+            if album and album.media_group_id == media_group_id:
+                album.add(update)
+                return
+            update = self.albums[key] = AlbumBatch(media_group_id, update)
+
+        queue = self.pending.get(key)
+        if queue is None:
+            queue = self.pending[key] = deque()
+        queue.append(update)
+        self.size += 1
+        self.high_watermark = max(self.high_watermark, self.size)
+
+        # A key that is running gets re-queued by its worker once the current update finishes
+        if len(queue) == 1 and key not in self.active:
+            self.ready.put_nowait(key)
+
+    async def wait_for_space(self):
+        async with self.space:
+            await self.space.wait_for(lambda: not self.is_full())
+
+    async def _worker(self):
+        while True:
+            key = await self.ready.get()
+            queue = self.pending[key]
+            item = queue.popleft()
+            self.size -= 1
+            self.active.add(key)
+            self.in_flight += 1
+            async with self.space:
+                self.space.notify_all()
+
+            try:
+                if isinstance(item, AlbumBatch):
+                    # Keep collecting parts, then hand the whole album to the first update's handler
+                    await item.settle(self.album_window)
+                    if self.albums.get(key) is item:
+                        del self.albums[key]
+                    await self.handler(item.updates[0], album=[u.message for u in item.updates])
+                else:
+                    await self.handler(item)
+            finally:
+                self.in_flight -= 1
+                self.processed += 1
+                self.active.discard(key)
+                # One update per turn so a chatty key can't starve the others in this shard
+                if queue:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.pending[key]
+
+    def stats(self) -> dict:
+        return {
+            "shard": self.index,
+            "depth": self.size,
+            "in_flight": self.in_flight,
+            "chats": len(self.pending),
+            "high_watermark": self.high_watermark,
+            "processed": self.processed,
+        }
+
+class ChatScheduler:
+    """
+    Runs updates for the same chat (or forum topic) strictly in order while
+    different chats run in parallel. Keys are hashed onto shards; each shard
+    has a fixed number of workers (its in-flight cap) and a bounded backlog.
+    Album parts (same media_group_id) are merged into one item and passed to the
+    handler as `album=[Message, ...]` along with the first part's update.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable],
+        shards: int = 4,
+        shard_concurrency: int = 4,
+        max_pending_per_shard: int = 250,
+        album_window: float = 0.3,
+    ):
+        self.shards = [
+            _Shard(i, handler, shard_concurrency, max_pending_per_shard, album_window)
+            for i in range(shards)
+        ]
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+
+    def _shard_for(self, key: Hashable) -> _Shard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def submit_nowait(self, update: Update) -> bool:
+        key = ordering_key(update)
+        shard = self._shard_for(key)
+        if shard.is_full():
+            return False
+        shard.enqueue(key, update)
+        return True
+
+    async def submit(self, update: Update):
+        key = ordering_key(update)
+        shard = self._shard_for(key)
+        if shard.is_full():
+            await shard.wait_for_space()
+        shard.enqueue(key, update)
+
+    def depth(self) -> int:
+        return sum(shard.size for shard in self.shards)
+
+    def in_flight(self) -> int:
+        return sum(shard.in_flight for shard in self.shards)
+
+    async def drain(self, timeout: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.depth() or self.in_flight():
+            if loop.time() >= deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        workers = [task for shard in self.shards for task in shard.workers]
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for shard in self.shards:
+            shard.workers.clear()
+
+    def stats(self) -> list[dict]:
+        return [shard.stats() for shard in self.shards]
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.bot.ratelimit import Priority, TokenBucket, send_priority
+from app.bot.topics import is_dead_topic_error, is_not_modified_error, topic_cache
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.conversation_service import ConversationService
+
+logger = logging.getLogger(__name__)
+
+class IdleSweeper:
+    """
+    Closes conversations that have been quiet for `idle_after`, so the open set that
+    /list, the dashboard and the active-conversation lookups scan stays small. Every
+    `interval` seconds it closes batches of `batch_size` until none are left. Their forum
+    topics are marked pending in the same UPDATE; a separate task closes those at
+    `topics_per_minute` and low priority, so a large first sweep never eats the group's
+    send budget. The backlog lives in the database: a restart resumes it, and rows are
+    claimed with a lease, so concurrent sweepers never close the same topic twice.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        chat_id: int,
+        idle_after: timedelta,
+        interval: float = 300,
+        batch_size: int = 200,
+        topics_per_minute: float = 6,
+    ):
+        self.session_factory = session_factory
+        self.chat_id = chat_id
+        self.idle_after = idle_after
+        self.interval = interval
+        self.batch_size = batch_size
+        self._topic_bucket = TokenBucket(rate=topics_per_minute / 60, capacity=1)
+        self._topics_wakeup = asyncio.Event()
+        self.topics_pending = 0
+        self._bot: Bot | None = None
+        self._tasks: list[asyncio.Task] = []
+
+        self.sweeps = 0
+        self.closed = 0
+        self.topics_closed = 0
+        self.topic_errors = 0
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._tasks = [
+            asyncio.create_task(self._run(), name="idle-sweeper"),
+            asyncio.create_task(self._close_topics(), name="idle-topic-closer"),
+        ]
+        logger.info(f"Idle sweeper started (closing after {self.idle_after}, every {self.interval:.0f}s)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def sweep(self) -> int:
+        """Close every conversation idle as of now, in batches. Returns how many were closed."""
+        idle_before = datetime.utcnow() - self.idle_after
+        total = 0
+        while True:
+            async with self.session_factory() as session:
+                closed = await ConversationService(session).close_idle(idle_before, self.batch_size)
+            total += len(closed)
+            if len(closed) < self.batch_size:
+                break
+
+        self.sweeps += 1
+        self.closed += total
+        if total:
+            logger.info(f"Idle sweeper closed {total} conversations")
+            self._topics_wakeup.set()
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Idle sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _close_topics(self):
+        while True:
+            try:
+                closed = await self.close_pending_topics()
+            except Exception as e:
+                logger.error(f"Closing idle topics failed: {e}")
+                closed = 0
+            if closed:
+                continue
+            try:
+                await asyncio.wait_for(self._topics_wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._topics_wakeup.clear()
+
+    async def close_pending_topics(self, limit: int = 50) -> int:
+        """Close one batch of pending topics at the topic rate. Returns how many were handled."""
+        async with self.session_factory() as session:
+            service = ConversationService(session)
+            self.topics_pending = await service.count_pending_topic_closes()
+            # Long enough to close the whole batch at the topic rate
+            pending = await service.claim_topic_closes(limit, lease=limit / self._topic_bucket.rate + 60)
+        for conversation_id, topic_id in pending:
+            await self._topic_bucket.acquire(Priority.LOW)
+            try:
+                with send_priority(Priority.LOW):
+                    await self._bot.close_forum_topic(chat_id=self.chat_id, message_thread_id=topic_id)
+                self.topics_closed += 1
+            except TelegramBadRequest as e:
+                # Already closed or deleted by an agent: nothing left to do. Other refusals won't change on retry either.
+                if not (is_not_modified_error(e) or is_dead_topic_error(e)):
+                    self.topic_errors += 1
+                    logger.warning(f"Could not close topic {topic_id}: {e}")
+            except Exception as e:
+                # Transient (network, rate limit): stays pending, retried once the claim expires
+                self.topic_errors += 1
+                logger.warning(f"Could not close topic {topic_id}, will retry: {e}")
+                continue
+            async with self.session_factory() as session:
+                await ConversationService(session).topic_closed(conversation_id)
+            self.topics_pending = max(0, self.topics_pending - 1)
+            topic_cache.forget(topic_id)
+        return len(pending)
+
+    def stats(self) -> dict:
+        return {
+            "sweeps": self.sweeps,
+            "closed": self.closed,
+            "topics_pending": self.topics_pending,
+            "topics_closed": self.topics_closed,
+            "topic_errors": self.topic_errors,
+        }
+
+idle_sweeper = IdleSweeper(
+    SessionLocal,
+    settings.AGENT_GROUP_ID,
+    idle_after=timedelta(hours=settings.IDLE_CLOSE_HOURS),
+    interval=settings.IDLE_SWEEP_INTERVAL,
+    batch_size=settings.IDLE_SWEEP_BATCH_SIZE,
+    topics_per_minute=settings.TOPIC_CLOSE_PER_MINUTE,
+)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+from aiogram.exceptions import TelegramBadRequest
+from app.core.config import settings
+from app.core.tracing import span
+
+DEAD_TOPIC_ERRORS = ("thread not found", "topic_deleted", "topic deleted", "topic not found", "topic_closed", "topic_id_invalid")
+NOT_MODIFIED_ERRORS = ("not modified", "not_modified")
+
+def is_dead_topic_error(error: Exception) -> bool:
+    """The target forum topic was deleted/closed, as reported by a failed send or edit."""
+    if not isinstance(error, TelegramBadRequest):
+        return False
+    error_str = str(error).lower()
+    return any(x in error_str for x in DEAD_TOPIC_ERRORS)
+
+def is_not_modified_error(error: Exception) -> bool:
+    error_str = str(error).lower()
+    return any(x in error_str for x in NOT_MODIFIED_ERRORS)
+
+@dataclass
+class TopicState:
+    name: str
+    verified_at: float
+
+class TopicStateCache:
+    """
+    Last known state of forum topics, keyed by topic_id: the name we last synced and
+    when the topic was last seen alive. Lets us skip edit_forum_topic unless the
+    customer's name changed. Entries expire after `ttl` so drift is eventually re-synced.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, TopicState] = OrderedDict()
+
+    def get(self, topic_id: int) -> TopicState | None:
+        state = self._entries.get(topic_id)
+        if state is None:
+            return None
+        if time.monotonic() - state.verified_at > self.ttl:
+            del self._entries[topic_id]
+            return None
+        self._entries.move_to_end(topic_id)
+        return state
+
+    def needs_rename(self, topic_id: int, name: str) -> bool:
+        state = self.get(topic_id)
+        return state is None or state.name != name
+
+    def mark_synced(self, topic_id: int, name: str):
+        self._entries[topic_id] = TopicState(name=name, verified_at=time.monotonic())
+        self._entries.move_to_end(topic_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def mark_verified(self, topic_id: int):
+        state = self._entries.get(topic_id)
+        if state:
+            state.verified_at = time.monotonic()
+
+    def forget(self, topic_id: int):
+        self._entries.pop(topic_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls per key: the first caller runs the factory, everyone
+    arriving while it is in flight awaits the same result instead of repeating it.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved in case nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.set_exception(RuntimeError("Single-flight leader was cancelled"))
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+class TopicReadiness:
+    """
+    Retries the first send into a freshly created topic until Telegram accepts it,
+    replacing a fixed sleep. The first retry delay adapts to how long topics have
+    recently taken to become ready.
+    """
+
+    def __init__(self, initial_delay: float = 0.05, max_delay: float = 0.5, budget: float = 2.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.typical_wait = 0.0
+        self.retries = 0
+
+    async def send(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        delay = self.initial_delay
+        retried = False
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                elapsed = time.monotonic() - started
+                if not retried:
+                    # Jump straight to where topics have recently become ready
+                    delay = max(self.initial_delay, min(self.typical_wait - elapsed, self.max_delay))
+                if not is_dead_topic_error(e) or elapsed + delay > self.budget:
+                    raise
+                self.retries += 1
+                retried = True
+                with span("topic_readiness.backoff", "wait", delay_ms=round(delay * 1000)):
+                    await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+
+            # typical_wait tracks how long after the first attempt a topic accepted messages
+            if retried:
+                self.typical_wait = 0.8 * self.typical_wait + 0.2 * (attempt_started - started)
+            else:
+                self.typical_wait *= 0.8
+            return result
+
+topic_creation = SingleFlight()
+topic_readiness = TopicReadiness()
+topic_cache = TopicStateCache(maxsize=settings.TOPIC_CACHE_SIZE, ttl=settings.TOPIC_CACHE_TTL)
@@ -0,0 +1,307 @@
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import queue
+import signal
+from multiprocessing.process import BaseProcess
+from aiogram.types import Update
+from app.bot.scheduler import ordering_key
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def worker_for(update: Update, workers: int) -> int:
+    """Worker index for an update: by chat, so each chat's updates always reach the same worker."""
+    chat_id, _ = ordering_key(update)
+    return chat_id % workers
+
+class WorkerPool:
+    """
+    Supervisor side of multi-process mode. The API process keeps ingestion (polling
+    or webhook) and hands each update, as JSON, to one of `workers` processes over a
+    bounded multiprocessing queue, chosen by chat id. Every worker runs its own
+    dispatcher, UpdateQueue, DB pool and caches, so per-chat ordering holds and
+    handler CPU spreads across cores. Dead workers are restarted with their queue
+    intact. Same `put`/`put_nowait`/`stop`/`stats` surface as UpdateQueue.
+
+    The agent group is one chat, so all agent-side updates land on one worker.
+    """
+
+    def __init__(self, workers: int, maxsize: int = 1000, check_interval: float = 1.0):
+        self.workers = workers
+        self.check_interval = check_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queues = [self._ctx.Queue(maxsize=max(1, maxsize // workers)) for _ in range(workers)]
+        self._processes: list[BaseProcess | None] = [None] * workers
+        self._monitor: asyncio.Task | None = None
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=run_worker,
+            args=(index, self.workers, self._queues[index]),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor = asyncio.create_task(self._watch(), name="worker-supervisor")
+        logger.info(f"Started {self.workers} worker processes")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    self.restarts += 1
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self._spawn(index)
+
+    @staticmethod
+    def _encode(update: Update) -> str:
+        return update.model_dump_json(exclude_none=True, by_alias=True)
+
+    def put_nowait(self, update: Update) -> bool:
+        """Hand off without waiting. Returns False when the worker's queue is full so the caller can shed load."""
+        try:
+            self._queues[worker_for(update, self.workers)].put_nowait(self._encode(update))
+        except queue.Full:
+            self.rejected += 1
+            logger.warning(f"Worker queue full, rejecting update id={update.update_id}")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def put(self, update: Update):
+        """Hand off, waiting while the worker's queue is full (used by polling)."""
+        target = self._queues[worker_for(update, self.workers)]
+        data = self._encode(update)
+        while True:
+            try:
+                target.put_nowait(data)
+                break
+            except queue.Full:
+                await asyncio.sleep(0.01)
+        self.enqueued += 1
+
+    def depth(self) -> int:
+        try:
+            return sum(q.qsize() for q in self._queues)
+        except NotImplementedError: # macOS
+            return 0
+
+    async def stop(self, timeout: float = 10.0):
+        if self._monitor:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+
+        processes = [p for p in self._processes if p is not None]
+
+        def shutdown():
+            # Workers drain what they already received, then exit on the sentinel
+            for q in self._queues:
+                q.put(None, timeout=timeout)
+            for process in processes:
+                process.join(timeout)
+
+        try:
+            await asyncio.to_thread(shutdown)
+        except queue.Full:
+            pass
+        for process in processes:
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop in {timeout}s, terminating")
+                process.terminate()
+        logger.info("Worker processes stopped")
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "workers": [
+                {"worker": i, "pid": p.pid if p else None, "alive": bool(p and p.is_alive())}
+                for i, p in enumerate(self._processes)
+            ],
+        }
+
+def create_worker_app(update_queue):
+    """
+    Per-worker metrics and stats. Handlers run in the workers, so their metrics, pool and
+    caches live here rather than in the API process; each worker serves them on
+    WORKER_METRICS_PORT + index for Prometheus to scrape as its own target.
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+    from app.bot.dispatcher import db_session_middleware
+    from app.bot.outbox import outbox_sender
+    from app.bot.ratelimit import outbound_limiter
+    from app.core.metrics import registry
+    from app.db.session import engine
+    from app.services.cache_listener import conversation_cache_listener
+    from app.services.conversation_service import conversation_cache
+    from app.services.event_journal import event_journal
+    from app.services.message_journal import message_journal
+    from app.services.message_link_service import message_link_cache
+    from app.services.user_service import user_cache
+
+    registry.gauge("update_queue_depth", "Updates waiting in the update queue (or for worker processes)", update_queue.depth)
+    registry.gauge("update_queue_in_flight", "Updates currently being handled", lambda: update_queue.scheduler.in_flight())
+    registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool", lambda: engine.pool.checkedout())
+    registry.gauge("outbound_global_waiters", "Bot API calls waiting for the global rate limit", lambda: outbound_limiter.global_bucket.waiting())
+
+    app = FastAPI(title="Digital Support Bot worker", openapi_url=None)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/ingest/stats")
+    async def ingest_stats():
+        return update_queue.stats()
+
+    @app.get("/outbound/stats")
+    async def outbound_stats():
+        return outbound_limiter.stats()
+
+    @app.get("/db/stats")
+    async def db_stats():
+        pool = engine.pool
+        return {
+            **db_session_middleware.stats(),
+            "pool": {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow()},
+        }
+
+    @app.get("/outbox/stats")
+    async def outbox_stats():
+        return outbox_sender.stats()
+
+    @app.get("/audit/stats")
+    async def audit_stats():
+        return event_journal.stats()
+
+    @app.get("/journal/stats")
+    async def journal_stats():
+        return message_journal.stats()
+
+    @app.get("/cache/stats")
+    async def cache_stats():
+        return {
+            "users": user_cache.stats(),
+            "conversations": {**conversation_cache.stats(), "listener": conversation_cache_listener.stats()},
+            "message_links": message_link_cache.stats(),
+        }
+
+    return app
+
+async def _serve_stats(app, port: int) -> tuple:
+    import uvicorn
+
+    class StatsServer(uvicorn.Server):
+        # The supervisor drives shutdown; leave the worker's signal handling alone
+        def capture_signals(self):
+            return contextlib.nullcontext()
+
+    server = StatsServer(uvicorn.Config(app, host="0.0.0.0", port=port, lifespan="off", log_level="warning"))
+    return server, asyncio.create_task(server.serve(), name="worker-stats")
+
+def run_worker(index: int, workers: int, updates: multiprocessing.Queue):
+    """Worker process entry point."""
+    # Ctrl+C reaches the whole process group; shutdown is driven by the supervisor's sentinel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from app.core.logging import setup_logging
+    setup_logging()
+    asyncio.run(_worker_main(index, workers, updates))
+
+async def _worker_main(index: int, workers: int, updates: multiprocessing.Queue):
+    from app.bot.dispatcher import get_bot_dispatcher
+    from app.bot.ingest import UpdateQueue
+    from app.bot.outbox import outbox_sender
+    from app.bot.ratelimit import TokenBucket, outbound_limiter
+    from app.bot.recorder import update_recorder
+    from app.core.tracing import configure_export
+    from app.db.session import engine
+    from app.services.cache_listener import conversation_cache_listener
+    from app.services.event_journal import event_journal
+    from app.services.message_journal import message_journal
+
+    # Telegram's limits are per bot, not per process: each worker gets its share. The
+    # agent group is written to by every worker, so its budget is split too.
+    global_rate = settings.TELEGRAM_GLOBAL_RATE / workers
+    outbound_limiter.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+    outbound_limiter.group_per_minute = settings.TELEGRAM_GROUP_PER_MINUTE / workers
+
+    # Spans are recorded where handlers run; a file export gets one file per worker like the recorder
+    span_exporter = configure_export(
+        path=f"{settings.TRACE_EXPORT_PATH}.worker{index}" if settings.TRACE_EXPORT_PATH else None,
+        endpoint=settings.TRACE_OTLP_ENDPOINT,
+    )
+    if span_exporter:
+        span_exporter.start()
+
+    bot, dp = await get_bot_dispatcher()
+    update_queue = UpdateQueue(
+        bot,
+        dp,
+        maxsize=settings.UPDATE_QUEUE_SIZE,
+        shards=settings.UPDATE_SHARDS,
+        shard_concurrency=settings.UPDATE_SHARD_CONCURRENCY,
+        album_window=settings.ALBUM_WINDOW_MS / 1000,
+    )
+    update_queue.start()
+    if settings.MESSAGE_JOURNAL_ENABLED:
+        message_journal.start()
+    event_journal.start()
+    if settings.CONVERSATION_CACHE_LISTEN:
+        # The agent group and customer chats live on different workers: a /close on one must reach the other
+        conversation_cache_listener.start()
+    if settings.OUTBOX_ENABLED:
+        outbox_sender.start(bot)
+    if update_recorder:
+        update_recorder.path = f"{update_recorder.path}.worker{index}"
+        update_recorder.start()
+
+    stats_server = None
+    if settings.WORKER_METRICS_PORT:
+        stats_server, stats_task = await _serve_stats(create_worker_app(update_queue), settings.WORKER_METRICS_PORT + index)
+
+    loop = asyncio.get_running_loop()
+
+    def read():
+        # Blocking reads on a thread; waiting on the put keeps backpressure end to end
+        while (data := updates.get()) is not None:
+            update = Update.model_validate_json(data, context={"bot": bot})
+            asyncio.run_coroutine_threadsafe(update_queue.put(update), loop).result()
+
+    logger.info(f"Worker {index} ready")
+    await asyncio.to_thread(read)
+
+    await update_queue.stop(timeout=settings.UPDATE_DRAIN_TIMEOUT)
+    if stats_server:
+        stats_server.should_exit = True
+        await stats_task
+    await outbox_sender.stop()
+    if message_journal.running:
+        await message_journal.stop()
+    await event_journal.stop()
+    await conversation_cache_listener.stop()
+    if update_recorder:
+        await update_recorder.stop()
+    if span_exporter:
+        await span_exporter.stop()
+    await bot.session.close()
+    await engine.dispose()
+    logger.info(f"Worker {index} stopped")
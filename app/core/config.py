@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import PostgresDsn, computed_field
-from typing import Optional
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True)
@@ -8,11 +8,87 @@ class Settings(BaseSettings):
     # App
     LOG_LEVEL: str = "INFO"
     SECRET_KEY: str = "unsafe_secret"
+    ADMIN_TOKEN: Optional[str] = None # Bearer token for endpoints exposing conversation data (audit trail)
     
     # Telegram
     BOT_TOKEN: str
     AGENT_GROUP_ID: int
 
+    # Outbound Bot API limits (see https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this)
+    TELEGRAM_GLOBAL_RATE: float = 30 # Requests per second across all chats
+    TELEGRAM_GROUP_PER_MINUTE: float = 20 # Per group/supergroup
+    TELEGRAM_PRIVATE_RATE: float = 1 # Per second per private chat
+    TELEGRAM_RETRY_AFTER_RETRIES: int = 3
+
+    # Update ingestion
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    WEBHOOK_BASE_URL: Optional[str] = None # Public HTTPS base URL Telegram can reach
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: Optional[str] = None # Checked against X-Telegram-Bot-Api-Secret-Token
+    UPDATE_QUEUE_SIZE: int = 1000 # Split evenly across shards
+    UPDATE_SHARDS: int = 4 # Chats are hashed onto shards
+    UPDATE_SHARD_CONCURRENCY: int = 4 # Max chats in flight per shard
+    UPDATE_DRAIN_TIMEOUT: float = 10.0 # Seconds to drain the queue on shutdown
+    ALBUM_WINDOW_MS: int = 300 # Wait this long after the last album part before handling the album
+    WORKER_PROCESSES: int = 0 # >0: hand updates to this many worker processes, sharded by chat
+    WORKER_QUEUE_SIZE: int = 1000 # Updates waiting for workers, split evenly across them
+    WORKER_METRICS_PORT: int = 9100 # Worker N serves /metrics and its stats on this port + N; 0 = off
+    POLLING_LEADER_ELECTION: bool = True # Only the replica holding a Postgres advisory lock polls
+    POLLING_LOCK_KEY: int = 7_215_493_001 # Advisory lock id; distinct per bot sharing a database
+    POLLING_HEARTBEAT_INTERVAL: float = 2.0 # Seconds between leader lock-connection pings
+    POLLING_RETRY_INTERVAL: float = 2.0 # Seconds between standby attempts to take the lock
+
+    # Tracing: one summary log line per update; spans exported as OTLP/JSON if either is set
+    TRACE_EXPORT_PATH: Optional[str] = None # Append spans as JSON lines to this file
+    TRACE_OTLP_ENDPOINT: Optional[str] = None # Collector base URL, e.g. http://localhost:4318
+
+    # Anonymised update recording for benchmarks.replay (gzip JSONL); off when unset
+    UPDATE_RECORD_PATH: Optional[str] = None
+
+    # Agent commands
+    LIST_PAGE_SIZE: int = 20 # Conversations per /list page
+    LOCK_LEASE_SECONDS: float = 1800 # Locks expire unless renewed by a reply; 0 = never expire
+    DASHBOARD_ENABLED: bool = True # Pinned queue summary in the agent group
+    DASHBOARD_MIN_INTERVAL: float = 20.0 # Seconds between dashboard edits
+
+    # Idle conversation sweeper
+    IDLE_CLOSE_HOURS: float = 72 # Close conversations with no message for this long; 0 = never
+    IDLE_SWEEP_INTERVAL: float = 300 # Seconds between sweeps
+    IDLE_SWEEP_BATCH_SIZE: int = 200 # Conversations closed per UPDATE
+    TOPIC_CLOSE_PER_MINUTE: float = 6 # Forum topics closed per minute, leaving the group's budget to replies
+
+    # Forum topics
+    TOPIC_CACHE_SIZE: int = 10000
+    TOPIC_CACHE_TTL: float = 86400 # Seconds before a topic name is re-synced
+
+    # Caches
+    USER_CACHE_SIZE: int = 50000
+    USER_CACHE_TTL: float = 600 # Seconds before a cached user is re-upserted
+    CONVERSATION_CACHE_SIZE: int = 10000
+    CONVERSATION_CACHE_TTL: float = 300 # Bounds staleness if another process changed a conversation
+    CONVERSATION_CACHE_LISTEN: bool = True # Drop entries closed/re-topiced by other processes (Postgres LISTEN/NOTIFY)
+    MESSAGE_LINK_CACHE_SIZE: int = 100000 # Relayed message -> counterpart, for reply routing and edit sync
+    MESSAGE_LINK_CACHE_TTL: float = 86400
+
+    # Write-behind message journal
+    MESSAGE_JOURNAL_ENABLED: bool = False
+    MESSAGE_JOURNAL_FLUSH_MS: int = 200 # Also the max window of messages lost on a crash
+    MESSAGE_JOURNAL_BATCH_SIZE: int = 500 # Flush early once this many rows are buffered
+    MESSAGE_JOURNAL_MAX_BUFFER: int = 10000 # Handlers wait on a flush beyond this
+
+    # Audit trail (conversation_events), written behind like the message journal
+    EVENT_JOURNAL_FLUSH_MS: int = 1000
+    EVENT_JOURNAL_MAX_BUFFER: int = 10000 # Events beyond this are dropped, never waited on
+
+    # Outbox: customer messages are stored with their delivery and relayed by a background sender
+    OUTBOX_ENABLED: bool = False
+    OUTBOX_BATCH_SIZE: int = 100 # Rows claimed per round (at most one per conversation)
+    OUTBOX_CONCURRENCY: int = 16 # Deliveries in flight per process
+    OUTBOX_LEASE_SECONDS: float = 60 # Claim lease, renewed while a delivery is in flight; reclaimable once expired
+    OUTBOX_POLL_INTERVAL: float = 0.5 # Seconds between polls for rows written by other processes
+    OUTBOX_MAX_ATTEMPTS: int = 8 # Then the row is marked failed
+    OUTBOX_RETENTION_HOURS: float = 24 # Delivered rows kept this long for idempotency
+
     # Database
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
@@ -32,4 +108,11 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         ))
 
+    @computed_field
+    @property
+    def WEBHOOK_URL(self) -> str | None:
+        if not self.WEBHOOK_BASE_URL:
+            return None
+        return self.WEBHOOK_BASE_URL.rstrip("/") + self.WEBHOOK_PATH
+
 settings = Settings()
@@ -0,0 +1,143 @@
+import bisect
+from typing import Callable
+
+# Latency buckets in seconds, from a fast cache hit up to a throttled Bot API call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+class Counter:
+    """Monotonic counter, one series per label-value tuple."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+class Histogram:
+    """
+    Cumulative-bucket histogram. Observing is a bisect plus two additions, so it is
+    cheap enough for every update and every Bot API call.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, labels, f'le="{le}"'), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), count
+
+class Gauge:
+    """Gauge read from a callback at scrape time, so the hot path does no bookkeeping."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, "", self.callback()
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds", "Time spent in an update handler", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handlers that raised", ("handler",)
+)
+telegram_request_duration = registry.histogram(
+    "telegram_api_request_duration_seconds", "Bot API request latency, excluding local rate limiting", ("method",)
+)
+telegram_request_errors = registry.counter(
+    "telegram_api_request_errors_total", "Failed Bot API requests", ("method", "error")
+)
+db_pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time waiting for a connection from the SQLAlchemy pool"
+)
+db_statement_duration = registry.histogram(
+    "db_statement_duration_seconds", "SQL statement execution time", ("statement",)
+)
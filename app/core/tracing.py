@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import aiohttp
+import structlog
+
+logger = logging.getLogger(__name__)
+summary_logger = structlog.get_logger("app.trace")
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_CLIENT = 3
+
+@dataclass(slots=True)
+class Span:
+    span_id: str
+    parent_id: str | None
+    name: str
+    category: str # "update", "db", "api", "wait"
+    start_ns: int
+    duration_ns: int = 0
+    error: str | None = None
+    attributes: dict = field(default_factory=dict)
+
+@dataclass(slots=True)
+class Trace:
+    trace_id: str
+    spans: list[Span] = field(default_factory=list)
+
+    def breakdown(self) -> dict[str, float]:
+        """
+        Milliseconds per category, counting a span only when its parent is of a different
+        category so nested service calls (create_conversation -> get_by_id) aren't counted twice.
+        """
+        by_id = {record.span_id: record for record in self.spans}
+        totals: dict[str, int] = {}
+        for record in self.spans:
+            parent = by_id.get(record.parent_id) if record.parent_id else None
+            if parent is not None and parent.category == record.category:
+                continue
+            totals[record.category] = totals.get(record.category, 0) + record.duration_ns
+        return {category: round(ns / 1e6, 2) for category, ns in totals.items()}
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+@contextmanager
+def span(name: str, category: str, **attributes):
+    """Time the block as a child of the current span. A no-op outside a traced update."""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = current_span.get()
+    record = Span(
+        span_id=_new_id(8),
+        parent_id=parent.span_id if parent else None,
+        name=name,
+        category=category,
+        start_ns=time.time_ns(),
+        attributes=attributes,
+    )
+    trace.spans.append(record)
+    token = current_span.set(record)
+    started = time.perf_counter_ns()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.duration_ns = time.perf_counter_ns() - started
+        current_span.reset(token)
+
+def traced(category: str):
+    """Class decorator timing every public coroutine method as a `Class.method` span."""
+    def decorate(cls):
+        for attr, method in list(vars(cls).items()):
+            if attr.startswith("_") or not inspect.iscoroutinefunction(method):
+                continue
+            setattr(cls, attr, _wrap(method, f"{cls.__name__}.{attr}", category))
+        return cls
+    return decorate
+
+def _wrap(method, name: str, category: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if current_trace.get() is None:
+            return await method(*args, **kwargs)
+        with span(name, category):
+            return await method(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def trace_update(update_id: int, **attributes):
+    """
+    Root span for one update. Binds the trace id into structlog contextvars and logs a
+    single summary with the db/api/wait breakdown when the update is done.
+    """
+    trace = Trace(trace_id=_new_id(16))
+    trace_token = current_trace.set(trace)
+    structlog.contextvars.bind_contextvars(trace_id=trace.trace_id, update_id=update_id)
+    try:
+        with span("update", "update", update_id=update_id, **attributes) as root:
+            yield root
+    finally:
+        current_trace.reset(trace_token)
+        structlog.contextvars.unbind_contextvars("trace_id", "update_id")
+
+        breakdown = trace.breakdown()
+        total = breakdown.pop("update", 0.0)
+        summary_logger.info(
+            "update_trace",
+            trace_id=trace.trace_id,
+            update_id=update_id,
+            handler=root.attributes.get("handler"),
+            total_ms=total,
+            db_ms=breakdown.get("db", 0.0),
+            api_ms=breakdown.get("api", 0.0),
+            wait_ms=breakdown.get("wait", 0.0),
+            other_ms=round(total - sum(breakdown.values()), 2),
+            spans=len(trace.spans),
+            error=root.error,
+        )
+        if span_exporter is not None:
+            span_exporter.export(trace)
+
+def annotate(**attributes):
+    """Attach attributes to the root span of the current update, e.g. the matched handler."""
+    trace = current_trace.get()
+    if trace is not None and trace.spans:
+        trace.spans[0].attributes.update(attributes)
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def to_otlp(traces: list[Trace], service_name: str = "digital-support-bot") -> dict:
+    """Encode traces as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for trace in traces:
+        for record in trace.spans:
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": record.span_id,
+                "parentSpanId": record.parent_id or "",
+                "name": record.name,
+                "kind": KIND_CLIENT if record.category in ("db", "api") else KIND_INTERNAL,
+                "startTimeUnixNano": str(record.start_ns),
+                "endTimeUnixNano": str(record.start_ns + record.duration_ns),
+                "attributes": [_attribute("category", record.category)]
+                + [_attribute(k, v) for k, v in record.attributes.items() if v is not None],
+                "status": {"code": 2, "message": record.error} if record.error else {},
+            })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": spans}],
+        }]
+    }
+
+class SpanExporter:
+    """
+    Buffers finished traces and ships them in OTLP/JSON from a background task, either
+    appended as JSON lines to a file (the OpenTelemetry Collector file format) or
+    POSTed to a collector's `/v1/traces` endpoint.
+    """
+
+    def __init__(self, path: str | None = None, endpoint: str | None = None, flush_interval: float = 1.0, max_buffer: int = 10000):
+        self.path = path
+        self.endpoint = endpoint
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: list[Trace] = []
+        self._task: asyncio.Task | None = None
+        self.exported = 0
+        self.dropped = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="span-exporter")
+        logger.info(f"Span export to {self.endpoint or self.path}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def export(self, trace: Trace):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(trace)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        traces, self._buffer = self._buffer, []
+        payload = json.dumps(to_otlp(traces))
+        try:
+            if self.endpoint:
+                await self._post(payload)
+            else:
+                await asyncio.to_thread(self._append, payload)
+            self.exported += len(traces)
+        except Exception as e:
+            self.dropped += len(traces)
+            logger.error(f"Span export failed, dropped {len(traces)} traces: {e}")
+
+    def _append(self, payload: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+    async def _post(self, payload: str):
+        async with aiohttp.ClientSession() as client:
+            async with client.post(
+                self.endpoint.rstrip("/") + "/v1/traces",
+                data=payload,
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                response.raise_for_status()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+span_exporter: SpanExporter | None = None
+
+def configure_export(path: str | None = None, endpoint: str | None = None) -> SpanExporter | None:
+    global span_exporter
+    span_exporter = SpanExporter(path=path, endpoint=endpoint) if (path or endpoint) else None
+    return span_exporter
@@ -1,12 +1,43 @@
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import db_pool_checkout_wait, db_statement_duration
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Default async pool, recording how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started)
 
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=False,
-    future=True
+    future=True,
+    poolclass=TimedQueuePool,
 )
 
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["statement_started"].pop()
+    # Label by verb only (SELECT/INSERT/UPDATE/WITH...) to keep the series count bounded
+    db_statement_duration.observe(time.perf_counter() - started, statement.lstrip().split(None, 1)[0].upper())
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _statement_failed(context):
+    started = context.connection.info.get("statement_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
 SessionLocal = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
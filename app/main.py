@@ -1,11 +1,33 @@
 import asyncio
 import logging
+import secrets
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, APIRouter
+import uuid
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from aiogram.types import Update
 from app.core.config import settings
 from app.core.logging import setup_logging
-from app.bot.dispatcher import get_bot_dispatcher
-from app.db.session import engine
+from app.core.metrics import registry
+from app.core.tracing import configure_export
+from app.bot.dispatcher import get_bot_dispatcher, db_session_middleware
+from app.bot.dashboard import queue_dashboard
+from app.bot.ingest import UpdateQueue, poll_updates
+from app.bot.leader import polling_leader
+from app.bot.outbox import outbox_sender
+from app.bot.ratelimit import outbound_limiter
+from app.bot.recorder import update_recorder
+from app.bot.sweeper import idle_sweeper
+from app.bot.workers import WorkerPool
+from app.db.session import engine, SessionLocal, get_db
+from app.services.analytics_service import AnalyticsService
+from app.services.user_service import user_cache
+from app.services.cache_listener import conversation_cache_listener
+from app.services.conversation_service import ConversationService, conversation_cache
+from app.services.event_journal import event_journal
+from app.services.message_journal import message_journal
+from app.services.message_link_service import message_link_cache
 
 # Setup Logging
 setup_logging()
@@ -15,49 +37,161 @@ logger = logging.getLogger(__name__)
 bot_ref = None
 dp_ref = None
 polling_task = None
+update_queue = None
 
 async def start_bot():
-    global bot_ref, dp_ref
+    global bot_ref, dp_ref, update_queue
     bot, dp = await get_bot_dispatcher()
     bot_ref = bot
     dp_ref = dp
-    
+
+    if settings.WORKER_PROCESSES > 0:
+        # Handlers run in worker processes; this one only ingests
+        update_queue = WorkerPool(settings.WORKER_PROCESSES, maxsize=settings.WORKER_QUEUE_SIZE)
+    else:
+        update_queue = UpdateQueue(
+            bot,
+            dp,
+            maxsize=settings.UPDATE_QUEUE_SIZE,
+            shards=settings.UPDATE_SHARDS,
+            shard_concurrency=settings.UPDATE_SHARD_CONCURRENCY,
+            album_window=settings.ALBUM_WINDOW_MS / 1000,
+        )
+    update_queue.start()
+    return bot, dp
+
+async def run_polling(bot, dp, drop_pending_updates: bool = True):
     # Drop pending updates to avoid potential issues on restart (optional)
-    await bot.delete_webhook(drop_pending_updates=True)
-    
+    await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+
     logger.info("🤖 Starting Bot Polling...")
     try:
-        await dp.start_polling(bot)
+        await poll_updates(bot, update_queue, allowed_updates=dp.resolve_used_update_types())
     except asyncio.CancelledError:
         logger.info("🛑 Bot Polling Cancelled")
+
+async def start_dashboard(bot):
+    try:
+        await queue_dashboard.start(bot, SessionLocal)
+    except Exception as e:
+        logger.warning(f"Queue dashboard disabled: {e}")
+
+def dashboard_enabled() -> bool:
+    # The dashboard's index is fed by this process' handlers, which worker mode moves elsewhere
+    return settings.DASHBOARD_ENABLED and settings.WORKER_PROCESSES == 0
+
+async def lead_polling(bot, dp):
+    """
+    Runs while this replica is the polling leader: polling, plus the dashboard fed by its
+    updates and the idle sweeper, whose topic closes share the group's send budget.
+    """
+    if dashboard_enabled():
+        await start_dashboard(bot)
+    if settings.IDLE_CLOSE_HOURS > 0:
+        idle_sweeper.start(bot)
+    try:
+        # Updates that arrived during a failover belong to us now
+        await run_polling(bot, dp, drop_pending_updates=False)
     finally:
-        await bot.session.close()
+        await idle_sweeper.stop()
+        await queue_dashboard.stop()
+
+async def start_webhook(bot, dp):
+    if not settings.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_BASE_URL must be set when BOT_MODE=webhook")
+
+    # Pending updates are kept: Telegram holds them while we restart
+    await bot.set_webhook(
+        url=settings.WEBHOOK_URL,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"🌐 Webhook set to {settings.WEBHOOK_URL}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 API Startup")
-    
-    # Start Bot in Background Task
-    global polling_task
-    polling_task = asyncio.create_task(start_bot())
-    
+    span_exporter = configure_export(path=settings.TRACE_EXPORT_PATH, endpoint=settings.TRACE_OTLP_ENDPOINT)
+    if span_exporter:
+        span_exporter.start()
+    if update_recorder and settings.WORKER_PROCESSES == 0:
+        update_recorder.start()
+    if settings.MESSAGE_JOURNAL_ENABLED and settings.WORKER_PROCESSES == 0:
+        message_journal.start()
+    event_journal.start()
+    if settings.CONVERSATION_CACHE_LISTEN:
+        conversation_cache_listener.start()
+    bot, dp = await start_bot()
+    if settings.DASHBOARD_ENABLED and not dashboard_enabled():
+        logger.warning("Queue dashboard disabled: it needs the handlers in this process, unset WORKER_PROCESSES to use it")
+    if dashboard_enabled() and not (settings.BOT_MODE == "polling" and settings.POLLING_LEADER_ELECTION):
+        await start_dashboard(bot)
+    if settings.OUTBOX_ENABLED and settings.WORKER_PROCESSES == 0:
+        outbox_sender.start(bot)
+    if settings.IDLE_CLOSE_HOURS > 0 and not (settings.BOT_MODE == "polling" and settings.POLLING_LEADER_ELECTION):
+        idle_sweeper.start(bot)
+
+    if settings.BOT_MODE == "webhook":
+        await start_webhook(bot, dp)
+    elif settings.POLLING_LEADER_ELECTION:
+        # Standbys keep serving the API and take over polling if the leader goes away
+        polling_leader.start(lambda: lead_polling(bot, dp))
+    else:
+        # Start Polling in Background Task
+        global polling_task
+        polling_task = asyncio.create_task(run_polling(bot, dp))
+
     yield
-    
+
     # Shutdown
     logger.info("🛑 API Shutdown")
-    if dp_ref:
-        await dp_ref.stop_polling()
     if polling_task:
         polling_task.cancel()
         try:
             await polling_task
         except asyncio.CancelledError:
             pass
-            
+    await polling_leader.stop()
+    if update_queue:
+        await update_queue.stop(timeout=settings.UPDATE_DRAIN_TIMEOUT)
+    await queue_dashboard.stop()
+    await idle_sweeper.stop()
+    await outbox_sender.stop()
+    if bot_ref:
+        await bot_ref.session.close()
+    if message_journal.running:
+        await message_journal.stop()
+    await event_journal.stop()
+    await conversation_cache_listener.stop()
+    if span_exporter:
+        await span_exporter.stop()
+    if update_recorder and settings.WORKER_PROCESSES == 0:
+        await update_recorder.stop()
+
     # Close DB Engine
     await engine.dispose()
 
+# Scrape-time gauges: read current state instead of tracking it per update
+registry.gauge("update_queue_depth", "Updates waiting in the update queue (or for worker processes)", lambda: update_queue.depth() if update_queue else 0)
+registry.gauge("update_queue_in_flight", "Updates currently being handled", lambda: update_queue.scheduler.in_flight() if isinstance(update_queue, UpdateQueue) else 0)
+registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool", lambda: engine.pool.checkedout())
+registry.gauge("polling_leader", "1 while this replica holds the polling lock", lambda: int(polling_leader.is_leader))
+registry.gauge("outbound_global_waiters", "Bot API calls waiting for the global rate limit", lambda: outbound_limiter.global_bucket.waiting())
+
+def require_admin(authorization: str | None = Header(default=None)):
+    """Endpoints exposing conversation data need `Authorization: Bearer <ADMIN_TOKEN>`; without a token set they are off."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to enable this endpoint")
+    if not secrets.compare_digest((authorization or "").encode(), f"Bearer {settings.ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def naive_utc(value: datetime | None) -> datetime | None:
+    """Query datetimes may carry an offset; the columns are naive UTC."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 def create_app() -> FastAPI:
     app = FastAPI(title="Digital Support Bot API", lifespan=lifespan, version="1.0.0")
 
@@ -65,7 +199,123 @@ def create_app() -> FastAPI:
     @app.get("/health")
     async def health_check():
         return {"status": "ok"}
-        
+
+    # Whether this replica currently polls Telegram
+    @app.get("/leader/stats")
+    async def leader_stats():
+        return polling_leader.stats()
+
+    # Ingestion backpressure stats (empty in polling mode)
+    @app.get("/ingest/stats")
+    async def ingest_stats():
+        return update_queue.stats() if update_queue else {}
+
+    # Outbound Bot API throttling counters
+    @app.get("/outbound/stats")
+    async def outbound_stats():
+        return outbound_limiter.stats()
+
+    # How many updates needed a DB session, and connection pool usage
+    @app.get("/db/stats")
+    async def db_stats():
+        pool = engine.pool
+        return {
+            **db_session_middleware.stats(),
+            "pool": {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            },
+        }
+
+    # Prometheus text format
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    # Open/waiting/locked counts behind the pinned dashboard
+    @app.get("/queue/stats")
+    async def queue_stats():
+        return queue_dashboard.stats()
+
+    # Conversations auto-closed for inactivity and their topic closing backlog
+    @app.get("/sweeper/stats")
+    async def sweeper_stats():
+        return idle_sweeper.stats()
+
+    # Deliveries made by this process' outbox sender
+    @app.get("/outbox/stats")
+    async def outbox_stats():
+        return outbox_sender.stats()
+
+    # Audit trail of a conversation, newest first
+    @app.get("/conversations/{conversation_id}/events", dependencies=[Depends(require_admin)])
+    async def conversation_events(
+        conversation_id: uuid.UUID,
+        limit: int = Query(100, ge=1, le=1000),
+        before: datetime | None = None,
+        before_id: uuid.UUID | None = None,
+        session=Depends(get_db),
+    ):
+        # Next page: the last event's created_at and id
+        if (before is None) != (before_id is None):
+            raise HTTPException(status_code=422, detail="before and before_id go together")
+        await event_journal.flush() # Include events still buffered in this process
+        events = await ConversationService(session).get_timeline(
+            conversation_id, limit=limit, before=(naive_utc(before), before_id) if before else None
+        )
+        return [dict(event._mapping) for event in events]
+
+    # Write-behind message journal: pending, flushed and dropped rows
+    @app.get("/journal/stats")
+    async def journal_stats():
+        return message_journal.stats()
+
+    @app.get("/audit/stats")
+    async def audit_stats():
+        return event_journal.stats()
+
+    # SLA percentiles from the conversation_stats rollup; window defaults to the last `hours`
+    @app.get("/analytics/sla")
+    async def analytics_sla(
+        hours: int = Query(24, ge=1, le=24 * 90),
+        since: datetime | None = None,
+        until: datetime | None = None,
+        session=Depends(get_db),
+    ):
+        await message_journal.flush() # Count messages still buffered in this process
+        until = naive_utc(until) or datetime.utcnow()
+        since = naive_utc(since) or until - timedelta(hours=hours)
+        if since >= until:
+            raise HTTPException(status_code=422, detail="since must be before until")
+        return await AnalyticsService(session).sla(since, until)
+
+    # Process-local cache hit/miss counters
+    @app.get("/cache/stats")
+    async def cache_stats():
+        return {
+            "users": user_cache.stats(),
+            "conversations": {**conversation_cache.stats(), "listener": conversation_cache_listener.stats()},
+            "message_links": message_link_cache.stats(),
+        }
+
+    if settings.BOT_MODE == "webhook":
+        @app.post(settings.WEBHOOK_PATH, include_in_schema=False)
+        async def telegram_webhook(
+            request: Request,
+            x_telegram_bot_api_secret_token: str | None = Header(default=None),
+        ):
+            if settings.WEBHOOK_SECRET and x_telegram_bot_api_secret_token != settings.WEBHOOK_SECRET:
+                raise HTTPException(status_code=403, detail="Invalid secret token")
+            if not update_queue:
+                raise HTTPException(status_code=503, detail="Bot not ready")
+
+            update = Update.model_validate(await request.json(), context={"bot": bot_ref})
+            if not update_queue.put_nowait(update):
+                # Non-2xx makes Telegram redeliver later instead of us buffering unboundedly
+                raise HTTPException(status_code=503, detail="Update queue full")
+            return {"ok": True}
+
     return app
 
 app = create_app()
@@ -1,2 +1,2 @@
 from app.models.user import User, Agent
-from app.models.conversation import Conversation, Message, ConversationEvent
+from app.models.conversation import Conversation, Message, ConversationEvent, MessageLink, OutboxMessage, ConversationStats
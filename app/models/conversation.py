@@ -1,9 +1,9 @@
 import uuid
 import enum
 from datetime import datetime
-from sqlalchemy import BigInteger, DateTime, Enum, String, ForeignKey, Text, CheckConstraint
+from sqlalchemy import BigInteger, Boolean, DateTime, Enum, Integer, String, ForeignKey, Text, CheckConstraint, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import func
 from app.db.base import Base
 from app.models.user import User
@@ -15,12 +15,17 @@ class Conversation(Base):
     customer_id: Mapped[uuid.UUID | None] = mapped_column(ForeignKey("users.id"), index=True)
     status: Mapped[str] = mapped_column(String(20), server_default='open', index=True) # 'open', 'closed'
     locked_by_agent: Mapped[uuid.UUID | None] = mapped_column(ForeignKey("users.id"), nullable=True)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True) # Lock lease; NULL = no expiry
     topic_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True, index=True)
-    last_message_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False))
+    topic_close_pending: Mapped[bool] = mapped_column(Boolean, server_default=text('false'), nullable=False) # Idle-closed, topic still open
+    topic_close_claimed_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True) # Sweeper's lease on the close
+    last_message_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), server_default=func.now())
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), server_default=func.now())
 
     __table_args__ = (
         CheckConstraint("status IN ('open', 'closed')", name='conversations_status_check'),
+        Index('ix_conversations_status_last_message_at', 'status', 'last_message_at'), # Idle sweeper
+        Index('ix_conversations_topic_close_pending', 'last_message_at', 'id', postgresql_where=text("topic_close_pending")),
     )
 
     # Relationships
@@ -57,3 +62,74 @@ class ConversationEvent(Base):
     event_by: Mapped[uuid.UUID | None] = mapped_column(ForeignKey("users.id"))
     details: Mapped[str | None] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_conversation_events_timeline', 'conversation_id', 'created_at', 'id'), # Timeline keyset
+    )
+
+class MessageLink(Base):
+    """
+    A message the bot relayed, keyed by where it lives, pointing at its counterpart on
+    the other side. Each copy is stored in both directions so either side resolves
+    with one primary-key lookup.
+    """
+    __tablename__ = "message_links"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    message_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    conversation_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
+    peer_chat_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    peer_message_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), server_default=func.now())
+
+class OutboxMessage(Base):
+    """
+    A relay to Telegram, written in the same transaction as the message it carries and
+    delivered later by the OutboxSender. Rows of a conversation are delivered one at a
+    time in `id` order; delivered rows are kept for a while so a redelivered update
+    still hits its idempotency key.
+    """
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    idempotency_key: Mapped[str] = mapped_column(String(64), unique=True, nullable=False) # Source chat:message
+    conversation_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    kind: Mapped[str] = mapped_column(String(30), nullable=False) # Selects the OutboxSender handler
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    status: Mapped[str] = mapped_column(String(10), server_default='pending', nullable=False) # 'pending', 'sending', 'sent', 'failed'
+    attempts: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), server_default=func.now(), nullable=False)
+    claimed_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True) # Lease of a 'sending' row
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), server_default=func.now())
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("status IN ('pending', 'sending', 'sent', 'failed')", name='outbox_status_check'),
+        # Only undelivered rows are ever scanned
+        Index('ix_outbox_undelivered', 'conversation_id', 'id', postgresql_where=text("status IN ('pending', 'sending')")),
+        Index('ix_outbox_sent_at', 'sent_at', postgresql_where=text("status = 'sent'")),
+    )
+
+class ConversationStats(Base):
+    """
+    Per-conversation SLA aggregates, kept current as messages are stored and conversations
+    close, so response/resolution percentiles never scan `messages`.
+    """
+    __tablename__ = "conversation_stats"
+
+    conversation_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    first_customer_message_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True, index=True)
+    first_agent_reply_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+    closed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+    customer_messages: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+    agent_messages: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+
+    __table_args__ = (
+        # Backlog: waiting for a first reply
+        Index(
+            'ix_conversation_stats_waiting',
+            'first_customer_message_at',
+            postgresql_where=text("first_agent_reply_at IS NULL AND closed_at IS NULL"),
+        ),
+    )
@@ -0,0 +1,105 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.tracing import traced
+from app.models.conversation import ConversationStats
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+def message_stats(conversation_id: uuid.UUID, sender_type: str, count: int, first_at: datetime) -> dict:
+    """Increment for `count` messages from `sender_type`, the earliest sent at `first_at`."""
+    return {
+        "conversation_id": conversation_id,
+        "first_customer_message_at": first_at if sender_type == "customer" else None,
+        "first_agent_reply_at": first_at if sender_type == "agent" else None,
+        "closed_at": None,
+        "customer_messages": count if sender_type == "customer" else 0,
+        "agent_messages": count if sender_type == "agent" else 0,
+    }
+
+def closed_stats(conversation_id: uuid.UUID, closed_at: datetime) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "first_customer_message_at": None,
+        "first_agent_reply_at": None,
+        "closed_at": closed_at,
+        "customer_messages": 0,
+        "agent_messages": 0,
+    }
+
+def upsert_stats() -> Insert:
+    """
+    Merge increments (`message_stats`/`closed_stats` rows, executemany) into the rollup:
+    counts add up, first-message times keep the earliest, closed_at the latest close.
+    Journals in different processes flush out of order, hence LEAST/GREATEST (which
+    skip NULLs) rather than first-write-wins.
+    """
+    stmt = insert(ConversationStats)
+    return stmt.on_conflict_do_update(
+        index_elements=[ConversationStats.conversation_id],
+        set_={
+            "first_customer_message_at": func.least(ConversationStats.first_customer_message_at, stmt.excluded.first_customer_message_at),
+            "first_agent_reply_at": func.least(ConversationStats.first_agent_reply_at, stmt.excluded.first_agent_reply_at),
+            "closed_at": func.greatest(ConversationStats.closed_at, stmt.excluded.closed_at),
+            "customer_messages": ConversationStats.customer_messages + stmt.excluded.customer_messages,
+            "agent_messages": ConversationStats.agent_messages + stmt.excluded.agent_messages,
+        },
+    )
+
+def _seconds(later, earlier):
+    return func.extract("epoch", later - earlier)
+
+def _percentile_columns(name: str, seconds) -> list:
+    columns = [func.count(seconds).label(f"{name}_n")]
+    for p in PERCENTILES:
+        columns.append(func.percentile_cont(p).within_group(seconds).label(f"{name}_p{int(p * 100)}"))
+    return columns
+
+def _summary(row, name: str) -> dict:
+    summary = {"n": getattr(row, f"{name}_n")}
+    for p in PERCENTILES:
+        value = getattr(row, f"{name}_p{int(p * 100)}")
+        summary[f"p{int(p * 100)}"] = round(float(value), 1) if value is not None else None
+    return summary
+
+@traced("db")
+class AnalyticsService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def sla(self, since: datetime, until: datetime) -> dict:
+        """
+        Percentiles (seconds) over conversations whose first customer message falls in
+        [since, until): first response, resolution (first message -> close) and agent
+        handle time (first reply -> close); plus the current backlog of conversations
+        still waiting for a first reply. Two aggregate queries on conversation_stats.
+        """
+        stats = ConversationStats
+        window = (
+            select(
+                func.count().label("conversations"),
+                *_percentile_columns("first_response", _seconds(stats.first_agent_reply_at, stats.first_customer_message_at)),
+                *_percentile_columns("resolution", _seconds(stats.closed_at, stats.first_customer_message_at)),
+                *_percentile_columns("handle", _seconds(stats.closed_at, stats.first_agent_reply_at)),
+            )
+            .where(stats.first_customer_message_at >= since, stats.first_customer_message_at < until)
+        )
+        row = (await self.session.execute(window)).one()
+
+        backlog = (
+            select(*_percentile_columns("waiting", _seconds(func.now(), stats.first_customer_message_at)))
+            .where(stats.first_agent_reply_at.is_(None), stats.closed_at.is_(None), stats.first_customer_message_at.is_not(None))
+        )
+        waiting = (await self.session.execute(backlog)).one()
+
+        return {
+            "since": since,
+            "until": until,
+            "conversations": row.conversations,
+            "first_response_seconds": _summary(row, "first_response"),
+            "resolution_seconds": _summary(row, "resolution"),
+            "handle_seconds": _summary(row, "handle"),
+            "backlog_age_seconds": _summary(waiting, "waiting"),
+        }
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import uuid
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+from app.services.conversation_service import CACHE_CHANNEL, CACHE_ORIGIN, ConversationCache, OpenQueueIndex, conversation_cache, open_queue
+
+logger = logging.getLogger(__name__)
+
+class ConversationCacheListener:
+    """
+    Keeps this process' ConversationCache coherent with writes made by other processes
+    (worker processes, replicas, the idle sweeper): LISTENs on CACHE_CHANNEL and drops
+    the conversations named in each notice, so the next read reloads them. Closes also
+    reach the open-queue index behind the pinned dashboard. Notices sent
+    while the connection is down are lost, so the whole cache is cleared on every
+    (re)connect; the cache TTL remains the bound only for that window.
+
+    LISTEN holds its connection for good, so it gets a dedicated, unpooled one.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        cache: ConversationCache,
+        queue: OpenQueueIndex | None = None,
+        heartbeat_interval: float = 5.0,
+        retry_interval: float = 2.0,
+    ):
+        self._engine = engine
+        self.cache = cache
+        self.queue = queue
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_interval = retry_interval
+        self._conn: AsyncConnection | None = None
+        self._task: asyncio.Task | None = None
+
+        self.connected = False
+        self.notices = 0
+        self.invalidated = 0
+        self.connects = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="conversation-cache-listener")
+        logger.info(f"Listening for conversation cache invalidations on '{CACHE_CHANNEL}'")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+        await self._engine.dispose()
+
+    def on_notice(self, payload: str):
+        origin, change, ids = (payload.split(" ", 2) + ["", ""])[:3]
+        if origin == CACHE_ORIGIN:
+            return
+        self.notices += 1
+        for value in ids.split(","):
+            try:
+                conversation_id = uuid.UUID(value)
+            except ValueError:
+                continue
+            self.cache.discard(conversation_id)
+            if change == "closed" and self.queue is not None:
+                self.queue.closed(conversation_id)
+            self.invalidated += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Conversation cache listener: {e}")
+            self.connected = False
+            await self._close()
+            await asyncio.sleep(self.retry_interval)
+
+    async def _listen(self):
+        conn = await self._engine.connect()
+        # Notices are only delivered between transactions, so never leave one open
+        self._conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        raw = await self._conn.get_raw_connection()
+        await raw.driver_connection.add_listener(CACHE_CHANNEL, lambda _conn, _pid, _channel, payload: self.on_notice(payload))
+        # Anything written while we weren't listening may be cached stale
+        self.cache.clear()
+        self.connects += 1
+        self.connected = True
+        if self.connects > 1:
+            logger.info("Conversation cache listener reconnected, cache cleared")
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await asyncio.wait_for(self._conn.execute(text("SELECT 1")), timeout=self.heartbeat_interval)
+
+    async def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            await conn.close()
+        except Exception:
+            try:
+                await conn.invalidate()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {"connected": self.connected, "notices": self.notices, "invalidated": self.invalidated, "connects": self.connects}
+
+conversation_cache_listener = ConversationCacheListener(
+    create_async_engine(settings.DATABASE_URL, poolclass=NullPool),
+    conversation_cache,
+    open_queue,
+)
@@ -1,16 +1,183 @@
 import uuid
-from datetime import datetime
+from dataclasses import dataclass
+from typing import Callable
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from sqlalchemy.orm import selectinload
-from app.models.conversation import Conversation, Message
+from sqlalchemy import Row, func, insert, or_, select, tuple_, update
+from sqlalchemy.orm import aliased, selectinload
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.tracing import traced
+from app.models.conversation import Conversation, ConversationEvent, Message, OutboxMessage
 from app.models.user import User
+from app.services.analytics_service import closed_stats, message_stats, upsert_stats
+from app.services.event_journal import event_journal
+from app.services.message_journal import message_journal
 
+class ConversationCache:
+    """
+    Process-local index of open conversations by id, topic_id and customer_id.
+    Entries are detached Conversation objects with `customer` loaded; the service keeps
+    them current write-through. Closes and topic changes made by other processes arrive
+    through ConversationCacheListener; the TTL bounds staleness of anything else.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self._by_id = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._by_topic = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._by_customer = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, conversation_id: uuid.UUID) -> Conversation | None:
+        return self._by_id.get(conversation_id)
+
+    def by_topic(self, topic_id: int) -> Conversation | None:
+        conversation_id = self._by_topic.get(topic_id)
+        conv = self._by_id.get(conversation_id) if conversation_id else None
+        if conv is None or conv.topic_id != topic_id:
+            return None
+        return conv
+
+    def by_customer(self, customer_id: uuid.UUID) -> Conversation | None:
+        conversation_id = self._by_customer.get(customer_id)
+        conv = self._by_id.get(conversation_id) if conversation_id else None
+        if conv is None or conv.customer_id != customer_id:
+            return None
+        return conv
+
+    def put(self, conv: Conversation):
+        if conv.status != "open":
+            self.discard(conv.id)
+            return
+        self._by_id.set(conv.id, conv)
+        self._by_customer.set(conv.customer_id, conv.id)
+        if conv.topic_id:
+            self._by_topic.set(conv.topic_id, conv.id)
+
+    def update(self, conversation_id: uuid.UUID, **values):
+        conv = self._by_id.get(conversation_id)
+        if conv is None:
+            return
+        if "topic_id" in values and conv.topic_id:
+            self._by_topic.pop(conv.topic_id)
+        for key, value in values.items():
+            setattr(conv, key, value)
+        self.put(conv)
+
+    def discard(self, conversation_id: uuid.UUID):
+        conv = self._by_id.pop(conversation_id)
+        if conv is None:
+            return
+        self._by_customer.pop(conv.customer_id)
+        if conv.topic_id:
+            self._by_topic.pop(conv.topic_id)
+
+    def clear(self):
+        self._by_id.clear()
+        self._by_topic.clear()
+        self._by_customer.clear()
+
+    def stats(self) -> dict:
+        return {
+            "by_topic": self._by_topic.stats(),
+            "by_customer": self._by_customer.stats(),
+        }
+
+conversation_cache = ConversationCache(maxsize=settings.CONVERSATION_CACHE_SIZE, ttl=settings.CONVERSATION_CACHE_TTL)
+
+# Other processes (workers, replicas) drop their cached copy of conversations named on this
+# channel, see ConversationCacheListener. Payload: "<origin> <change> <id>,<id>,..." where
+# change is "closed" or "changed"; a process skips its own notices, its state is already current.
+CACHE_CHANNEL = "conversation_cache"
+CACHE_ORIGIN = uuid.uuid4().hex
+
+def agent_display_name(username: str | None, first_name: str | None) -> str:
+    return username or first_name or "Agent"
+
+def lock_is_live(locked_by_agent: uuid.UUID | None, locked_until: datetime | None) -> bool:
+    return locked_by_agent is not None and (locked_until is None or locked_until > datetime.utcnow())
+
+class OpenQueueIndex:
+    """
+    In-memory index of open conversations -> (locking agent's display name, lease end),
+    with no name when waiting. Seeded once from the database and kept current by the
+    service's create, lock, unlock and close paths. Listeners are called on every
+    change, e.g. to schedule a dashboard refresh.
+    """
+
+    def __init__(self):
+        self._open: dict[uuid.UUID, tuple[str | None, datetime | None]] = {}
+        self._listeners: list[Callable[[], None]] = []
+
+    def subscribe(self, listener: Callable[[], None]):
+        self._listeners.append(listener)
+
+    def _changed(self):
+        for listener in self._listeners:
+            listener()
+
+    def load(self, rows: list[tuple[uuid.UUID, str | None, datetime | None]]):
+        self._open = {conv_id: (agent_name, locked_until) for conv_id, agent_name, locked_until in rows}
+        self._changed()
+
+    def opened(self, conversation_id: uuid.UUID):
+        if conversation_id not in self._open:
+            self._open[conversation_id] = (None, None)
+            self._changed()
+
+    def locked(self, conversation_id: uuid.UUID, agent_name: str, locked_until: datetime | None = None):
+        self._open[conversation_id] = (agent_name, locked_until)
+        self._changed()
+
+    def unlocked(self, conversation_id: uuid.UUID):
+        if conversation_id in self._open:
+            self._open[conversation_id] = (None, None)
+            self._changed()
+
+    def closed(self, conversation_id: uuid.UUID):
+        if self._open.pop(conversation_id, False) is not False:
+            self._changed()
+
+    def snapshot(self) -> dict:
+        by_agent: dict[str, int] = {}
+        now = datetime.utcnow()
+        for agent_name, locked_until in self._open.values():
+            # Expired leases count as waiting: anyone can take them over
+            if agent_name is not None and (locked_until is None or locked_until > now):
+                by_agent[agent_name] = by_agent.get(agent_name, 0) + 1
+        locked = sum(by_agent.values())
+        return {
+            "open": len(self._open),
+            "waiting": len(self._open) - locked,
+            "locked": locked,
+            "by_agent": dict(sorted(by_agent.items(), key=lambda item: -item[1])),
+        }
+
+open_queue = OpenQueueIndex()
+
+@dataclass
+class OpenConversationPage:
+    rows: list[Row]
+    has_prev: bool
+    has_next: bool
+
+@traced("db")
 class ConversationService:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    def _cache(self, conv: Conversation | None) -> Conversation | None:
+        # Detach so other sessions can share the object without it being flushed here
+        if conv is not None:
+            self.session.expunge(conv)
+            conversation_cache.put(conv)
+        return conv
+
     async def get_active_conversation(self, customer_id: uuid.UUID) -> Conversation | None:
+        cached = conversation_cache.by_customer(customer_id)
+        if cached:
+            return cached
+
         stmt = (
             select(Conversation)
             .where(Conversation.customer_id == customer_id)
@@ -18,7 +185,7 @@ class ConversationService:
             .options(selectinload(Conversation.customer))
         )
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        return self._cache(result.scalar_one_or_none())
 
     async def get_by_id(self, conversation_id: uuid.UUID) -> Conversation | None:
         stmt = (
@@ -30,6 +197,10 @@ class ConversationService:
         return result.scalar_one_or_none()
 
     async def get_by_topic_id(self, topic_id: int) -> Conversation | None:
+        cached = conversation_cache.by_topic(topic_id)
+        if cached:
+            return cached
+
         stmt = (
             select(Conversation)
             .where(Conversation.topic_id == topic_id)
@@ -37,7 +208,7 @@ class ConversationService:
             .options(selectinload(Conversation.customer), selectinload(Conversation.locker))
         )
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        return self._cache(result.scalar_one_or_none())
 
     async def create_conversation(self, customer_id: uuid.UUID) -> Conversation:
         active = await self.get_active_conversation(customer_id)
@@ -47,8 +218,17 @@ class ConversationService:
         conversation = Conversation(customer_id=customer_id, status="open")
         self.session.add(conversation)
         await self.session.commit()
-        await self.session.refresh(conversation)
-        return conversation
+        # Reload with relationships so the cached copy is complete
+        self.session.expunge(conversation)
+        conversation = await self.get_by_id(conversation.id)
+        open_queue.opened(conversation.id)
+        return self._cache(conversation)
+
+    async def _invalidate_elsewhere(self, conversation_ids: list[uuid.UUID], change: str = "changed"):
+        """Notify other processes' caches; Postgres delivers the notice when this transaction commits."""
+        for i in range(0, len(conversation_ids), 100): # NOTIFY payloads are capped at 8000 bytes
+            ids = ",".join(str(conversation_id) for conversation_id in conversation_ids[i:i + 100])
+            await self.session.execute(select(func.pg_notify(CACHE_CHANNEL, f"{CACHE_ORIGIN} {change} {ids}")))
 
     async def set_topic_id(self, conversation_id: uuid.UUID, topic_id: int):
         await self.session.execute(
@@ -56,7 +236,9 @@ class ConversationService:
             .where(Conversation.id == conversation_id)
             .values(topic_id=topic_id)
         )
+        await self._invalidate_elsewhere([conversation_id])
         await self.session.commit()
+        conversation_cache.update(conversation_id, topic_id=topic_id)
 
     async def add_message(
         self, 
@@ -75,57 +257,314 @@ class ConversationService:
             telegram_message_id=telegram_message_id,
             message_type=message_type
         )
+
+        # Write-behind: the journal batches the INSERT and last_message_at update
+        if message_journal.running:
+            return await message_journal.append(message)
+
         self.session.add(message)
+        now = datetime.utcnow()
         
         # Update last_message_at
         await self.session.execute(
             update(Conversation)
             .where(Conversation.id == conversation_id)
-            .values(last_message_at=datetime.utcnow())
+            .values(last_message_at=now)
         )
+        await self.session.execute(upsert_stats(), [message_stats(conversation_id, sender_type, 1, now)])
         
         await self.session.commit()
         return message
 
-    async def lock_conversation(self, conversation_id: uuid.UUID, agent: User) -> bool:
-        conv = await self.get_by_id(conversation_id)
-        if not conv or conv.status != "open":
-            return False
-        
-        if conv.locked_by_agent and conv.locked_by_agent != agent.id:
-            return False 
-        
-        conv.locked_by_agent = agent.id
+    async def add_messages(
+        self,
+        conversation_id: uuid.UUID,
+        sender_type: str,
+        messages: list[dict],
+        sender_id: uuid.UUID | None = None,
+        outbox: dict | None = None,
+    ) -> list[Message]:
+        """
+        Persist several messages (e.g. an album) with one last_message_at update and one commit.
+        With `outbox` (OutboxMessage values), their delivery is queued in the same transaction;
+        an update seen before hits the idempotency key and nothing is stored ([] is returned).
+        """
+        rows = [
+            Message(
+                conversation_id=conversation_id,
+                sender_type=sender_type,
+                sender_id=sender_id,
+                content=m["content"],
+                telegram_message_id=m.get("telegram_message_id"),
+                message_type=m.get("message_type", "text"),
+            )
+            for m in messages
+        ]
+
+        if outbox is not None:
+            queued = await self.session.scalar(
+                pg_insert(OutboxMessage)
+                .values(**outbox)
+                .on_conflict_do_nothing(index_elements=[OutboxMessage.idempotency_key])
+                .returning(OutboxMessage.id)
+            )
+            if queued is None:
+                await self.session.rollback()
+                return []
+        elif message_journal.running:
+            return [await message_journal.append(row) for row in rows]
+
+        self.session.add_all(rows)
+        now = datetime.utcnow()
+        await self.session.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(last_message_at=now)
+        )
+        await self.session.execute(upsert_stats(), [message_stats(conversation_id, sender_type, len(rows), now)])
         await self.session.commit()
+        return rows
+
+    def _lease_end(self, now: datetime) -> datetime | None:
+        # Python clock, the one lock_is_live compares against: the session TimeZone may not be UTC
+        if not settings.LOCK_LEASE_SECONDS:
+            return None
+        return now + timedelta(seconds=settings.LOCK_LEASE_SECONDS)
+
+    async def lock_conversation(self, conversation_id: uuid.UUID, agent: User, event_type: str | None = "locked") -> bool:
+        """
+        Lock an open conversation to `agent`, or renew the agent's lease, in one conditional
+        UPDATE. Succeeds when it is unlocked, already the agent's, or the holder's lease ran out.
+        `event_type` is audited on success; None for a plain lease renewal.
+        """
+        now = datetime.utcnow()
+        stmt = (
+            update(Conversation)
+            .where(Conversation.id == conversation_id, Conversation.status == "open")
+            .where(or_(
+                Conversation.locked_by_agent.is_(None),
+                Conversation.locked_by_agent == agent.id,
+                Conversation.locked_until < now,
+            ))
+            .values(locked_by_agent=agent.id, locked_until=self._lease_end(now))
+            .returning(Conversation.locked_until)
+            .execution_options(synchronize_session=False)
+        )
+        row = (await self.session.execute(stmt)).first()
+        if row is not None:
+            await self._invalidate_elsewhere([conversation_id])
+        await self.session.commit()
+        if row is None:
+            return False
+
+        conversation_cache.update(conversation_id, locked_by_agent=agent.id, locked_until=row.locked_until)
+        open_queue.locked(conversation_id, agent_display_name(agent.username, agent.first_name), row.locked_until)
+        if event_type:
+            event_journal.record(conversation_id, event_type, event_by=agent.id)
         return True
 
     async def unlock_conversation(self, conversation_id: uuid.UUID, agent: User) -> bool:
-        conv = await self.get_by_id(conversation_id)
-        if not conv:
+        stmt = (
+            update(Conversation)
+            .where(Conversation.id == conversation_id, Conversation.locked_by_agent == agent.id)
+            .values(locked_by_agent=None, locked_until=None)
+            .returning(Conversation.id)
+            .execution_options(synchronize_session=False)
+        )
+        row = (await self.session.execute(stmt)).first()
+        if row is not None:
+            await self._invalidate_elsewhere([conversation_id])
+        await self.session.commit()
+        if row is None:
             return False
-        
-        if conv.locked_by_agent == agent.id:
-            conv.locked_by_agent = None
-            await self.session.commit()
-            return True
-        return False
 
-    async def close_conversation(self, conversation_id: uuid.UUID) -> bool:
-        conv = await self.get_by_id(conversation_id)
-        if not conv:
+        conversation_cache.update(conversation_id, locked_by_agent=None, locked_until=None)
+        open_queue.unlocked(conversation_id)
+        event_journal.record(conversation_id, "unlocked", event_by=agent.id)
+        return True
+
+    async def close_conversation(self, conversation_id: uuid.UUID, closed_by: uuid.UUID | None = None) -> bool:
+        stmt = (
+            update(Conversation)
+            .where(Conversation.id == conversation_id, Conversation.status == "open")
+            .values(status="closed", locked_by_agent=None, locked_until=None)
+            .returning(Conversation.id)
+            .execution_options(synchronize_session=False)
+        )
+        row = (await self.session.execute(stmt)).first()
+        if row is None:
+            await self.session.commit()
             return False
-        
-        conv.status = "closed"
-        conv.locked_by_agent = None
+        await self.session.execute(upsert_stats(), [closed_stats(conversation_id, datetime.utcnow())])
+        await self._invalidate_elsewhere([conversation_id], "closed")
         await self.session.commit()
+
+        conversation_cache.discard(conversation_id)
+        open_queue.closed(conversation_id)
+        event_journal.record(conversation_id, "closed", event_by=closed_by)
         return True
 
-    async def list_open_conversations(self) -> list[Conversation]:
+    async def close_idle(self, idle_before: datetime, limit: int) -> list[tuple[uuid.UUID, int | None]]:
+        """
+        Close up to `limit` open conversations with no message since `idle_before`, oldest
+        first, recording an `auto_closed` event for each. One UPDATE (served by the
+        (status, last_message_at) index) plus two batched writes; rows locked by a
+        concurrent close are skipped. Their topics are marked `topic_close_pending`, so the
+        sweeper closes them even across restarts. Returns (conversation id, topic id) of those closed.
+        """
+        idle = (
+            select(Conversation.id)
+            .where(Conversation.status == "open", Conversation.last_message_at < idle_before)
+            .order_by(Conversation.last_message_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
         stmt = (
-            select(Conversation)
+            update(Conversation)
+            .where(Conversation.id.in_(idle))
+            .values(status="closed", locked_by_agent=None, locked_until=None, topic_close_pending=Conversation.topic_id.is_not(None))
+            .returning(Conversation.id, Conversation.topic_id, Conversation.last_message_at)
+            .execution_options(synchronize_session=False)
+        )
+        closed = (await self.session.execute(stmt)).all()
+        now = datetime.utcnow()
+        if closed:
+            await self.session.execute(
+                insert(ConversationEvent),
+                [
+                    # created_at from the same clock as the event journal's, so timelines interleave correctly
+                    {"conversation_id": conv_id, "event_type": "auto_closed", "details": f"idle since {last_message_at:%Y-%m-%d %H:%M} UTC", "created_at": now}
+                    for conv_id, _, last_message_at in closed
+                ],
+            )
+            # For SLA purposes an idle conversation was resolved when it went quiet
+            await self.session.execute(
+                upsert_stats(),
+                [closed_stats(conv_id, last_message_at) for conv_id, _, last_message_at in closed],
+            )
+            await self._invalidate_elsewhere([conv_id for conv_id, _, _ in closed], "closed")
+        await self.session.commit()
+
+        for conv_id, _, _ in closed:
+            conversation_cache.discard(conv_id)
+            open_queue.closed(conv_id)
+        return [(conv_id, topic_id) for conv_id, topic_id, _ in closed]
+
+    async def claim_topic_closes(self, limit: int, lease: float) -> list[tuple[uuid.UUID, int]]:
+        """
+        Lease up to `limit` idle-closed conversations whose forum topic is still open, oldest
+        first, as (conversation id, topic id). A claimed row is skipped by other sweepers until
+        its lease runs out, so a sweeper that died (or hit a transient error) is retried then.
+        """
+        due = (
+            select(Conversation.id)
+            .where(Conversation.topic_close_pending)
+            .where(or_(Conversation.topic_close_claimed_until.is_(None), Conversation.topic_close_claimed_until < func.now()))
+            .order_by(Conversation.last_message_at, Conversation.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(Conversation)
+            .where(Conversation.id.in_(due))
+            .values(topic_close_claimed_until=func.now() + timedelta(seconds=lease))
+            .returning(Conversation.id, Conversation.topic_id, Conversation.last_message_at)
+            .execution_options(synchronize_session=False)
+        )
+        rows = (await self.session.execute(stmt)).all()
+        await self.session.commit()
+        # RETURNING has no order of its own
+        rows = sorted(rows, key=lambda row: (row[2] or datetime.min, row[0]))
+        return [(conv_id, topic_id) for conv_id, topic_id, _ in rows]
+
+    async def count_pending_topic_closes(self) -> int:
+        return await self.session.scalar(select(func.count()).where(Conversation.topic_close_pending))
+
+    async def topic_closed(self, conversation_id: uuid.UUID):
+        await self.session.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(topic_close_pending=False, topic_close_claimed_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+
+    async def get_timeline(
+        self, conversation_id: uuid.UUID, limit: int = 100, before: tuple[datetime, uuid.UUID] | None = None
+    ) -> list[Row]:
+        """
+        Audit events of a conversation, newest first, by keyset on (created_at, id): pass the
+        last row's (created_at, id) as `before` for the next page.
+        """
+        stmt = (
+            select(ConversationEvent.id, ConversationEvent.event_type, ConversationEvent.event_by, ConversationEvent.details, ConversationEvent.created_at)
+            .where(ConversationEvent.conversation_id == conversation_id)
+            .order_by(ConversationEvent.created_at.desc(), ConversationEvent.id.desc())
+            .limit(limit)
+        )
+        if before is not None:
+            stmt = stmt.where(tuple_(ConversationEvent.created_at, ConversationEvent.id) < tuple_(*before))
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    async def list_open_locks(self) -> list[tuple[uuid.UUID, str | None, datetime | None]]:
+        """(conversation id, locking agent's display name or None, lease end) for every open conversation."""
+        locker = aliased(User)
+        stmt = (
+            select(Conversation.id, Conversation.locked_by_agent, Conversation.locked_until, locker.username, locker.first_name)
+            .outerjoin(locker, Conversation.locked_by_agent == locker.id)
             .where(Conversation.status == "open")
-            .order_by(Conversation.created_at)
-            .options(selectinload(Conversation.customer), selectinload(Conversation.locker))
         )
         result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+        return [
+            (conv_id, agent_display_name(username, first_name) if locked_by else None, locked_until)
+            for conv_id, locked_by, locked_until, username, first_name in result.all()
+        ]
+
+    async def list_open_page(
+        self,
+        after: tuple[datetime, uuid.UUID] | None = None,
+        before: tuple[datetime, uuid.UUID] | None = None,
+        limit: int = 20,
+    ) -> OpenConversationPage:
+        """
+        One page of open conversations, oldest first, by keyset on (created_at, id): pass the
+        last row of the current page as `after` for the next page, or its first row as
+        `before` for the previous one. One joined query, projecting only the listed columns.
+        """
+        customer = aliased(User)
+        locker = aliased(User)
+        key = tuple_(Conversation.created_at, Conversation.id)
+        stmt = (
+            select(
+                Conversation.id,
+                Conversation.created_at,
+                Conversation.locked_by_agent,
+                Conversation.locked_until,
+                customer.username.label("customer_username"),
+                customer.first_name.label("customer_first_name"),
+                customer.telegram_user_id.label("customer_telegram_id"),
+                locker.username.label("locker_username"),
+                locker.first_name.label("locker_first_name"),
+            )
+            .join(customer, Conversation.customer_id == customer.id)
+            .outerjoin(locker, Conversation.locked_by_agent == locker.id)
+            .where(Conversation.status == "open")
+            .limit(limit + 1) # One extra row tells us whether there is another page
+        )
+        if before is not None:
+            stmt = stmt.where(key < tuple_(*before)).order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        else:
+            if after is not None:
+                stmt = stmt.where(key > tuple_(*after))
+            stmt = stmt.order_by(Conversation.created_at, Conversation.id)
+
+        rows = list((await self.session.execute(stmt)).all())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+            return OpenConversationPage(rows=rows, has_prev=has_more, has_next=True)
+        return OpenConversationPage(rows=rows, has_prev=after is not None, has_next=has_more)
@@ -0,0 +1,54 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import ConversationEvent
+from app.services.write_behind import WriteBehindBuffer
+
+class EventJournal(WriteBehindBuffer):
+    """
+    Write-behind buffer for `conversation_events` (the audit trail). `record` only
+    appends in memory, so auditing adds no round-trip to the handlers; each flush is
+    one multi-row INSERT. When the database falls behind past `max_buffer`, new events
+    are dropped and counted rather than slowing handlers down.
+    """
+
+    label = "Event journal"
+
+    def __init__(self, session_factory, flush_interval: float = 1.0, batch_size: int = 500, max_buffer: int = 10000):
+        super().__init__(session_factory, flush_interval, batch_size, max_buffer)
+        self.recorded = 0
+
+    def record(self, conversation_id: uuid.UUID, event_type: str, event_by: uuid.UUID | None = None, details: str | None = None):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped_rows += 1
+            return
+        self._add({
+            "id": uuid.uuid4(),
+            "conversation_id": conversation_id,
+            "event_type": event_type,
+            "event_by": event_by,
+            "details": details,
+            "created_at": datetime.utcnow(),
+        })
+        self.recorded += 1
+
+    async def _write(self, session: AsyncSession, rows: list[dict]):
+        await session.execute(insert(ConversationEvent), rows)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._buffer),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped_rows,
+        }
+
+event_journal = EventJournal(
+    SessionLocal,
+    flush_interval=settings.EVENT_JOURNAL_FLUSH_MS / 1000,
+    max_buffer=settings.EVENT_JOURNAL_MAX_BUFFER,
+)
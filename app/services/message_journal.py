@@ -0,0 +1,77 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation, Message
+from app.services.analytics_service import message_stats, upsert_stats
+from app.services.write_behind import WriteBehindBuffer
+
+class MessageJournal(WriteBehindBuffer):
+    """
+    Optional write-behind buffer for `messages` rows. Handlers append and return
+    immediately; each flush is one multi-row INSERT plus one `last_message_at` update
+    and one SLA stats increment per conversation. `flush_interval` is therefore the
+    maximum window of messages lost on a hard crash; a clean shutdown flushes everything.
+    Past `max_buffer` rows, appending waits on a flush instead of growing the buffer.
+    """
+
+    label = "Message journal"
+
+    def __init__(self, session_factory, flush_interval: float = 0.2, batch_size: int = 500, max_buffer: int = 10000):
+        super().__init__(session_factory, flush_interval, batch_size, max_buffer)
+
+    async def append(self, message: Message) -> Message:
+        if message.id is None:
+            message.id = uuid.uuid4()
+        if message.created_at is None:
+            message.created_at = datetime.utcnow()
+
+        self._add({
+            "id": message.id,
+            "conversation_id": message.conversation_id,
+            "sender_type": message.sender_type,
+            "sender_id": message.sender_id,
+            "message_type": message.message_type,
+            "content": message.content,
+            "telegram_message_id": message.telegram_message_id,
+            "created_at": message.created_at,
+        })
+
+        if len(self._buffer) >= self.max_buffer:
+            # DB is falling behind: make the producer wait instead of growing unboundedly
+            await self.flush()
+        return message
+
+    async def _write(self, session: AsyncSession, rows: list[dict]):
+        # One last_message_at per conversation, the newest in the batch
+        last_message_at: dict[uuid.UUID, datetime] = {}
+        for row in rows:
+            conversation_id = row["conversation_id"]
+            if conversation_id not in last_message_at or row["created_at"] > last_message_at[conversation_id]:
+                last_message_at[conversation_id] = row["created_at"]
+
+        # One stats increment per (conversation, sender type): message count and earliest time
+        increments: dict[tuple[uuid.UUID, str], tuple[int, datetime]] = {}
+        for row in rows:
+            key = (row["conversation_id"], row["sender_type"])
+            count, first_at = increments.get(key, (0, row["created_at"]))
+            increments[key] = (count + 1, min(first_at, row["created_at"]))
+
+        await session.execute(insert(Message), rows)
+        await session.execute(
+            update(Conversation),
+            [{"id": cid, "last_message_at": ts} for cid, ts in last_message_at.items()],
+        )
+        await session.execute(
+            upsert_stats(),
+            [message_stats(cid, sender_type, count, first_at) for (cid, sender_type), (count, first_at) in increments.items()],
+        )
+
+message_journal = MessageJournal(
+    SessionLocal,
+    flush_interval=settings.MESSAGE_JOURNAL_FLUSH_MS / 1000,
+    batch_size=settings.MESSAGE_JOURNAL_BATCH_SIZE,
+    max_buffer=settings.MESSAGE_JOURNAL_MAX_BUFFER,
+)
@@ -0,0 +1,67 @@
+import uuid
+from dataclasses import dataclass
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.tracing import traced
+from app.models.conversation import MessageLink
+
+@dataclass(frozen=True)
+class LinkedMessage:
+    conversation_id: uuid.UUID
+    peer_chat_id: int | None
+    peer_message_id: int | None
+
+# (chat_id, message_id) -> LinkedMessage. Links never change, so entries are only evicted by size/age.
+message_link_cache = TTLCache(maxsize=settings.MESSAGE_LINK_CACHE_SIZE, ttl=settings.MESSAGE_LINK_CACHE_TTL)
+
+@traced("db")
+class MessageLinkService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def link_copies(
+        self,
+        conversation_id: uuid.UUID,
+        from_chat_id: int,
+        from_message_ids: list[int],
+        to_chat_id: int,
+        to_message_ids: list[int],
+    ):
+        """Record relayed messages (pairwise source -> copy) in both directions."""
+        rows = []
+        for source_id, copy_id in zip(from_message_ids, to_message_ids):
+            rows.append({"chat_id": from_chat_id, "message_id": source_id, "peer_chat_id": to_chat_id, "peer_message_id": copy_id})
+            rows.append({"chat_id": to_chat_id, "message_id": copy_id, "peer_chat_id": from_chat_id, "peer_message_id": source_id})
+        if not rows:
+            return
+
+        # Cache first so a reply arriving before the commit still resolves
+        for row in rows:
+            row["conversation_id"] = conversation_id
+            message_link_cache.set(
+                (row["chat_id"], row["message_id"]),
+                LinkedMessage(conversation_id, row["peer_chat_id"], row["peer_message_id"]),
+            )
+
+        await self.session.execute(insert(MessageLink).on_conflict_do_nothing(), rows)
+        await self.session.commit()
+
+    async def resolve(self, chat_id: int, message_id: int) -> LinkedMessage | None:
+        key = (chat_id, message_id)
+        cached = message_link_cache.get(key)
+        if cached:
+            return cached
+
+        stmt = (
+            select(MessageLink.conversation_id, MessageLink.peer_chat_id, MessageLink.peer_message_id)
+            .where(MessageLink.chat_id == chat_id, MessageLink.message_id == message_id)
+        )
+        row = (await self.session.execute(stmt)).first()
+        if row is None:
+            return None
+        link = LinkedMessage(*row)
+        message_link_cache.set(key, link)
+        return link
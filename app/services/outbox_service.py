@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Row, and_, bindparam, delete, exists, func, null, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from app.core.tracing import traced
+from app.models.conversation import OutboxMessage
+
+UNDELIVERED = ("pending", "sending")
+
+@traced("db")
+class OutboxService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def claim(self, limit: int, lease: float) -> list[Row]:
+        """
+        Lease up to `limit` due rows for delivery, at most one per conversation: a row is
+        only claimable once every earlier row of its conversation is delivered (or given
+        up), which keeps each conversation in order across any number of senders.
+        Expired leases (a sender died mid-delivery) are claimable again.
+        """
+        earlier = aliased(OutboxMessage)
+        due = (
+            select(OutboxMessage.id)
+            .where(or_(
+                and_(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= func.now()),
+                and_(OutboxMessage.status == "sending", OutboxMessage.claimed_until < func.now()),
+            ))
+            .where(~exists().where(
+                earlier.conversation_id == OutboxMessage.conversation_id,
+                earlier.id < OutboxMessage.id,
+                earlier.status.in_(UNDELIVERED),
+            ))
+            .order_by(OutboxMessage.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True, of=OutboxMessage)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(due))
+            .values(status="sending", claimed_until=func.now() + timedelta(seconds=lease), attempts=OutboxMessage.attempts + 1)
+            .returning(OutboxMessage.id, OutboxMessage.kind, OutboxMessage.conversation_id, OutboxMessage.payload, OutboxMessage.attempts)
+            .execution_options(synchronize_session=False)
+        )
+        rows = (await self.session.execute(stmt)).all()
+        await self.session.commit()
+        return rows
+
+    async def renew(self, claims: list[tuple[int, int]], lease: float) -> int:
+        """
+        Extend the lease of rows still being delivered. A claim is (id, attempts): each claim
+        bumps `attempts`, so it identifies this claim and not a later one by another sender.
+        """
+        if not claims:
+            return 0
+        result = await self.session.execute(
+            update(OutboxMessage)
+            .where(tuple_(OutboxMessage.id, OutboxMessage.attempts).in_(claims), OutboxMessage.status == "sending")
+            .values(claimed_until=func.now() + timedelta(seconds=lease))
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def complete(self, results: list[dict]):
+        """
+        Record a batch of delivery outcomes (id, attempts, status, next_attempt_at, last_error,
+        sent_at) in one executemany. An outcome only applies while its claim is still held:
+        if the lease ran out and another sender reclaimed the row, that sender's outcome wins.
+        """
+        if not results:
+            return
+        table = OutboxMessage.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.id == bindparam("claim_id"),
+                table.c.attempts == bindparam("claim_attempts"),
+                table.c.status == "sending",
+            )
+            .values(
+                status=bindparam("status"),
+                next_attempt_at=bindparam("next_attempt_at"),
+                last_error=bindparam("last_error"),
+                sent_at=bindparam("sent_at"),
+                claimed_until=null(),
+            )
+        )
+        await self.session.execute(stmt, [
+            {
+                "claim_id": result["id"],
+                "claim_attempts": result["attempts"],
+                "status": result["status"],
+                "next_attempt_at": result["next_attempt_at"],
+                "last_error": result["last_error"],
+                "sent_at": result["sent_at"],
+            }
+            for result in results
+        ])
+        await self.session.commit()
+
+    async def prune(self, sent_before: datetime) -> int:
+        result = await self.session.execute(
+            delete(OutboxMessage).where(OutboxMessage.status == "sent", OutboxMessage.sent_at < sent_before)
+        )
+        await self.session.commit()
+        return result.rowcount
@@ -1,7 +1,23 @@
+import uuid
+from dataclasses import dataclass
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, literal
+from sqlalchemy.dialects.postgresql import insert
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.tracing import traced
 from app.models.user import User, UserType, Agent, AgentRole
 
+@dataclass(frozen=True)
+class CachedUser:
+    id: uuid.UUID
+    user_type: str
+    profile_hash: int
+
+# telegram_user_id -> CachedUser. Lets repeat senders skip the upsert entirely.
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+@traced("db")
 class UserService:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -12,52 +28,70 @@ class UserService:
         return result.scalar_one_or_none()
 
     async def get_or_create(
-        self, 
-        telegram_id: int, 
-        username: str | None = None, 
+        self,
+        telegram_id: int,
+        username: str | None = None,
         first_name: str | None = None,
         last_name: str | None = None,
         user_type: UserType = UserType.CUSTOMER
     ) -> User:
-        user = await self.get_by_telegram_id(telegram_id)
-        if not user:
-            # Create User
-            user = User(
-                telegram_user_id=telegram_id, 
-                username=username, 
+        # Fast path: known user with an unchanged profile, nothing to write.
+        profile_hash = hash((username, first_name, last_name))
+        cached = user_cache.get(telegram_id)
+        if cached and cached.profile_hash == profile_hash:
+            return User(
+                id=cached.id,
+                telegram_user_id=telegram_id,
+                username=username,
                 first_name=first_name,
                 last_name=last_name,
-                user_type=user_type.value
+                user_type=cached.user_type,
             )
-            self.session.add(user)
-            await self.session.flush() # Flush to get ID if needed for Agent
-            
-            # If Agent, create Agent profile
-            if user_type == UserType.AGENT:
-                agent = Agent(user_id=user.id, role=AgentRole.AGENT.value)
-                self.session.add(agent)
-
-            await self.session.commit()
-            await self.session.refresh(user)
-        else:
-            # Update info if changed
-            changed = False
-            if user.username != username:
-                user.username = username
-                changed = True
-            if user.first_name != first_name:
-                user.first_name = first_name
-                changed = True
-            if user.last_name != last_name:
-                user.last_name = last_name
-                changed = True
-            
-            # If we found a user who should be an agent but isn't marked as one (e.g. promoted?)
-            # For simplicity, we assume role doesn't change automatically to Agent via this method.
-            # But if we wanted to ensuring they have an Agent profile:
-            # if user_type == UserType.AGENT and not await self.get_agent_profile(user.id): ...
-            
-            if changed:
-                await self.session.commit()
-                
+
+        # Single round-trip upsert: insert or refresh profile fields, and make sure agents
+        # have an Agent profile, all in one statement. ON CONFLICT makes concurrent
+        # first messages from the same user safe.
+        # user_type is only set on insert: we don't promote/demote existing users here.
+        upsert = insert(User).values(
+            telegram_user_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            user_type=user_type.value
+        )
+        upserted_user = (
+            upsert.on_conflict_do_update(
+                index_elements=[User.telegram_user_id],
+                set_={
+                    "username": upsert.excluded.username,
+                    "first_name": upsert.excluded.first_name,
+                    "last_name": upsert.excluded.last_name,
+                },
+            )
+            .returning(*User.__table__.c)
+            .cte("upserted_user")
+        )
+
+        # If Agent, create Agent profile (no-op if it already exists)
+        upserted_agent = (
+            insert(Agent)
+            .from_select(
+                [Agent.user_id, Agent.role],
+                select(upserted_user.c.id, literal(AgentRole.AGENT.value))
+                .where(upserted_user.c.user_type == UserType.AGENT.value),
+            )
+            .on_conflict_do_nothing(index_elements=[Agent.user_id])
+            .cte("upserted_agent")
+        )
+
+        stmt = (
+            select(User)
+            .from_statement(select(upserted_user).add_cte(upserted_agent))
+            .execution_options(populate_existing=True)
+        )
+        result = await self.session.execute(stmt)
+        user = result.scalar_one()
+        await self.session.commit()
+
+        user_cache.set(telegram_id, CachedUser(id=user.id, user_type=user.user_type, profile_hash=profile_hash))
         return user
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindBuffer(ABC):
+    """
+    Base for the write-behind journals: rows are buffered in memory and a background
+    task writes them every `flush_interval` seconds (or as soon as `batch_size` rows are
+    waiting) in one transaction, see `_write`. A batch rejected by an integrity error is
+    retried per conversation, then row by row within a conversation that still fails,
+    so only the offending rows are dropped. Any other failure puts the rows back, keeping
+    at most `max_buffer` (the oldest are dropped first).
+    """
+
+    label = "Journal"
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        flush_interval: float,
+        batch_size: int = 500,
+        max_buffer: int = 10000,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+
+        self._buffer: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+
+    @abstractmethod
+    async def _write(self, session: AsyncSession, rows: list[dict]):
+        """Write one batch in `session`; the caller commits."""
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name=self.label.lower().replace(" ", "-"))
+        logger.info(f"{self.label} started (flush every {self.flush_interval * 1000:.0f} ms or {self.batch_size} rows)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Durable flush: keep trying briefly before giving up on the remaining rows
+        for attempt in range(3):
+            if not self._buffer:
+                break
+            await self.flush()
+        if self._buffer:
+            logger.error(f"{self.label} stopped with {len(self._buffer)} unwritten rows")
+        logger.info(f"{self.label} stopped")
+
+    def _add(self, row: dict):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                await self._commit(rows)
+            except IntegrityError as e:
+                # Bad rows (e.g. conversation deleted) would fail forever: find them and drop only those
+                self.failed_flushes += 1
+                logger.warning(f"{self.label} flush of {len(rows)} rows hit an integrity error, retrying per conversation: {e}")
+                await self._write_separately(rows)
+                return
+            except Exception as e:
+                self.failed_flushes += 1
+                self._requeue(rows)
+                logger.error(f"{self.label} flush failed, {len(self._buffer)} rows pending: {e}")
+                return
+
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+
+    async def _commit(self, rows: list[dict]):
+        async with self.session_factory() as session:
+            await self._write(session, rows)
+            await session.commit()
+
+    async def _write_separately(self, rows: list[dict]):
+        by_conversation: dict[uuid.UUID, list[dict]] = {}
+        for row in rows:
+            by_conversation.setdefault(row["conversation_id"], []).append(row)
+        for group in by_conversation.values():
+            if await self._write_group(group) and len(group) > 1:
+                for row in group:
+                    await self._write_group([row])
+
+    async def _write_group(self, rows: list[dict]) -> bool:
+        """True if an integrity error rejected the rows; a single rejected row is dropped."""
+        try:
+            await self._commit(rows)
+        except IntegrityError as e:
+            if len(rows) == 1:
+                self.dropped_rows += 1
+                logger.error(f"{self.label} dropped row {rows[0]['id']}: {e}")
+            return True
+        except Exception as e:
+            self._requeue(rows)
+            logger.error(f"{self.label} retry failed, {len(self._buffer)} rows pending: {e}")
+            return False
+        self.flushed_rows += len(rows)
+        return False
+
+    def _requeue(self, rows: list[dict]):
+        # Back in front of newer rows, but never past max_buffer: a long outage drops the oldest
+        self._buffer = rows + self._buffer
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            self._buffer = self._buffer[overflow:]
+            self.dropped_rows += overflow
+            logger.error(f"{self.label} over {self.max_buffer} rows pending, dropped the {overflow} oldest")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._buffer),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes,
+            "dropped_rows": self.dropped_rows,
+        }
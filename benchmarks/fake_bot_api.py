@@ -0,0 +1,141 @@
+"""
+Local stand-in for the Telegram Bot API, served over HTTP with aiohttp.
+
+Covers the methods the bot uses (getUpdates, sendMessage, copyMessage(s),
+createForumTopic, editForumTopic, ...) with configurable latency and injected
+429 responses. Updates are queued with `push()` and handed out through
+long-polling getUpdates, exactly as Telegram would.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+# Not counted as "API calls per update": polling and startup plumbing
+INFRA_METHODS = {"getUpdates", "getMe", "deleteWebhook", "setWebhook"}
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+        self.calls: dict[str, int] = {}
+        self.injected_429 = 0
+        self.served_at: dict[int, float] = {}
+        self.topics: dict[int, str] = {}
+        # Called with (chat_id, message_thread_id, name) after each createForumTopic
+        self.on_topic_created = None
+
+        self._pending: list[dict] = []
+        self._has_updates = asyncio.Event()
+        self._message_ids = itertools.count(1_000_000)
+        self._topic_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    def push(self, update: dict):
+        self._pending.append(update)
+        self._has_updates.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def api_calls(self) -> int:
+        return sum(count for method, count in self.calls.items() if method not in INFRA_METHODS)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if method not in INFRA_METHODS and self.error_rate and random.random() < self.error_rate:
+            self.injected_429 += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        handler = getattr(self, f"_{method}", None)
+        return self._ok(handler(params) if handler else True)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self._pending = [u for u in self._pending if u["update_id"] >= offset]
+        if not self._pending:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout=min(float(params.get("timeout") or 0), 1.0))
+            except asyncio.TimeoutError:
+                return []
+
+        batch = self._pending[:int(params.get("limit") or 100)]
+        now = time.perf_counter()
+        for update in batch:
+            self.served_at.setdefault(update["update_id"], now)
+        return batch
+
+    def _message(self, params: dict, **fields) -> dict:
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+        if params.get("message_thread_id"):
+            message["message_thread_id"] = int(params["message_thread_id"])
+            message["is_topic_message"] = True
+        return message
+
+    def _getMe(self, params: dict) -> dict:
+        return BOT_USER
+
+    def _sendMessage(self, params: dict) -> dict:
+        return self._message(params, text=params.get("text", ""))
+
+    def _copyMessage(self, params: dict) -> dict:
+        return {"message_id": next(self._message_ids)}
+
+    def _copyMessages(self, params: dict) -> list[dict]:
+        return [{"message_id": next(self._message_ids)} for _ in json.loads(params["message_ids"])]
+
+    def _createForumTopic(self, params: dict) -> dict:
+        topic_id = next(self._topic_ids)
+        self.topics[topic_id] = params["name"]
+        if self.on_topic_created:
+            self.on_topic_created(int(params["chat_id"]), topic_id, params["name"])
+        return {"message_thread_id": topic_id, "name": params["name"], "icon_color": 7322096}
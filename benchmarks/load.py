@@ -0,0 +1,196 @@
+"""
+End-to-end load benchmark against a local fake Bot API server.
+
+Builds the real bot with `get_bot_dispatcher()`, points it at
+`benchmarks.fake_bot_api.FakeBotAPI` and drives synthetic traffic through
+long polling and the update queue: customers write to the bot, and agents
+reply in each topic once it has been created. Reports updates/sec, p50/p99
+handler latency and Bot API calls per update.
+
+    python -m benchmarks.load --customers 200 --messages 5 --agent-replies 2 --api-latency 0.03 --error-rate 0.01
+
+Needs the usual settings (.env) and a migrated Postgres at DATABASE_URL
+(`alembic upgrade head`); the schema relies on Postgres upserts and
+gen_random_uuid(), so SQLite is not supported. Every run uses fresh
+Telegram user ids, so runs don't interfere but the rows are kept.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import statistics
+import time
+import structlog
+from aiogram.client.telegram import TelegramAPIServer
+from app.bot.dispatcher import get_bot_dispatcher
+from app.bot.ingest import UpdateQueue, poll_updates
+from app.bot.ratelimit import TokenBucket, outbound_limiter
+from app.core.config import settings
+from app.db.session import engine
+from app.services.message_journal import message_journal
+from benchmarks.fake_bot_api import FakeBotAPI, BOT_USER, INFRA_METHODS
+
+AGENT_ID = 900_000_001
+
+class Traffic:
+    """Generates customer and agent updates and records per-update handler latency."""
+
+    def __init__(self, api: FakeBotAPI, customers: int, messages: int, agent_replies: int, start_ratio: float):
+        self.api = api
+        self.customers = customers
+        self.messages = messages
+        self.agent_replies = agent_replies
+        self.start_ratio = start_ratio
+
+        self.user_base = int(time.time() * 1000) % 10**9 * 1000 # Fresh ids per run
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.scheduled = 0 # Agent replies not yet pushed
+        self.pushed = 0
+
+        self.handler_latency: list[float] = []
+        self.end_to_end: list[float] = []
+
+    def _push(self, message: dict):
+        self.pushed += 1
+        self.api.push({"update_id": next(self._update_ids), "message": message})
+
+    def customer_message(self, i: int):
+        user = {"id": self.user_base + i, "is_bot": False, "first_name": "Customer", "last_name": str(i)}
+        text = "/start" if random.random() < self.start_ratio else f"Help me please ({i})"
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        self._push(message)
+
+    def agent_reply(self, chat_id: int, topic_id: int):
+        self.scheduled -= 1
+        chat = {"id": chat_id, "type": "supergroup", "is_forum": True}
+        self._push({
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": AGENT_ID, "is_bot": False, "first_name": "Agent", "username": "bench_agent"},
+            "message_thread_id": topic_id,
+            "is_topic_message": True,
+            "text": "On it!",
+            "reply_to_message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": chat,
+                "from": BOT_USER,
+                "message_thread_id": topic_id,
+                "text": "New conversation",
+            },
+        })
+
+    def on_topic_created(self, chat_id: int, topic_id: int, name: str):
+        # Give the handler time to store the topic id before agents start answering in it
+        loop = asyncio.get_running_loop()
+        for n in range(self.agent_replies):
+            self.scheduled += 1
+            loop.call_later(0.2 * (n + 1), self.agent_reply, chat_id, topic_id)
+
+    async def middleware(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            finished = time.perf_counter()
+            self.handler_latency.append(finished - started)
+            served_at = self.api.served_at.get(event.update_id)
+            if served_at is not None:
+                self.end_to_end.append(finished - served_at)
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+def lift_rate_limits():
+    # Measure our code, not Telegram's broadcast limits (opt back in with --telegram-limits)
+    outbound_limiter.global_bucket = TokenBucket(rate=1e6, capacity=1e6)
+    outbound_limiter.group_per_minute = 6e7
+    outbound_limiter.private_rate = 1e6
+
+async def main(args):
+    # Per-update logs would dominate the run; keep warnings (RetryAfter, failures)
+    logging.basicConfig(level=logging.WARNING)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    random.seed(args.seed)
+    api = FakeBotAPI(latency=args.api_latency, jitter=args.api_jitter, error_rate=args.error_rate, retry_after=args.retry_after)
+    await api.start()
+    if not args.telegram_limits:
+        lift_rate_limits()
+
+    bot, dp = await get_bot_dispatcher()
+    bot.session.api = TelegramAPIServer.from_base(api.url)
+    traffic = Traffic(api, args.customers, args.messages, args.agent_replies, args.start_ratio)
+    api.on_topic_created = traffic.on_topic_created
+    dp.update.outer_middleware(traffic.middleware)
+
+    queue = UpdateQueue(
+        bot,
+        dp,
+        maxsize=settings.UPDATE_QUEUE_SIZE,
+        shards=settings.UPDATE_SHARDS,
+        shard_concurrency=settings.UPDATE_SHARD_CONCURRENCY,
+        album_window=settings.ALBUM_WINDOW_MS / 1000,
+    )
+    queue.start()
+    if settings.MESSAGE_JOURNAL_ENABLED:
+        message_journal.start()
+    polling = asyncio.create_task(poll_updates(bot, queue, allowed_updates=dp.resolve_used_update_types(), timeout=1))
+
+    # Round-robin so each customer's messages are spread over the run
+    started = time.perf_counter()
+    for _ in range(args.messages):
+        for i in range(args.customers):
+            traffic.customer_message(i)
+
+    while api.pending or traffic.scheduled or queue.processed + queue.failed < traffic.pushed:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    polling.cancel()
+    await queue.stop()
+    if message_journal.running:
+        await message_journal.stop()
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+    handled = queue.processed + queue.failed
+    print(f"updates: {handled} ({queue.failed} failed) in {elapsed:.2f}s -> {handled / elapsed:.1f} updates/s")
+    print(
+        f"handler latency: p50={statistics.median(traffic.handler_latency) * 1000:.1f} ms "
+        f"p99={percentile(traffic.handler_latency, 0.99) * 1000:.1f} ms"
+    )
+    print(
+        f"end-to-end (served by getUpdates -> handled): p50={statistics.median(traffic.end_to_end) * 1000:.1f} ms "
+        f"p99={percentile(traffic.end_to_end, 0.99) * 1000:.1f} ms"
+    )
+    print(f"api calls/update: {api.api_calls() / handled:.2f} (429s injected: {api.injected_429})")
+    per_method = {m: round(c / handled, 2) for m, c in sorted(api.calls.items()) if m not in INFRA_METHODS}
+    print(f"  by method: {per_method}")
+    print(f"topics created: {len(api.topics)} for {args.customers} customers")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=5, help="Messages per customer")
+    parser.add_argument("--agent-replies", type=int, default=2, help="Agent replies per created topic")
+    parser.add_argument("--start-ratio", type=float, default=0.0, help="Fraction of customer messages that are /start")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="Seconds per fake Bot API call")
+    parser.add_argument("--api-jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Bot API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds in injected 429s")
+    parser.add_argument("--telegram-limits", action="store_true", help="Keep the outbound rate limiter at Telegram's limits")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+"""
+New-conversation latency benchmark for the customer handler.
+
+Drives `process_conversation_message` against an in-memory fake Bot whose
+forum topics only accept messages `--ready-delay` seconds after creation,
+and reports first-message latency plus topic creations under a burst.
+
+    python -m benchmarks.new_conversation --runs 20 --api-latency 0.05 --ready-delay 0.2
+
+Needs the usual settings (.env) to import the app; no Telegram or database access.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from types import SimpleNamespace
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
+from app.bot.handlers.customer import process_conversation_message
+
+class FakeBot:
+    def __init__(self, api_latency: float, ready_delay: float):
+        self.api_latency = api_latency
+        self.ready_delay = ready_delay
+        self.topics: dict[int, tuple[str, float]] = {}
+        self.calls: dict[str, int] = {}
+        self._next_topic = 1
+
+    async def _call(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(self.api_latency)
+
+    def _check_ready(self, thread_id: int | None):
+        if thread_id is None:
+            return
+        _, created_at = self.topics[thread_id]
+        if time.monotonic() - created_at < self.ready_delay:
+            raise TelegramBadRequest(SendMessage(chat_id=0, text=""), "Bad Request: message thread not found")
+
+    async def create_forum_topic(self, chat_id: int, name: str, **kwargs):
+        await self._call("createForumTopic")
+        topic_id = self._next_topic
+        self._next_topic += 1
+        self.topics[topic_id] = (name, time.monotonic())
+        return SimpleNamespace(message_thread_id=topic_id)
+
+    async def edit_forum_topic(self, chat_id: int, message_thread_id: int, name: str, **kwargs):
+        await self._call("editForumTopic")
+        if self.topics[message_thread_id][0] == name:
+            raise TelegramBadRequest(SendMessage(chat_id=0, text=""), "Bad Request: TOPIC_NOT_MODIFIED")
+        self.topics[message_thread_id] = (name, self.topics[message_thread_id][1])
+
+    async def send_message(self, chat_id: int, text: str = "", message_thread_id: int | None = None, **kwargs):
+        await self._call("sendMessage")
+        self._check_ready(message_thread_id)
+        return SimpleNamespace(message_id=1)
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, message_id: int):
+        self.bot = bot
+        self.message_id = message_id
+        self.from_user = SimpleNamespace(full_name="Bench User")
+
+    async def copy_to(self, chat_id: int, message_thread_id: int | None = None, **kwargs):
+        await self.bot._call("copyMessage")
+        self.bot._check_ready(message_thread_id)
+        return SimpleNamespace(message_id=1)
+
+class FakeConversationService:
+    async def set_topic_id(self, conversation_id, topic_id):
+        await asyncio.sleep(0.002)
+
+def make_user():
+    return SimpleNamespace(id=uuid.uuid4(), first_name="Bench", last_name="User", telegram_user_id=1, full_name="Bench User")
+
+async def new_conversation(bot: FakeBot, burst: int) -> float:
+    user = make_user()
+    conversation_id = uuid.uuid4()
+    conv_service = FakeConversationService()
+
+    async def one(i: int):
+        conversation = SimpleNamespace(id=conversation_id, topic_id=None)
+        await process_conversation_message(FakeMessage(bot, i), conversation, user, conv_service, bot, "text", "hi")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(burst)))
+    return time.perf_counter() - started
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def main(args):
+    bot = FakeBot(args.api_latency, args.ready_delay)
+    latencies = [await new_conversation(bot, 1) for _ in range(args.runs)]
+    print(f"single message: p50={statistics.median(latencies) * 1000:.0f} ms p95={percentile(latencies, 0.95) * 1000:.0f} ms")
+    print(f"  api calls/conversation: { {k: round(v / args.runs, 2) for k, v in bot.calls.items()} }")
+
+    bot = FakeBot(args.api_latency, args.ready_delay)
+    latencies = [await new_conversation(bot, args.burst) for _ in range(args.runs)]
+    print(f"burst of {args.burst}: p50={statistics.median(latencies) * 1000:.0f} ms p95={percentile(latencies, 0.95) * 1000:.0f} ms")
+    print(f"  topics created/conversation: {bot.calls.get('createForumTopic', 0) / args.runs:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds per fake Bot API call")
+    parser.add_argument("--ready-delay", type=float, default=0.2, help="Seconds before a new topic accepts messages")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,180 @@
+"""
+Replays a recording made with UPDATE_RECORD_PATH through the real handlers.
+
+The bot from `get_bot_dispatcher()` talks to the local fake Bot API server
+(`benchmarks.fake_bot_api`) and receives the recorded updates through long
+polling at the recorded pace (`--speed 1`), faster (`--speed 10`) or all at
+once (`--speed 0`). Topics get the ids they were recorded with, so agent
+replies land in the conversations they belonged to. Reports updates/sec and
+p50/p99 latency per handler; `--profile` writes cProfile stats.
+
+    python -m benchmarks.replay updates.jsonl.gz --speed 10 --api-latency 0.03 --profile replay.prof
+
+Needs the usual settings (.env) and a migrated Postgres at DATABASE_URL. A
+recording replayed twice against the same database continues the recorded
+conversations instead of starting them again.
+"""
+import argparse
+import asyncio
+import cProfile
+import logging
+import statistics
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+import structlog
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import CreateForumTopic
+from app.bot.dispatcher import get_bot_dispatcher
+from app.bot.ingest import UpdateQueue, poll_updates
+from app.bot.recorder import read_recording
+from app.core.config import settings
+from app.db.session import engine
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.load import lift_rate_limits, percentile
+
+replay_chat: ContextVar[int | None] = ContextVar("replay_chat", default=None)
+
+def remap_ids(data, old: int, new: int):
+    """Point the recorded (anonymised) agent group at this environment's AGENT_GROUP_ID."""
+    if isinstance(data, list):
+        return [remap_ids(item, old, new) for item in data]
+    if isinstance(data, dict):
+        return {k: (new if v == old and (k == "id" or k.endswith("chat_id")) else remap_ids(v, old, new)) for k, v in data.items()}
+    return data
+
+def load(path: str, max_gap: float) -> tuple[list[tuple[float, dict]], dict[int, deque]]:
+    """Returns (offset seconds, update) pairs and recorded topic ids per customer chat."""
+    updates: list[tuple[float, dict]] = []
+    topics: dict[int, deque] = defaultdict(deque)
+    agent_group_id = None
+    offset, last_ts = 0.0, None
+    for record in read_recording(path):
+        if "header" in record:
+            agent_group_id = record["header"]["agent_group_id"]
+        elif "topic" in record:
+            topics[record["topic"]["chat"]].append(record["topic"]["message_thread_id"])
+        elif "update" in record:
+            if last_ts is not None:
+                # Gaps between recording sessions (or quiet nights) are capped
+                offset += min(max(0.0, record["ts"] - last_ts), max_gap)
+            last_ts = record["ts"]
+            update = record["update"]
+            if agent_group_id is not None:
+                update = remap_ids(update, agent_group_id, settings.AGENT_GROUP_ID)
+            updates.append((offset, update))
+    return updates, topics
+
+class Replay:
+    def __init__(self, api: FakeBotAPI, topics: dict[int, deque]):
+        self.api = api
+        self.topics = topics
+        self.pushed = 0
+        self.latency: dict[str, list[float]] = defaultdict(list)
+
+    async def chat_middleware(self, handler, event, data):
+        chat = data.get("event_chat")
+        token = replay_chat.set(chat.id if chat else None)
+        try:
+            return await handler(event, data)
+        finally:
+            replay_chat.reset(token)
+
+    async def handler_middleware(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.latency[data["handler"].callback.__name__].append(time.perf_counter() - started)
+
+    async def topic_middleware(self, make_request, bot, method):
+        result = await make_request(bot, method)
+        if isinstance(method, CreateForumTopic):
+            recorded = self.topics.get(replay_chat.get())
+            if recorded:
+                result = result.model_copy(update={"message_thread_id": recorded.popleft()})
+        return result
+
+    async def feed(self, updates: list[tuple[float, dict]], speed: float):
+        started = time.perf_counter()
+        for offset, update in updates:
+            if speed > 0:
+                delay = started + offset / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.pushed += 1
+            self.api.push({"update_id": self.pushed, **update})
+
+async def main(args):
+    logging.basicConfig(level=logging.WARNING)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    updates, topics = load(args.recording, args.max_gap)
+    if not updates:
+        print("recording has no updates")
+        return
+
+    api = FakeBotAPI(latency=args.api_latency, jitter=args.api_jitter)
+    await api.start()
+    if not args.telegram_limits:
+        lift_rate_limits()
+
+    bot, dp = await get_bot_dispatcher()
+    bot.session.api = TelegramAPIServer.from_base(api.url)
+    replay = Replay(api, topics)
+    dp.update.outer_middleware(replay.chat_middleware)
+    for observer in (dp.message, dp.edited_message, dp.callback_query):
+        observer.middleware(replay.handler_middleware)
+    bot.session.middleware(replay.topic_middleware)
+
+    queue = UpdateQueue(
+        bot,
+        dp,
+        maxsize=settings.UPDATE_QUEUE_SIZE,
+        shards=settings.UPDATE_SHARDS,
+        shard_concurrency=settings.UPDATE_SHARD_CONCURRENCY,
+        album_window=settings.ALBUM_WINDOW_MS / 1000,
+    )
+    queue.start()
+    polling = asyncio.create_task(poll_updates(bot, queue, allowed_updates=dp.resolve_used_update_types(), timeout=1))
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    started = time.perf_counter()
+    await replay.feed(updates, args.speed)
+    # Album parts are merged into one dispatch, so wait on the fake API's backlog and an idle queue
+    while api.pending or queue.scheduler.depth() or queue.scheduler.in_flight():
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    polling.cancel()
+    await queue.stop()
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+    handled = queue.processed + queue.failed
+    print(f"replayed {len(updates)} updates ({handled} dispatches, {queue.failed} failed) in {elapsed:.2f}s -> {len(updates) / elapsed:.1f} updates/s")
+    for name, values in sorted(replay.latency.items()):
+        print(
+            f"  {name}: n={len(values)} p50={statistics.median(values) * 1000:.1f} ms "
+            f"p99={percentile(values, 0.99) * 1000:.1f} ms"
+        )
+    print(f"api calls/update: {api.api_calls() / len(updates):.2f}")
+    if args.profile:
+        print(f"profile written to {args.profile} (python -m pstats {args.profile})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording", help="gzip JSONL written via UPDATE_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier, 0 for as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="Cap on idle time between recorded updates, in seconds")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="Seconds per fake Bot API call")
+    parser.add_argument("--api-jitter", type=float, default=0.01)
+    parser.add_argument("--telegram-limits", action="store_true", help="Keep the outbound rate limiter at Telegram's limits")
+    parser.add_argument("--profile", help="Write cProfile stats for the replay to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -1,5 +1,6 @@
 import asyncio
 import pytest
+import pytest_asyncio
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.pool import NullPool
@@ -29,7 +30,7 @@ def event_loop():
     yield loop
     loop.close()
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def client() -> AsyncGenerator[AsyncClient, None]:
     """Async client for FastAPI app."""
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
@@ -0,0 +1,52 @@
+import uuid
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from app.bot.handlers import agent as agent_handlers
+from app.services.conversation_service import ConversationService
+from app.services.message_link_service import MessageLinkService
+from app.services.user_service import UserService
+
+def agent_reply() -> MagicMock:
+    message = MagicMock()
+    message.message_thread_id = None # Replying in General, to a relayed message
+    message.reply = AsyncMock()
+    return message
+
+@pytest.fixture
+def resolved(monkeypatch):
+    """A reply that resolves through message_links to the returned conversation."""
+    conv = SimpleNamespace(id=uuid.uuid4(), status="open", locked_by_agent=None, locked_until=None)
+    monkeypatch.setattr(MessageLinkService, "resolve", AsyncMock(return_value=SimpleNamespace(conversation_id=conv.id)))
+    monkeypatch.setattr(UserService, "get_or_create", AsyncMock(return_value=SimpleNamespace(id=uuid.uuid4())))
+    monkeypatch.setattr(ConversationService, "get_by_id", AsyncMock(return_value=conv))
+    return conv
+
+@pytest.mark.asyncio
+async def test_reply_to_a_closed_conversation_says_it_is_closed(monkeypatch, resolved, mock_session):
+    resolved.status = "closed"
+    lock = AsyncMock()
+    monkeypatch.setattr(ConversationService, "lock_conversation", lock)
+    message = agent_reply()
+
+    await agent_handlers.handle_agent_reply(message, mock_session, MagicMock())
+    message.reply.assert_awaited_once_with("❌ Conversation is closed.")
+    lock.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_reply_to_a_conversation_closed_meanwhile_says_it_is_closed(monkeypatch, resolved, mock_session):
+    closed = SimpleNamespace(**{**vars(resolved), "status": "closed"})
+    monkeypatch.setattr(ConversationService, "get_by_id", AsyncMock(side_effect=[resolved, closed]))
+    monkeypatch.setattr(ConversationService, "lock_conversation", AsyncMock(return_value=False))
+    message = agent_reply()
+
+    await agent_handlers.handle_agent_reply(message, mock_session, MagicMock())
+    message.reply.assert_awaited_once_with("❌ Conversation is closed.")
+
+@pytest.mark.asyncio
+async def test_reply_to_a_conversation_locked_by_another_agent(monkeypatch, resolved, mock_session):
+    monkeypatch.setattr(ConversationService, "lock_conversation", AsyncMock(return_value=False))
+    message = agent_reply()
+
+    await agent_handlers.handle_agent_reply(message, mock_session, MagicMock())
+    message.reply.assert_awaited_once_with("🔒 Locked by another agent.")
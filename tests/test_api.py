@@ -1,8 +1,73 @@
+import uuid
+from datetime import datetime
 import pytest
+from unittest.mock import AsyncMock, MagicMock
 from httpx import AsyncClient
+from app.core.config import settings
+from app.db.session import get_db
+from app.main import app
+from app.services.analytics_service import AnalyticsService
+from app.services.conversation_service import ConversationService
 
 @pytest.mark.asyncio
 async def test_health_check(client: AsyncClient):
     response = await client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+@pytest.mark.asyncio
+async def test_metrics_exposition(client: AsyncClient):
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE bot_handler_duration_seconds histogram" in response.text
+    assert "update_queue_depth 0" in response.text
+
+@pytest.mark.asyncio
+async def test_audit_trail_requires_the_admin_token(client: AsyncClient, monkeypatch):
+    url = f"/conversations/{uuid.uuid4()}/events"
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+    assert (await client.get(url)).status_code == 403 # Off until a token is configured
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    assert (await client.get(url)).status_code == 401
+    assert (await client.get(url, headers={"Authorization": "Bearer wrong"})).status_code == 401
+
+    monkeypatch.setattr(ConversationService, "get_timeline", AsyncMock(return_value=[]))
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    try:
+        response = await client.get(url, headers={"Authorization": "Bearer s3cret"})
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert response.json() == []
+
+    # Next page from an offset-qualified cursor
+    before_id = uuid.uuid4()
+    get_timeline = AsyncMock(return_value=[])
+    monkeypatch.setattr(ConversationService, "get_timeline", get_timeline)
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    try:
+        response = await client.get(
+            url, params={"before": "2026-01-01T03:00:00+03:00", "before_id": str(before_id)},
+            headers={"Authorization": "Bearer s3cret"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert get_timeline.await_args.kwargs["before"] == (datetime(2026, 1, 1), before_id)
+
+@pytest.mark.asyncio
+async def test_sla_window_accepts_offsets(client: AsyncClient, monkeypatch):
+    sla = AsyncMock(return_value={})
+    monkeypatch.setattr(AnalyticsService, "sla", sla)
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    try:
+        response = await client.get("/analytics/sla", params={"since": "2026-01-01T02:00:00+02:00", "until": "2026-01-02T00:00:00Z"})
+        assert response.status_code == 200
+        assert sla.await_args.args == (datetime(2026, 1, 1), datetime(2026, 1, 2))
+
+        response = await client.get("/analytics/sla", params={"since": "2026-01-01T00:00:00+00:00"}) # Until now
+        assert response.status_code == 200
+        assert sla.await_args.args[0] == datetime(2026, 1, 1)
+    finally:
+        app.dependency_overrides.clear()
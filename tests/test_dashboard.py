@@ -0,0 +1,29 @@
+import asyncio
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.bot.dashboard import QueueDashboard
+from app.services.conversation_service import OpenQueueIndex
+
+@pytest.mark.asyncio
+async def test_dashboard_debounces_bursts_into_one_edit():
+    index = OpenQueueIndex()
+    dashboard = QueueDashboard(index, chat_id=-100, min_interval=0.2)
+    bot = MagicMock()
+    bot.send_message = AsyncMock(return_value=MagicMock(message_id=7))
+    bot.pin_chat_message = AsyncMock()
+    bot.edit_message_text = AsyncMock()
+    dashboard._bot = bot
+    dashboard._task = asyncio.create_task(dashboard._run())
+
+    index.opened(uuid.uuid4()) # First change publishes right away
+    await asyncio.sleep(0.05)
+    for _ in range(50):
+        index.opened(uuid.uuid4())
+    await asyncio.sleep(0.3)
+    await dashboard.stop()
+
+    bot.send_message.assert_awaited_once()
+    bot.pin_chat_message.assert_awaited_once()
+    bot.edit_message_text.assert_awaited_once() # 50 events, one edit
+    assert "<b>51</b>" in bot.edit_message_text.call_args.kwargs["text"]
@@ -0,0 +1,178 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from aiogram.types import Update
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.bot.ingest import UpdateQueue
+from app.bot.middlewares import DbSessionMiddleware
+from app.bot.scheduler import ChatScheduler
+from app.bot.workers import WorkerPool, create_worker_app
+from app.core.metrics import handler_duration, registry
+
+def make_update(update_id: int, chat_id: int, thread_id: int | None = None, media_group_id: str | None = None) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": 0,
+        "chat": {"id": chat_id, "type": "supergroup" if thread_id else "private"},
+        "text": "hi",
+    }
+    if media_group_id:
+        message["media_group_id"] = media_group_id
+    if thread_id:
+        message["message_thread_id"] = thread_id
+        message["is_topic_message"] = True
+    return Update.model_validate({"update_id": update_id, "message": message})
+
+class FakeDispatcher:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.seen = []
+
+    async def feed_update(self, bot, update):
+        await asyncio.sleep(self.delay)
+        self.seen.append(update.update_id)
+
+@pytest.mark.asyncio
+async def test_update_queue_processes_and_drains():
+    dp = FakeDispatcher()
+    queue = UpdateQueue(MagicMock(), dp, maxsize=10, shards=2, shard_concurrency=2)
+    queue.start()
+
+    for i in range(5):
+        assert queue.put_nowait(Update(update_id=i))
+
+    await queue.stop(timeout=1)
+
+    # Updates without a chat share one ordering key, so they run in order
+    assert dp.seen == [0, 1, 2, 3, 4]
+    stats = queue.stats()
+    assert stats["processed"] == 5
+    assert stats["depth"] == 0
+
+@pytest.mark.asyncio
+async def test_update_queue_rejects_when_full():
+    # Not started, so nothing drains
+    queue = UpdateQueue(MagicMock(), FakeDispatcher(), maxsize=2, shards=1)
+
+    assert queue.put_nowait(Update(update_id=1))
+    assert queue.put_nowait(Update(update_id=2))
+    assert not queue.put_nowait(Update(update_id=3))
+
+    stats = queue.stats()
+    assert stats["rejected"] == 1
+    assert stats["high_watermark"] == 2
+
+@pytest.mark.asyncio
+async def test_scheduler_orders_per_chat_and_parallelises_across_chats():
+    running = set()
+    overlap = []
+    seen = {}
+
+    async def handler(update):
+        key = update.message.chat.id, update.message.message_thread_id
+        if running:
+            overlap.append(key)
+        running.add(key)
+        await asyncio.sleep(0.01)
+        running.discard(key)
+        seen.setdefault(key, []).append(update.update_id)
+
+    scheduler = ChatScheduler(handler, shards=2, shard_concurrency=4, max_pending_per_shard=100)
+    scheduler.start()
+
+    for i in range(5):
+        scheduler.submit_nowait(make_update(100 + i, chat_id=1))
+        scheduler.submit_nowait(make_update(200 + i, chat_id=2))
+        scheduler.submit_nowait(make_update(300 + i, chat_id=-100, thread_id=7))
+
+    await scheduler.drain(timeout=2)
+    await scheduler.stop()
+
+    assert seen[(1, None)] == [100, 101, 102, 103, 104]
+    assert seen[(2, None)] == [200, 201, 202, 203, 204]
+    assert seen[(-100, 7)] == [300, 301, 302, 303, 304]
+    # Different chats ran concurrently
+    assert overlap
+
+@pytest.mark.asyncio
+async def test_scheduler_merges_album_parts_into_one_call():
+    calls = []
+
+    async def handler(update, album=None):
+        calls.append((update.update_id, [m.message_id for m in album] if album else None))
+
+    scheduler = ChatScheduler(handler, shards=1, shard_concurrency=1, album_window=0.02)
+    scheduler.start()
+
+    scheduler.submit_nowait(make_update(1, chat_id=5))
+    for i in range(2, 5):
+        scheduler.submit_nowait(make_update(i, chat_id=5, media_group_id="album-1"))
+        await asyncio.sleep(0.005)
+    scheduler.submit_nowait(make_update(5, chat_id=5))
+
+    await scheduler.drain(timeout=2)
+    await scheduler.stop()
+
+    assert calls == [(1, None), (2, [2, 3, 4]), (5, None)]
+
+@pytest.mark.asyncio
+async def test_db_session_middleware_opens_session_lazily():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    factory = MagicMock(wraps=async_sessionmaker(engine))
+    middleware = DbSessionMiddleware(factory)
+
+    async def no_db(event, data):
+        return "ok"
+
+    async def session_only(event, data):
+        await data["session"].commit() # Nothing to commit: no connection checked out
+
+    async def uses_db(event, data):
+        await data["session"].execute(text("SELECT 1"))
+        await data["session"].commit()
+
+    try:
+        assert await middleware(no_db, MagicMock(), {}) == "ok"
+        factory.assert_not_called()
+
+        await middleware(session_only, MagicMock(), {})
+        await middleware(uses_db, MagicMock(), {})
+        assert factory.call_count == 2
+    finally:
+        await engine.dispose()
+    assert middleware.stats() == {"updates": 3, "updates_with_session": 2, "updates_with_db": 1, "db_ratio": 0.3333}
+
+def test_worker_pool_routes_by_chat_and_rejects_when_full():
+    pool = WorkerPool(workers=2, maxsize=4) # Processes not started: only the IPC side
+    updates = [make_update(1, 100), make_update(2, 101), make_update(3, 100), make_update(4, -201, thread_id=7)]
+    for update in updates:
+        assert pool.put_nowait(update)
+
+    received = [[Update.model_validate_json(q.get(timeout=1)) for _ in range(2)] for q in pool._queues]
+    assert [u.update_id for u in received[0]] == [1, 3] # Same chat, same worker, in order
+    assert [u.update_id for u in received[1]] == [2, 4]
+    assert received[1][1].message.message_thread_id == 7
+
+    assert pool.put_nowait(make_update(5, 100))
+    assert pool.put_nowait(make_update(6, 100))
+    assert not pool.put_nowait(make_update(7, 100))
+    assert pool.stats()["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_worker_app_serves_the_workers_own_metrics(monkeypatch):
+    monkeypatch.setattr(registry, "_metrics", dict(registry._metrics)) # Keep the worker gauges out of the API registry
+    update_queue = MagicMock()
+    update_queue.depth.return_value = 3
+    update_queue.scheduler.in_flight.return_value = 1
+    update_queue.stats.return_value = {"depth": 3}
+    handler_duration.observe(0.01, "handle_customer_message")
+
+    app = create_worker_app(update_queue)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://worker") as client:
+        metrics = (await client.get("/metrics")).text
+        assert 'bot_handler_duration_seconds_count{handler="handle_customer_message"}' in metrics
+        assert "update_queue_depth 3" in metrics
+        assert (await client.get("/ingest/stats")).json() == {"depth": 3}
+        assert "listener" in (await client.get("/cache/stats")).json()["conversations"]
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.bot.leader import PollingLeader
+
+def fake_engine(heartbeats_ok: int):
+    """Engine whose connection grants the lock, then answers `heartbeats_ok` pings before failing."""
+    calls = {"pings": 0}
+
+    async def execute(statement, params=None):
+        if "SELECT 1" in str(statement):
+            calls["pings"] += 1
+        if calls["pings"] > heartbeats_ok:
+            raise ConnectionError("connection lost")
+        result = MagicMock()
+        result.scalar.return_value = True
+        return result
+
+    conn = MagicMock()
+    conn.execute = AsyncMock(side_effect=execute)
+    conn.execution_options = AsyncMock(return_value=conn)
+    conn.close = AsyncMock()
+    conn.invalidate = AsyncMock()
+    engine = MagicMock()
+    engine.connect = AsyncMock(return_value=conn)
+    engine.dispose = AsyncMock()
+    return engine, conn
+
+@pytest.mark.asyncio
+async def test_failed_heartbeat_cancels_leader_work():
+    engine, conn = fake_engine(heartbeats_ok=2)
+    leader = PollingLeader(engine, key=1, heartbeat_interval=0.01, retry_interval=10)
+    cancelled = asyncio.Event()
+
+    async def lead():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    leader.start(lead)
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+
+    assert leader.stats() == {"is_leader": False, "elections": 1, "lost": 1}
+    conn.invalidate.assert_awaited() # Unlock failed on the dead connection, so it is dropped
+    await leader.stop()
+    engine.dispose.assert_awaited_once()
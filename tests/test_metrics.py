@@ -0,0 +1,18 @@
+from app.core.metrics import MetricsRegistry
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("handler_seconds", "Handler latency", ("handler",), buckets=(0.01, 0.1))
+    errors = registry.counter("errors_total", "Errors", ("method", "error"))
+
+    latency.observe(0.005, "cmd_start")
+    latency.observe(0.05, "cmd_start")
+    latency.observe(1.0, "cmd_start")
+    errors.inc("sendMessage", "TelegramBadRequest")
+
+    text = registry.render()
+    assert 'handler_seconds_bucket{handler="cmd_start",le="0.01"} 1' in text
+    assert 'handler_seconds_bucket{handler="cmd_start",le="0.1"} 2' in text
+    assert 'handler_seconds_bucket{handler="cmd_start",le="+Inf"} 3' in text
+    assert 'handler_seconds_count{handler="cmd_start"} 3' in text
+    assert 'errors_total{method="sendMessage",error="TelegramBadRequest"} 1' in text
@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+from datetime import datetime
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from aiogram.types import Chat, Message, User as TgUser
+from sqlalchemy.dialects import postgresql
+from app.bot.handlers import customer
+from app.bot.outbox import OutboxSender
+from app.core.config import settings
+from app.services.conversation_service import ConversationService
+from app.services.message_link_service import MessageLinkService
+from app.services.outbox_service import OutboxService
+
+def row(id: int, attempts: int = 1, kind: str = "test"):
+    return SimpleNamespace(id=id, kind=kind, conversation_id=uuid.uuid4(), payload={"n": id}, attempts=attempts)
+
+@pytest.mark.asyncio
+async def test_drain_records_outcomes_in_one_batch(monkeypatch):
+    claim = AsyncMock(return_value=[row(1), row(2), row(3, attempts=3)])
+    complete = AsyncMock()
+    monkeypatch.setattr(OutboxService, "claim", claim)
+    monkeypatch.setattr(OutboxService, "complete", complete)
+
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=MagicMock())
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    sender = OutboxSender(session_factory, max_attempts=3)
+    delivered = []
+
+    @sender.handler("test")
+    async def deliver(payload, conversation_id, session, bot):
+        if payload["n"] != 1:
+            raise RuntimeError("Bad Gateway")
+        delivered.append(payload["n"])
+
+    assert await sender.drain_once() == 3
+    assert delivered == [1]
+
+    results = {r["id"]: r for r in complete.await_args.args[0]}
+    assert results[1]["status"] == "sent" and results[1]["sent_at"]
+    assert results[3]["attempts"] == 3 # The claim the outcome belongs to
+    assert results[2]["status"] == "pending" and results[2]["next_attempt_at"] > results[1]["sent_at"]
+    assert results[3]["status"] == "failed" # Out of attempts
+    assert "Bad Gateway" in results[3]["last_error"]
+    assert sender.stats() == {"running": False, "rounds": 1, "sent": 1, "retried": 1, "failed": 1}
+
+@pytest.mark.asyncio
+async def test_slow_round_renews_leases_of_rows_in_flight(monkeypatch):
+    monkeypatch.setattr(OutboxService, "claim", AsyncMock(return_value=[row(1, attempts=2), row(2)]))
+    monkeypatch.setattr(OutboxService, "complete", AsyncMock())
+    renew = AsyncMock()
+    monkeypatch.setattr(OutboxService, "renew", renew)
+
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=MagicMock())
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    sender = OutboxSender(session_factory, lease=0.06)
+
+    @sender.handler("test")
+    async def deliver(payload, conversation_id, session, bot):
+        await asyncio.sleep(0.01 if payload["n"] == 2 else 0.1) # Row 1 outlasts its lease
+
+    await sender.drain_once()
+    renewed = [call.args[0] for call in renew.await_args_list]
+    assert renewed and all(claims == [(1, 2)] for claims in renewed) # Only the claim still in flight
+
+@pytest.mark.asyncio
+async def test_outcome_only_applies_while_the_claim_is_held(mock_session):
+    mock_session.execute = AsyncMock()
+    await OutboxService(mock_session).complete([
+        {"id": 7, "attempts": 2, "status": "sent", "next_attempt_at": None, "last_error": None, "sent_at": None},
+    ])
+    stmt, params = mock_session.execute.await_args.args
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "outbox.attempts = %(claim_attempts)s" in sql
+    assert "outbox.status = " in sql
+    assert params == [{"claim_id": 7, "claim_attempts": 2, "status": "sent", "next_attempt_at": None, "last_error": None, "sent_at": None}]
+
+def customer_message_payload() -> dict:
+    message = Message(
+        message_id=10,
+        date=datetime(2026, 1, 1),
+        chat=Chat(id=555, type="private"),
+        from_user=TgUser(id=555, is_bot=False, first_name="Ann"),
+        text="hello",
+    )
+    return {"messages": [message.model_dump(mode="json", exclude_none=True, by_alias=True)], "album": False, "message_type": "text", "content": "hello"}
+
+@pytest.mark.asyncio
+async def test_deliver_customer_message_relays_and_links_copies(monkeypatch, mock_session):
+    conversation = SimpleNamespace(id=uuid.uuid4(), customer=SimpleNamespace(id=uuid.uuid4()))
+    monkeypatch.setattr(ConversationService, "get_by_id", AsyncMock(return_value=conversation))
+    process = AsyncMock(return_value=[90])
+    monkeypatch.setattr(customer, "process_conversation_message", process)
+    link_copies = AsyncMock()
+    monkeypatch.setattr(MessageLinkService, "link_copies", link_copies)
+    mock_session.commit = AsyncMock()
+    bot = MagicMock()
+
+    await customer.deliver_customer_message(customer_message_payload(), conversation.id, mock_session, bot)
+
+    relayed = process.await_args.args
+    assert relayed[0].message_id == 10 and relayed[0].text == "hello"
+    assert relayed[1] is conversation and relayed[2] is conversation.customer
+    assert relayed[7] is None # Not an album
+    assert link_copies.await_args.args == (conversation.id, 555, [10], settings.AGENT_GROUP_ID, [90])
+
+@pytest.mark.asyncio
+async def test_deliver_customer_message_raises_for_a_retry_when_nothing_was_delivered(monkeypatch, mock_session):
+    conversation = SimpleNamespace(id=uuid.uuid4(), customer=SimpleNamespace(id=uuid.uuid4()))
+    monkeypatch.setattr(ConversationService, "get_by_id", AsyncMock(return_value=conversation))
+    monkeypatch.setattr(customer, "process_conversation_message", AsyncMock(return_value=None))
+    link_copies = AsyncMock()
+    monkeypatch.setattr(MessageLinkService, "link_copies", link_copies)
+    mock_session.commit = AsyncMock()
+
+    with pytest.raises(RuntimeError):
+        await customer.deliver_customer_message(customer_message_payload(), conversation.id, mock_session, MagicMock())
+    link_copies.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_deliver_customer_message_skips_a_deleted_conversation(monkeypatch, mock_session):
+    monkeypatch.setattr(ConversationService, "get_by_id", AsyncMock(return_value=None))
+    process = AsyncMock()
+    monkeypatch.setattr(customer, "process_conversation_message", process)
+
+    await customer.deliver_customer_message(customer_message_payload(), uuid.uuid4(), mock_session, MagicMock())
+    process.assert_not_awaited()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+from app.bot.ratelimit import OutboundRateLimiter, Priority, TokenBucket, send_priority
+
+@pytest.mark.asyncio
+async def test_token_bucket_serves_higher_priority_first():
+    bucket = TokenBucket(rate=100, capacity=1)
+    await bucket.acquire() # Drain the burst so everyone below has to wait
+    order = []
+
+    async def take(name, priority):
+        await bucket.acquire(priority)
+        order.append(name)
+
+    await asyncio.gather(
+        take("notice", Priority.LOW),
+        take("forward", Priority.NORMAL),
+        take("reply", Priority.HIGH),
+    )
+
+    assert order == ["reply", "forward", "notice"]
+
+@pytest.mark.asyncio
+async def test_rate_limiter_retries_after_retry_after():
+    limiter = OutboundRateLimiter(global_rate=1000, private_rate=1000)
+    method = SendMessage(chat_id=42, text="hi")
+    calls = 0
+
+    async def make_request(bot, method):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=0)
+        return "ok"
+
+    with send_priority(Priority.HIGH):
+        assert await limiter(make_request, MagicMock(), method) == "ok"
+
+    assert calls == 2
+    assert limiter.stats()["retry_after"] == 1
+
+def test_paused_chat_bucket_outlives_the_idle_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    limiter = OutboundRateLimiter()
+    bucket = limiter._chat_bucket(-100)
+    bucket.pause(600) # Groups get multi-minute RetryAfter
+    limiter._keep(-100, bucket)
+
+    now[0] += 300 # Past the idle TTL, still paused
+    assert limiter._chat_bucket(-100) is bucket
+    now[0] += 600 # Pause over and idle for longer than the TTL since
+    assert limiter._chat_bucket(-100) is not bucket
+
+@pytest.mark.asyncio
+async def test_rate_limiter_skips_methods_without_chat():
+    limiter = OutboundRateLimiter()
+
+    async def make_request(bot, method):
+        return "me"
+
+    assert await limiter(make_request, MagicMock(), GetMe()) == "me"
+    assert limiter.stats()["requests"] == 0
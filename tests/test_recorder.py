@@ -0,0 +1,63 @@
+import pytest
+from aiogram.types import Update
+from app.bot.recorder import Anonymiser, UpdateRecorder, read_recording
+
+def make_update(update_id: int, user_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private", "first_name": "Jane", "username": "jane_doe"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Jane", "last_name": "Doe", "username": "jane_doe"},
+            "text": text,
+        },
+    })
+
+def test_anonymiser_is_deterministic_and_keeps_shape():
+    anonymiser = Anonymiser("secret")
+    assert anonymiser.id(42) == anonymiser.id(42) != 42
+    assert anonymiser.id(-100123) < 0
+    assert Anonymiser("other").id(42) != anonymiser.id(42)
+    assert anonymiser.text("/lock 1234 now") == "/lock xxxx xxx"
+    assert anonymiser.text("my card is 4111") == "xx xxxx xx xxxx"
+
+@pytest.mark.asyncio
+async def test_recorder_writes_anonymised_gzip_jsonl(tmp_path):
+    path = tmp_path / "updates.jsonl.gz"
+    recorder = UpdateRecorder(str(path), key="secret")
+    recorder.start()
+    recorder.record(make_update(1, 555, "hello there"))
+    await recorder.stop()
+
+    header, entry = list(read_recording(str(path)))
+    assert header["header"]["version"] == 1
+    message = entry["update"]["message"]
+    assert "update_id" not in entry["update"]
+    assert message["from"]["id"] == message["chat"]["id"] == recorder.anonymiser.id(555)
+    assert message["from"]["first_name"] == "User"
+    assert message["from"]["username"] != "jane_doe"
+    assert message["text"] == "xxxxx xxxxx"
+    # Still a valid update once an id is assigned again
+    Update.model_validate({"update_id": 1, **entry["update"]})
+
+def test_anonymiser_masks_contacts_venues_forwards_and_polls():
+    anonymiser = Anonymiser("secret")
+    data = anonymiser.update({
+        "contact": {"phone_number": "+15551234", "first_name": "Bob", "user_id": 777, "vcard": "BEGIN:VCARD\nTEL:+15551234\nEND:VCARD"},
+        "venue": {"location": {"latitude": 52.5, "longitude": 13.4}, "title": "Home", "address": "1 Main St", "google_place_id": "ChIJ123"},
+        "forward_origin": {"type": "hidden_user", "date": 0, "sender_user_name": "Bob Smith"},
+        "author_signature": "Bob",
+        "poll": {"id": "1", "question": "Where do I live?", "options": [{"text": "Main St", "voter_count": 0}]},
+    })
+    assert data["contact"]["user_id"] == anonymiser.id(777)
+    assert "+1555" not in data["contact"]["vcard"]
+    assert data["venue"]["address"] == "Address" and data["venue"]["google_place_id"] != "ChIJ123"
+    assert data["forward_origin"]["sender_user_name"] == "User"
+    assert data["author_signature"] == "Anon"
+    assert data["poll"]["question"] == "xxxxx xx x xxxxx"
+    assert data["poll"]["options"][0]["text"] == "xxxx xx"
+
+def test_recording_refuses_the_default_secret_key(tmp_path):
+    with pytest.raises(ValueError):
+        UpdateRecorder(str(tmp_path / "updates.jsonl.gz"), key="unsafe_secret")
@@ -1,14 +1,27 @@
+import uuid
+from datetime import datetime, timedelta
 import pytest
 from unittest.mock import AsyncMock, MagicMock
-from app.services.user_service import UserService
-from app.models.user import User, UserRole
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.services.user_service import UserService, user_cache
+from app.services.cache_listener import ConversationCacheListener
+from app.services.conversation_service import CACHE_ORIGIN, ConversationCache, ConversationService, OpenQueueIndex
+from app.services.analytics_service import AnalyticsService
+from app.services.event_journal import EventJournal, event_journal
+from app.services.message_journal import MessageJournal
+from app.services.message_link_service import MessageLinkService, message_link_cache
+from app.services.outbox_service import OutboxService
+from app.models.conversation import Conversation, Message
+from app.models.user import User, UserType
 
 @pytest.mark.asyncio
 async def test_get_by_telegram_id_found(mock_session):
     # Setup
     service = UserService(mock_session)
-    mock_user = User(id="123", telegram_id=111, role=UserRole.CUSTOMER)
-    
+    mock_user = User(telegram_user_id=111, user_type=UserType.CUSTOMER.value)
+
     # Mock execute result
     mock_result = MagicMock()
     mock_result.scalar_one_or_none.return_value = mock_user
@@ -19,27 +32,400 @@ async def test_get_by_telegram_id_found(mock_session):
 
     # Assert
     assert user is not None
-    assert user.telegram_id == 111
+    assert user.telegram_user_id == 111
     mock_session.execute.assert_called_once()
 
 @pytest.mark.asyncio
-async def test_get_or_create_new_user(mock_session):
+async def test_get_or_create_upserts_in_one_statement(mock_session):
     # Setup
+    user_cache.clear()
     service = UserService(mock_session)
-    
-    # Mock "not found" first
+    upserted = User(telegram_user_id=222, username="newuser", user_type=UserType.AGENT.value)
+
     mock_result = MagicMock()
-    mock_result.scalar_one_or_none.return_value = None
+    mock_result.scalar_one.return_value = upserted
     mock_session.execute = AsyncMock(return_value=mock_result)
 
     # Act
-    user = await service.get_or_create(telegram_id=222, username="newuser")
+    user = await service.get_or_create(telegram_id=222, username="newuser", user_type=UserType.AGENT)
 
     # Assert
-    assert user.telegram_id == 222
-    assert user.username == "newuser"
-    assert user.role == UserRole.CUSTOMER
-    
-    # Verify add and commit were called
-    mock_session.add.assert_called_once()
+    assert user is upserted
+    mock_session.execute.assert_called_once()
+    mock_session.commit.assert_called_once()
+    mock_session.add.assert_not_called()
+
+    sql = str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (telegram_user_id) DO UPDATE" in sql
+    assert "INSERT INTO agents" in sql
+
+@pytest.mark.asyncio
+async def test_get_or_create_skips_db_for_unchanged_profile(mock_session):
+    # Setup
+    user_cache.clear()
+    service = UserService(mock_session)
+    upserted = User(id=uuid.uuid4(), telegram_user_id=333, username="repeat", user_type=UserType.CUSTOMER.value)
+
+    mock_result = MagicMock()
+    mock_result.scalar_one.return_value = upserted
+    mock_session.execute = AsyncMock(return_value=mock_result)
+
+    # Act
+    await service.get_or_create(telegram_id=333, username="repeat")
+    cached = await service.get_or_create(telegram_id=333, username="repeat")
+    await service.get_or_create(telegram_id=333, username="renamed")
+
+    # Assert: first and third call hit the DB, the repeat is served from cache
+    assert cached.id == upserted.id
+    assert mock_session.execute.call_count == 2
+    assert len(user_cache) == 1
+
+def test_conversation_cache_indexes_write_through():
+    cache = ConversationCache(maxsize=10, ttl=60)
+    conv = Conversation(id=uuid.uuid4(), customer_id=uuid.uuid4(), status="open", topic_id=None)
+    cache.put(conv)
+
+    assert cache.by_customer(conv.customer_id) is conv
+    assert cache.by_topic(10) is None
+
+    cache.update(conv.id, topic_id=10)
+    assert cache.by_topic(10) is conv
+
+    # Topic recreated: the old topic no longer resolves
+    cache.update(conv.id, topic_id=11)
+    assert cache.by_topic(10) is None
+    assert cache.by_topic(11) is conv
+
+    cache.discard(conv.id)
+    assert cache.by_customer(conv.customer_id) is None
+    assert cache.by_topic(11) is None
+
+@pytest.mark.asyncio
+async def test_message_journal_batches_rows_and_coalesces_last_message_at(mock_session):
+    mock_session.execute = AsyncMock()
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    journal = MessageJournal(session_factory, flush_interval=60, batch_size=100)
+    conversation_id = uuid.uuid4()
+    for i in range(3):
+        await journal.append(Message(conversation_id=conversation_id, sender_type="customer", content=str(i)))
+    await journal.append(Message(conversation_id=conversation_id, sender_type="agent", content="reply"))
+
+    await journal.flush()
+
+    # One multi-row insert, one update per conversation and one stats increment per sender type, one commit
+    insert_call, update_call, stats_call = mock_session.execute.call_args_list
+    assert len(insert_call.args[1]) == 4
+    assert len(update_call.args[1]) == 1
+    increments = {row["customer_messages"] + row["agent_messages"]: row for row in stats_call.args[1]}
+    assert increments[3]["customer_messages"] == 3 and increments[3]["first_agent_reply_at"] is None
+    assert increments[1]["agent_messages"] == 1 and increments[1]["first_agent_reply_at"] is not None
+    sql = str(stats_call.args[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (conversation_id) DO UPDATE" in sql
+    # Earliest wins regardless of which process' journal flushes first
+    assert "least(conversation_stats.first_customer_message_at, excluded.first_customer_message_at)" in sql
+    mock_session.commit.assert_called_once()
+    assert journal.stats()["flushed_rows"] == 4
+
+@pytest.mark.asyncio
+async def test_message_journal_drops_only_the_rows_the_database_rejects(mock_session):
+    bad_conversation, good_conversation = uuid.uuid4(), uuid.uuid4()
+
+    async def execute(stmt, rows=None):
+        if rows and any(row.get("conversation_id") == bad_conversation for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("violates foreign key constraint"))
+
+    mock_session.execute = AsyncMock(side_effect=execute)
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    journal = MessageJournal(session_factory, flush_interval=60, batch_size=100)
+    for conversation_id in (good_conversation, bad_conversation, good_conversation):
+        await journal.append(Message(conversation_id=conversation_id, sender_type="customer", content="hi"))
+    await journal.flush()
+
+    stats = journal.stats()
+    assert stats["flushed_rows"] == 2 # The other conversation's rows survive the bad one
+    assert stats["dropped_rows"] == 1
+    assert stats["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_message_journal_caps_rows_kept_through_an_outage(mock_session):
+    mock_session.execute = AsyncMock(side_effect=ConnectionRefusedError("database is down"))
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    journal = MessageJournal(session_factory, flush_interval=60, batch_size=100, max_buffer=5)
+    conversation_id = uuid.uuid4()
+    for i in range(8):
+        await journal.append(Message(conversation_id=conversation_id, sender_type="customer", content=str(i)))
+    await journal.flush()
+
+    assert [row["content"] for row in journal._buffer] == ["3", "4", "5", "6", "7"] # Oldest dropped first
+    assert journal.stats()["dropped_rows"] == 3
+
+@pytest.mark.asyncio
+async def test_event_journal_writes_one_multi_row_insert(mock_session):
+    mock_session.execute = AsyncMock()
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    journal = EventJournal(session_factory, flush_interval=60, max_buffer=3)
+    conversation_id = uuid.uuid4()
+    for event_type in ("locked", "unlocked", "closed", "reopened"):
+        journal.record(conversation_id, event_type)
+    mock_session.execute.assert_not_called() # Recording never touches the database
+
+    await journal.flush()
+    assert [row["event_type"] for row in mock_session.execute.call_args.args[1]] == ["locked", "unlocked", "closed"]
+    mock_session.commit.assert_called_once()
+    assert journal.stats()["dropped"] == 1 # Over max_buffer
+
+@pytest.mark.asyncio
+async def test_event_journal_keeps_other_conversations_events_on_an_integrity_error(mock_session):
+    deleted = uuid.uuid4()
+
+    async def execute(stmt, rows=None):
+        if any(row["conversation_id"] == deleted for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("violates foreign key constraint"))
+
+    mock_session.execute = AsyncMock(side_effect=execute)
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    journal = EventJournal(session_factory, flush_interval=60)
+    journal.record(uuid.uuid4(), "locked")
+    journal.record(deleted, "closed")
+    journal.record(uuid.uuid4(), "closed")
+    await journal.flush()
+
+    assert journal.stats()["dropped"] == 1
+    assert journal.flushed_rows == 2
+
+@pytest.mark.asyncio
+async def test_lock_renewal_is_not_audited(mock_session):
+    mock_result = MagicMock()
+    mock_result.first.return_value = MagicMock(locked_until=None)
+    mock_session.execute = AsyncMock(return_value=mock_result)
+    service = ConversationService(mock_session)
+    agent = User(id=uuid.uuid4(), telegram_user_id=444, user_type=UserType.AGENT.value)
+    event_journal._buffer.clear()
+
+    await service.lock_conversation(uuid.uuid4(), agent, event_type=None)
+    assert event_journal.stats()["pending"] == 0
+    await service.lock_conversation(uuid.uuid4(), agent, event_type="auto_locked")
+    assert event_journal._buffer[-1]["event_type"] == "auto_locked"
+    assert event_journal._buffer[-1]["event_by"] == agent.id
+    event_journal._buffer.clear()
+
+@pytest.mark.asyncio
+async def test_timeline_pages_by_created_at(mock_session):
+    mock_result = MagicMock()
+    mock_result.all.return_value = []
+    mock_session.execute = AsyncMock(return_value=mock_result)
+
+    await ConversationService(mock_session).get_timeline(uuid.uuid4(), limit=20, before=(datetime(2026, 1, 1), uuid.uuid4()))
+    sql = str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "(conversation_events.created_at, conversation_events.id) < (" in sql # Ties at a page boundary aren't skipped
+    assert "ORDER BY conversation_events.created_at DESC, conversation_events.id DESC" in sql
+
+@pytest.mark.asyncio
+async def test_list_open_page_uses_keyset_and_one_query(mock_session):
+    rows = [MagicMock(id=uuid.uuid4()) for _ in range(3)]
+    mock_result = MagicMock()
+    mock_result.all.return_value = list(reversed(rows)) # Backwards page comes newest first
+    mock_session.execute = AsyncMock(return_value=mock_result)
+    service = ConversationService(mock_session)
+
+    page = await service.list_open_page(before=(datetime(2026, 1, 1), uuid.uuid4()), limit=2)
+
+    # Extra row means there is an earlier page; rows come back oldest first
+    assert page.rows == [rows[1], rows[2]]
+    assert page.has_prev and page.has_next
+    mock_session.execute.assert_called_once()
+
+    sql = str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "(conversations.created_at, conversations.id) < (" in sql
+    assert "LEFT OUTER JOIN users" in sql
+    assert "LIMIT" in sql
+
+@pytest.mark.asyncio
+async def test_lock_conversation_is_one_conditional_update(mock_session):
+    mock_result = MagicMock()
+    mock_result.first.return_value = None # Held by someone else with a live lease
+    mock_session.execute = AsyncMock(return_value=mock_result)
+    service = ConversationService(mock_session)
+    agent = User(id=uuid.uuid4(), telegram_user_id=333, user_type=UserType.AGENT.value)
+
+    assert await service.lock_conversation(uuid.uuid4(), agent) is False
+    mock_session.execute.assert_called_once()
+
+    compiled = mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert sql.startswith("UPDATE conversations SET")
+    assert compiled.params["locked_until"] - compiled.params["locked_until_1"] == timedelta(seconds=settings.LOCK_LEASE_SECONDS)
+    # Lease written and checked on the Python clock, like lock_is_live
+    assert "now()" not in sql
+    assert "conversations.locked_until < %(locked_until_1)s" in sql
+    assert "RETURNING conversations.locked_until" in sql
+
+@pytest.mark.asyncio
+async def test_lock_and_unlock_notify_other_processes(mock_session):
+    mock_result = MagicMock()
+    mock_result.first.return_value = MagicMock(locked_until=None)
+    mock_session.execute = AsyncMock(return_value=mock_result)
+    service = ConversationService(mock_session)
+    agent = User(id=uuid.uuid4(), telegram_user_id=333, user_type=UserType.AGENT.value)
+    conversation_id = uuid.uuid4()
+
+    assert await service.lock_conversation(conversation_id, agent, event_type=None) is True
+    assert await service.unlock_conversation(conversation_id, agent) is True
+    notices = [mock_session.execute.call_args_list[i].args[0].compile(dialect=postgresql.dialect()) for i in (1, 3)]
+    for notice in notices:
+        assert "pg_notify" in str(notice)
+        assert f"changed {conversation_id}" in list(notice.params.values())[1]
+    event_journal._buffer.clear()
+
+@pytest.mark.asyncio
+async def test_close_idle_updates_a_batch_and_records_events(mock_session):
+    closed = [(uuid.uuid4(), 42, datetime(2026, 1, 1))]
+    mock_result = MagicMock()
+    mock_result.all.return_value = closed
+    mock_session.execute = AsyncMock(return_value=mock_result)
+    service = ConversationService(mock_session)
+
+    assert await service.close_idle(datetime(2026, 1, 2), limit=100) == [(closed[0][0], 42)]
+    update_sql = str(mock_session.execute.call_args_list[0].args[0].compile(dialect=postgresql.dialect()))
+    assert "conversations.last_message_at <" in update_sql
+    assert "FOR UPDATE SKIP LOCKED" in update_sql
+    events = mock_session.execute.call_args_list[1].args[1]
+    assert events[0]["event_type"] == "auto_closed"
+    assert events[0]["created_at"] # Python clock, like the event journal
+    assert mock_session.execute.call_args_list[2].args[1][0]["closed_at"] == datetime(2026, 1, 1)
+    mock_session.commit.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_sla_reads_percentiles_from_the_rollup(mock_session):
+    mock_result = MagicMock()
+    mock_result.one.return_value = MagicMock(conversations=0, first_response_p50=12.34, first_response_p90=None)
+    mock_session.execute = AsyncMock(return_value=mock_result)
+
+    sla = await AnalyticsService(mock_session).sla(datetime(2026, 1, 1), datetime(2026, 1, 2))
+    assert sla["first_response_seconds"]["p50"] == 12.3
+    assert sla["first_response_seconds"]["p90"] is None
+
+    window_sql, backlog_sql = (
+        str(call.args[0].compile(dialect=postgresql.dialect())) for call in mock_session.execute.call_args_list
+    )
+    assert "percentile_cont" in window_sql and "WITHIN GROUP" in window_sql
+    assert "FROM conversation_stats" in window_sql and "messages" not in window_sql
+    assert "conversation_stats.first_agent_reply_at IS NULL" in backlog_sql
+
+@pytest.mark.asyncio
+async def test_outbox_claims_the_head_of_each_conversation(mock_session):
+    mock_result = MagicMock()
+    mock_result.all.return_value = []
+    mock_session.execute = AsyncMock(return_value=mock_result)
+
+    assert await OutboxService(mock_session).claim(limit=50, lease=60) == []
+    sql = str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "NOT (EXISTS (SELECT" in sql # Earlier undelivered rows of the conversation block a row
+    assert "FOR UPDATE OF outbox SKIP LOCKED" in sql
+    assert "RETURNING outbox.id" in sql
+
+@pytest.mark.asyncio
+async def test_add_messages_with_outbox_skips_a_redelivered_update(mock_session):
+    mock_session.scalar = AsyncMock(return_value=None) # Idempotency key already taken
+    service = ConversationService(mock_session)
+    outbox = {"idempotency_key": "1:2", "conversation_id": uuid.uuid4(), "kind": "customer_message", "payload": {}}
+
+    assert await service.add_messages(outbox["conversation_id"], "customer", [{"content": "hi"}], outbox=outbox) == []
+    assert "ON CONFLICT (idempotency_key) DO NOTHING" in str(mock_session.scalar.call_args.args[0].compile(dialect=postgresql.dialect()))
+    mock_session.rollback.assert_called_once()
+    mock_session.add_all.assert_not_called()
+
+def test_open_queue_index_tracks_lifecycle_and_notifies():
+    index = OpenQueueIndex()
+    changes = []
+    index.subscribe(lambda: changes.append(1))
+    a, b = uuid.uuid4(), uuid.uuid4()
+
+    index.opened(a)
+    index.opened(b)
+    index.locked(a, "alice")
+    assert index.snapshot() == {"open": 2, "waiting": 1, "locked": 1, "by_agent": {"alice": 1}}
+
+    index.locked(b, "bob", locked_until=datetime(2000, 1, 1)) # Lease ran out: counts as waiting
+    assert index.snapshot()["waiting"] == 1
+    index.unlocked(b)
+
+    index.unlocked(a)
+    index.closed(b)
+    index.closed(b) # Already gone: no change
+    assert index.snapshot() == {"open": 1, "waiting": 1, "locked": 0, "by_agent": {}}
+    assert len(changes) == 7
+
+@pytest.mark.asyncio
+async def test_message_links_resolve_both_directions_from_cache(mock_session):
+    message_link_cache.clear()
+    mock_session.execute = AsyncMock()
+    service = MessageLinkService(mock_session)
+    conversation_id = uuid.uuid4()
+
+    # Album of two parts copied from the customer chat into the agent group
+    await service.link_copies(conversation_id, 555, [10, 11], -100, [70, 71])
+
+    rows = mock_session.execute.call_args.args[1]
+    assert len(rows) == 4
+    assert "ON CONFLICT DO NOTHING" in str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+
+    mock_session.execute.reset_mock()
+    to_group = await service.resolve(555, 11)
+    to_customer = await service.resolve(-100, 70)
+    assert (to_group.peer_chat_id, to_group.peer_message_id) == (-100, 71)
+    assert (to_customer.peer_chat_id, to_customer.peer_message_id) == (555, 10)
+    assert to_customer.conversation_id == conversation_id
+    mock_session.execute.assert_not_called()
+
+def test_cache_listener_drops_conversations_closed_elsewhere():
+    cache = ConversationCache()
+    queue = OpenQueueIndex()
+    listener = ConversationCacheListener(MagicMock(), cache, queue)
+    convs = [Conversation(id=uuid.uuid4(), customer_id=uuid.uuid4(), status="open") for _ in range(3)]
+    for conv in convs:
+        cache.put(conv)
+        queue.opened(conv.id)
+
+    listener.on_notice(f"{CACHE_ORIGIN} closed {convs[0].id}") # Our own notice: already current
+    assert cache.get(convs[0].id) is convs[0]
+
+    listener.on_notice(f"{uuid.uuid4().hex} closed {convs[0].id},{convs[1].id},not-an-id")
+    assert cache.by_customer(convs[0].customer_id) is None
+    assert cache.get(convs[1].id) is None
+    assert cache.get(convs[2].id) is convs[2]
+    assert listener.stats()["invalidated"] == 2
+    assert queue.snapshot()["open"] == 1
+
+    listener.on_notice(f"{uuid.uuid4().hex} changed {convs[2].id}") # Still open, just reloaded
+    assert cache.get(convs[2].id) is None
+    assert queue.snapshot()["open"] == 1
+
+@pytest.mark.asyncio
+async def test_close_notifies_other_processes_in_the_same_transaction(mock_session):
+    mock_result = MagicMock()
+    mock_result.first.return_value = MagicMock()
+    mock_session.execute = AsyncMock(return_value=mock_result)
+    conversation_id = uuid.uuid4()
+
+    assert await ConversationService(mock_session).close_conversation(conversation_id) is True
+    notify = mock_session.execute.call_args_list[-1].args[0]
+    compiled = notify.compile(dialect=postgresql.dialect())
+    assert "pg_notify" in str(compiled)
+    assert f"closed {conversation_id}" in list(compiled.params.values())[1]
     mock_session.commit.assert_called_once()
@@ -0,0 +1,81 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.dialects import postgresql
+from app.bot.sweeper import IdleSweeper
+from app.services.conversation_service import ConversationService
+
+def session_factory() -> MagicMock:
+    factory = MagicMock()
+    factory.return_value.__aenter__ = AsyncMock(return_value=MagicMock())
+    factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    return factory
+
+@pytest.mark.asyncio
+async def test_sweep_closes_in_batches(monkeypatch):
+    batches = [
+        [(uuid.uuid4(), 11), (uuid.uuid4(), None)],
+        [(uuid.uuid4(), 12), (uuid.uuid4(), 13)],
+        [(uuid.uuid4(), 14)], # Short batch: nothing idle left
+    ]
+    close_idle = AsyncMock(side_effect=batches)
+    monkeypatch.setattr(ConversationService, "close_idle", close_idle)
+
+    sweeper = IdleSweeper(session_factory(), chat_id=-100, idle_after=timedelta(hours=1), batch_size=2)
+    assert await sweeper.sweep() == 5
+    assert close_idle.await_count == 3
+    assert sweeper._topics_wakeup.is_set() # Topic closer picks up the new backlog
+
+@pytest.mark.asyncio
+async def test_pending_topics_close_at_the_topic_rate_and_survive_transient_errors(monkeypatch):
+    pending = [(uuid.uuid4(), topic_id) for topic_id in (11, 12, 13, 14)]
+    monkeypatch.setattr(ConversationService, "count_pending_topic_closes", AsyncMock(return_value=4))
+    claim = AsyncMock(return_value=pending)
+    monkeypatch.setattr(ConversationService, "claim_topic_closes", claim)
+    topic_closed = AsyncMock()
+    monkeypatch.setattr(ConversationService, "topic_closed", topic_closed)
+
+    sweeper = IdleSweeper(session_factory(), chat_id=-100, idle_after=timedelta(hours=1), topics_per_minute=600)
+    bot = MagicMock()
+    bot.close_forum_topic = AsyncMock(side_effect=[None, TelegramBadRequest(MagicMock(), "TOPIC_NOT_MODIFIED"), TimeoutError(), None])
+    sweeper._bot = bot
+    task = asyncio.create_task(sweeper.close_pending_topics())
+    await asyncio.sleep(0.05)
+    assert bot.close_forum_topic.await_count == 1 # One token in the bucket, then 10/s
+    assert await task == 4
+    assert claim.await_args.kwargs["lease"] >= 50 / 10 # Covers the whole batch at the topic rate
+
+    assert [c.kwargs["message_thread_id"] for c in bot.close_forum_topic.await_args_list] == [11, 12, 13, 14]
+    # The timed-out topic stays pending in the database until its claim expires
+    assert [c.args[0] for c in topic_closed.await_args_list] == [pending[0][0], pending[1][0], pending[3][0]]
+    assert sweeper.stats()["topics_closed"] == 2 and sweeper.stats()["topic_errors"] == 1
+    assert sweeper.stats()["topics_pending"] == 1
+
+@pytest.mark.asyncio
+async def test_topic_closes_are_claimed_oldest_first_skipping_locked_rows(mock_session):
+    older, newer = uuid.uuid4(), uuid.uuid4()
+    now = datetime.utcnow()
+    mock_result = MagicMock()
+    mock_result.all.return_value = [(newer, 12, now), (older, 11, now - timedelta(hours=1))]
+    mock_session.execute = AsyncMock(return_value=mock_result)
+
+    assert await ConversationService(mock_session).claim_topic_closes(50, lease=360) == [(older, 11), (newer, 12)]
+    sql = str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE conversations SET topic_close_claimed_until=(now() + ")
+    assert "ORDER BY conversations.last_message_at, conversations.id" in sql
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "conversations.topic_close_claimed_until < now()" in sql
+    mock_session.commit.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_close_idle_marks_topics_pending_in_the_same_update(mock_session):
+    mock_result = MagicMock()
+    mock_result.all.return_value = []
+    mock_session.execute = AsyncMock(return_value=mock_result)
+
+    await ConversationService(mock_session).close_idle(datetime(2026, 1, 2), limit=10)
+    sql = str(mock_session.execute.call_args_list[0].args[0].compile(dialect=postgresql.dialect()))
+    assert "topic_close_pending=(conversations.topic_id IS NOT NULL)" in sql
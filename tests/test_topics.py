@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import CopyMessage
+from app.bot.topics import SingleFlight, TopicReadiness, TopicStateCache, is_dead_topic_error
+
+def test_topic_cache_renames_only_on_name_change():
+    cache = TopicStateCache(maxsize=2, ttl=60)
+
+    # Unknown topics are synced once
+    assert cache.needs_rename(1, "Alice")
+    cache.mark_synced(1, "Alice")
+    assert not cache.needs_rename(1, "Alice")
+    assert cache.needs_rename(1, "Alice Smith")
+
+    cache.forget(1)
+    assert cache.needs_rename(1, "Alice")
+
+def test_topic_cache_evicts_least_recently_used():
+    cache = TopicStateCache(maxsize=2, ttl=60)
+    cache.mark_synced(1, "a")
+    cache.mark_synced(2, "b")
+    cache.get(1)
+    cache.mark_synced(3, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert len(cache) == 2
+
+def test_dead_topic_error_detection():
+    method = CopyMessage(chat_id=1, from_chat_id=2, message_id=3)
+    assert is_dead_topic_error(TelegramBadRequest(method, "Bad Request: message thread not found"))
+    assert not is_dead_topic_error(TelegramBadRequest(method, "Bad Request: message is too long"))
+    assert not is_dead_topic_error(TimeoutError("thread not found"))
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = 0
+
+    async def create():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    results = await asyncio.gather(*(flight.run("conv", create) for _ in range(5)))
+
+    assert results == [42] * 5
+    assert calls == 1
+    assert flight.coalesced == 4
+
+@pytest.mark.asyncio
+async def test_topic_readiness_retries_until_topic_accepts_messages():
+    readiness = TopicReadiness(initial_delay=0.001, max_delay=0.01, budget=1)
+    method = CopyMessage(chat_id=1, from_chat_id=2, message_id=3)
+    failures = [TelegramBadRequest(method, "Bad Request: message thread not found")] * 2
+
+    async def send():
+        if failures:
+            raise failures.pop()
+        return "sent"
+
+    assert await readiness.send(send) == "sent"
+    assert readiness.retries == 2
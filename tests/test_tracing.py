@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from app.core import tracing
+from app.core.tracing import span, trace_update, traced, to_otlp
+
+@traced("db")
+class FakeService:
+    async def outer(self):
+        await self.inner()
+
+    async def inner(self):
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_trace_breakdown_does_not_double_count_nested_service_calls(monkeypatch):
+    exported = []
+    monkeypatch.setattr(tracing, "span_exporter", type("Sink", (), {"export": lambda self, t: exported.append(t)})())
+
+    with trace_update(1):
+        await FakeService().outer()
+        with span("sendMessage", "api"):
+            await asyncio.sleep(0.01)
+
+    trace, = exported
+    names = [record.name for record in trace.spans]
+    assert names == ["update", "FakeService.outer", "FakeService.inner", "sendMessage"]
+
+    breakdown = trace.breakdown()
+    # Only the outer call counts, inner is nested in it
+    assert breakdown["db"] == round(trace.spans[1].duration_ns / 1e6, 2)
+    assert breakdown["api"] >= 10
+
+    otlp_spans = to_otlp([trace])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert otlp_spans[2]["parentSpanId"] == otlp_spans[1]["spanId"]
+    assert all(s["traceId"] == trace.trace_id for s in otlp_spans)
+
+@pytest.mark.asyncio
+async def test_spans_are_noops_outside_an_update():
+    await FakeService().outer()
+    with span("sendMessage", "api") as record:
+        assert record is None